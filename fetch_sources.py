@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+
+import argparse
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import time
+import urllib.parse
+
+import aiohttp
+
+from source_health import SourceHealth
+
+logging.basicConfig(filename="data/fetch_sources.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0.0.0 Safari/537.36"
+LINK_PATTERN = re.compile(r"(?:hysteria2|vmess|trojan|ss|ssr|vless)://[^\s<>\"'`]+", re.I)
+BASE64_PATTERN = re.compile(r"^[A-Za-z0-9+/=_\-\s]+$")
+
+# 服务端瞬时错误才重试，4xx 属于确定结果
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+def load_sources(path):
+    """读取来源列表，忽略注释、空行与非 http(s) 行，保持顺序去重"""
+    sources, seen = [], set()
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            url = line.strip()
+            if not url or url.startswith("#") or not re.match(r"^https?://", url, re.I):
+                continue
+            if url not in seen:
+                seen.add(url)
+                sources.append(url)
+    return sources
+
+def source_filename(url):
+    """与 prefilter_nodes.py 约定的单来源文件名"""
+    return hashlib.md5(url.encode("utf-8")).hexdigest()[:16] + ".txt"
+
+def decode_body(text):
+    """订阅内容整体为 base64 时先解码，否则原样返回"""
+    stripped = text.strip()
+    if not stripped or "://" in stripped[:64] or not BASE64_PATTERN.match(stripped[:4096]):
+        return text
+    try:
+        data = re.sub(r"\s+", "", stripped).replace("-", "+").replace("_", "/")
+        data += "=" * (-len(data) % 4)
+        decoded = base64.b64decode(data, validate=False).decode("utf-8", errors="ignore")
+    except (ValueError, binascii.Error):
+        return text
+    return decoded if "://" in decoded else text
+
+def extract_links(text):
+    links, seen = [], set()
+    for link in LINK_PATTERN.findall(decode_body(text)):
+        if link not in seen:
+            seen.add(link)
+            links.append(link)
+    return links
+
+def write_atomic(path, url, links):
+    tmpfile = f"{path}.tmp"
+    with open(tmpfile, "w", encoding="utf-8") as f:
+        f.write(f"# {url}\n")
+        for link in links:
+            f.write(link + "\n")
+    os.replace(tmpfile, path)
+
+async def fetch(session, semaphore, url, timeout, retries, max_size):
+    """下载单个来源，返回 (状态码, 正文, 错误, 尝试次数, 请求耗时)；仅在请求期间占用并发名额，退避等待时释放"""
+    status, error, elapsed = 0, None, 0.0
+    for attempt in range(1, retries + 2):
+        async with semaphore:
+            starttime = time.time()
+            try:
+                async with session.get(url, timeout=aiohttp.ClientTimeout(total=timeout), allow_redirects=True) as response:
+                    status = response.status
+                    if status == 200:
+                        # 超过上限的来源整体拒绝，避免保留截断在行中间的前缀
+                        if response.content_length is not None and response.content_length > max_size:
+                            logging.warning(f"{url} 内容长度 {response.content_length} 超过 {max_size} 字节，已跳过")
+                            return status, b"", "too_large", attempt, elapsed + time.time() - starttime
+
+                        chunks, size = [], 0
+                        async for chunk in response.content.iter_chunked(65536):
+                            size += len(chunk)
+                            if size > max_size:
+                                logging.warning(f"{url} 内容超过 {max_size} 字节，已跳过")
+                                return status, b"", "too_large", attempt, elapsed + time.time() - starttime
+                            chunks.append(chunk)
+                        return status, b"".join(chunks), None, attempt, elapsed + time.time() - starttime
+                    error = f"http_{status}"
+                    if status not in RETRYABLE_STATUS:
+                        return status, b"", error, attempt, elapsed + time.time() - starttime
+            except asyncio.TimeoutError:
+                error = "timeout"
+            except aiohttp.ClientError as e:
+                error = type(e).__name__
+            except Exception as e:
+                logging.error(f"拉取 {url} 异常: {e}")
+                return status, b"", "exception", attempt, elapsed + time.time() - starttime
+            elapsed += time.time() - starttime
+
+        if attempt <= retries:
+            await asyncio.sleep(min(2 ** (attempt - 1), 8))
+    return status, b"", error, retries + 1, elapsed
+
+async def process(session, semaphore, url, args):
+    status, body, error, attempts, elapsed = await fetch(session, semaphore, url, args.timeout, args.retries, args.max_size)
+    latency = round(elapsed, 3)
+
+    links = extract_links(body.decode("utf-8", errors="ignore")) if body else []
+    filename = source_filename(url)
+    if links:
+        write_atomic(os.path.join(args.output, filename), url, links)
+    elif not error:
+        error = "no_links"
+
+    entry = {
+        "url": url,
+        "host": urllib.parse.urlsplit(url).hostname or "",
+        "file": filename if links else "",
+        "status": status,
+        "bytes": len(body),
+        "links": len(links),
+        "latency": latency,
+        "attempts": attempts,
+        "error": error,
+    }
+    if error:
+        logging.warning(f"失败: {url} - {error} (状态码 {status}，尝试 {attempts} 次)")
+    else:
+        logging.info(f"成功从 {url} 获取 {len(links)} 个节点，{len(body)} 字节，耗时 {latency}s")
+    return entry
+
+async def run(sources, args):
+    # 全局连接上限与单主机上限分别控制，避免数百个来源集中在同一主机时被限流
+    connector = aiohttp.TCPConnector(limit=args.concurrency, limit_per_host=args.per_host, ttl_dns_cache=300)
+    headers = {"User-Agent": USER_AGENT, "Accept-Encoding": "gzip, deflate"}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    async with aiohttp.ClientSession(connector=connector, headers=headers, auto_decompress=True) as session:
+        tasks = [asyncio.create_task(process(session, semaphore, url, args)) for url in sources]
+        return [await task for task in tasks]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="并发拉取订阅来源，按来源原子写出节点文件并生成清单")
+    parser.add_argument("-s", "--sources", default="data/backup_sources.list", help="来源列表文件，每行一个 URL")
+    parser.add_argument("-o", "--output", default="data/temp/sources", help="单来源节点文件目录，首行为 '# url'")
+    parser.add_argument("-m", "--manifest", default="data/temp/sources_manifest.json", help="记录各来源状态、字节数、节点数与耗时的清单")
+    parser.add_argument("-a", "--all", default="", help="合并所有来源节点的文件，为空时不生成")
+    parser.add_argument("-f", "--failed", default="", help="记录失败来源 URL 的文件")
+    parser.add_argument("-n", "--concurrency", type=int, default=256, help="全局最大并发下载数")
+    parser.add_argument("-p", "--per-host", type=int, default=32, help="单个主机的最大并发连接数")
+    parser.add_argument("-t", "--timeout", type=float, default=30, help="单次下载超时时间 (秒)")
+    parser.add_argument("-r", "--retries", type=int, default=3, help="超时、连接错误与 5xx/429 的重试次数")
+    parser.add_argument("-M", "--max-size", type=int, default=64 * 1024 * 1024, help="单个来源最大下载字节数")
+    parser.add_argument("-H", "--health", default="", help="来源健康记录文件，连续失败的来源按指数退避跳过")
+    parser.add_argument("-b", "--backoff", type=float, default=3600, help="首次失败后的退避时间 (秒)，之后逐次翻倍")
+    parser.add_argument("-B", "--max-backoff", type=float, default=7 * 86400, help="最大退避时间 (秒)")
+    parser.add_argument("-F", "--force", action="store_true", help="忽略退避，拉取全部来源")
+    args = parser.parse_args()
+    args.concurrency = max(args.concurrency, 1)
+    args.per_host = max(args.per_host, 1)
+    args.retries = max(args.retries, 0)
+
+    sources = load_sources(args.sources)
+    os.makedirs(args.output, exist_ok=True)
+
+    # 按健康记录排程：退避中的来源本轮跳过，其余高产来源优先占用并发
+    health = SourceHealth(args.health, args.backoff, args.max_backoff)
+    health.prune(sources)
+    sources, skipped = health.schedule(sources, force=args.force)
+    if skipped:
+        logging.info(f"{len(skipped)} 个来源处于失败退避期，本轮跳过")
+
+    starttime = time.time()
+    entries = asyncio.run(run(sources, args)) if sources else []
+    cost = round(time.time() - starttime, 2)
+
+    for entry in entries:
+        record = health.record(
+            entry["url"],
+            success=not entry["error"],
+            latency=entry["latency"],
+            size=entry["bytes"],
+            links=entry["links"],
+            error=entry["error"],
+            now=starttime,
+        )
+        entry["failures"] = record["failures"]
+        if entry["error"] and record["failures"] > 1:
+            logging.info(f"{entry['url']} 已连续失败 {record['failures']} 次，下次拉取时间 {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(record['next_poll']))}")
+    health.save()
+
+    succeed = [x for x in entries if not x["error"]]
+    failed = [x for x in entries if x["error"]]
+    total_links = sum(x["links"] for x in succeed)
+
+    manifest = {
+        "time": int(starttime),
+        "cost": cost,
+        "total": len(entries),
+        "succeed": len(succeed),
+        "failed": len(failed),
+        "skipped": skipped,
+        "links": total_links,
+        "bytes": sum(x["bytes"] for x in entries),
+        "sources": entries,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.manifest)), exist_ok=True)
+    tmpfile = f"{args.manifest}.tmp"
+    with open(tmpfile, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmpfile, args.manifest)
+
+    if args.failed and failed:
+        with open(args.failed, "a", encoding="utf-8") as f:
+            for entry in failed:
+                f.write(entry["url"] + "\n")
+
+    if args.all:
+        # 单一写入者按来源顺序合并，不会出现多进程追加导致的行交错
+        tmpfile = f"{args.all}.tmp"
+        with open(tmpfile, "w", encoding="utf-8") as out:
+            for entry in succeed:
+                with open(os.path.join(args.output, entry["file"]), "r", encoding="utf-8") as f:
+                    next(f, None)
+                    for line in f:
+                        out.write(line)
+        os.replace(tmpfile, args.all)
+
+    sys.stdout.write(
+        f"  拉取 {len(entries)} 个来源: 成功 {len(succeed)}，失败 {len(failed)}，退避跳过 {len(skipped)}，共 {total_links} 个节点，耗时 {cost}s。\n"
+    )
@@ -7,6 +7,7 @@
 BACKUP_SOURCES_LIST="data/backup_sources.list"
 ALL_NODES_FILE="data/all.txt"
 PREVIOUS_NODES_FILE="data/previous_nodes.txt"
+SEEN_INDEX_DIR="data/seen_nodes"
 TEMP_SOURCES_LIST="data/temp_sources_list.txt"
 TEMP_ALL_RAW_NODES="data/temp_all_raw_nodes.txt"
 TEMP_NEW_RAW_NODES="data/temp_new_raw_nodes.txt"
@@ -17,17 +18,25 @@ CLASH_LOG="data/clash.log"
 ALL_PASSED_NODES_JSON="data/passed_nodes.json"
 FILTERED_NODES="data/filtered_nodes.txt"
 FAILED_SUB_URLS="data/failed_sub_urls.txt"
+SOURCE_HEALTH="data/source_health.json"
 TEMP_DIR="data/temp"
+SOURCES_DIR="$TEMP_DIR/sources"
+SOURCES_MANIFEST="$TEMP_DIR/sources_manifest.json"
 
 # --- 配置限制 ---
 MAX_NODES_PER_ROUND=10000
 BATCH_SIZE=200
 MAX_BATCH_FILES=10
-MAX_CONCURRENT_SUB=20  # 并行拉取子来源的最大并发数
+MAX_CONCURRENT_SUB=256  # 并行拉取子来源的最大并发数
+MAX_CONCURRENT_PER_HOST=32  # 单个主机的最大并发连接数
+SEEN_KEEP_DAYS=7  # 节点连续未出现超过该天数后从已见索引中淘汰
+PRESCREEN_CONCURRENCY=20000  # TCP 预筛同时进行的最大连接数
+PRESCREEN_TIMEOUT=3  # TCP 预筛单个连接的超时秒数
 
 # 初始化并清理临时文件
 mkdir -p data clash "$TEMP_DIR"
-rm -rf "$TEMP_DIR"/temp_*.txt "$TEMP_DIR"/batch_*.json "$TEMP_DIR"/batch_all_*.txt "$TEMP_DIR"/clash_config_batch_*.yaml
+rm -rf "$SOURCES_DIR" "$SOURCES_MANIFEST" "$TEMP_ALL_RAW_NODES" && mkdir -p "$SOURCES_DIR"
+rm -rf "$TEMP_DIR"/temp_*.txt "$TEMP_DIR"/batch_*.json "$TEMP_DIR"/batch_all_*.jsonl "$TEMP_DIR"/clash_config_batch_*.yaml
 touch "$ALL_NODES_FILE" "$ALL_PASSED_NODES_JSON" "$FAILED_SUB_URLS"
 echo "开始节点测试: $(date)" > "$CLASH_LOG"
 
@@ -49,17 +58,11 @@ echo "  找到 $SUB_URL_COUNT 个子来源 URL。" | tee -a "$CLASH_LOG"
 
 # 步骤 2: 并行拉取节点 URL
 echo "步骤 2: 从子来源并行获取节点 URL..." | tee -a "$CLASH_LOG"
-grep -v '^#' "$BACKUP_SOURCES_LIST" | grep -v '^$' | xargs -n 1 -P "$MAX_CONCURRENT_SUB" -I {} bash -c '
-  echo "拉取 {} ..." >> "'"$CLASH_LOG"'"
-  nodes=$(curl -s --retry 3 --connect-timeout 10 "{}" | grep -E "^(hysteria2|vmess|trojan|ss|ssr|vless)://")
-  if [ -n "$nodes" ]; then
-    echo "$nodes" >> "'"$TEMP_ALL_RAW_NODES"'"
-    echo "成功从 {} 获取 $(echo "$nodes" | wc -l) 个节点" >> "'"$CLASH_LOG"'"
-  else
-    echo "失败: {} 无节点或无法访问" >> "'"$CLASH_LOG"'"
-    echo "{}" >> "'"$FAILED_SUB_URLS"'"
-  fi
-'
+# 单进程异步下载：全局并发与单主机并发分别受限，base64 解码与链接提取在进程内完成，
+# 每个来源原子写出到 $SOURCES_DIR，状态/字节数/节点数/耗时记录在 $SOURCES_MANIFEST；
+# 连续失败的来源记录在 $SOURCE_HEALTH 中并按指数退避跳过，高产来源优先拉取
+python3 fetch_sources.py -s "$BACKUP_SOURCES_LIST" -o "$SOURCES_DIR" -m "$SOURCES_MANIFEST" -a "$TEMP_ALL_RAW_NODES" -f "$FAILED_SUB_URLS" \
+  -H "$SOURCE_HEALTH" -n "$MAX_CONCURRENT_SUB" -p "$MAX_CONCURRENT_PER_HOST" | tee -a "$CLASH_LOG"
 if [ ! -s "$TEMP_ALL_RAW_NODES" ]; then
   echo "错误: 从子来源获取的节点 URL 为空。退出。" | tee -a "$CLASH_LOG"
   exit 1
@@ -79,19 +82,15 @@ echo "  预过滤后剩余 $FILTERED_NODES_COUNT 个节点。" | tee -a "$CLASH_
 
 # 步骤 4: 识别新节点
 echo "步骤 4: 识别新节点..." | tee -a "$CLASH_LOG"
-if [ ! -f "$PREVIOUS_NODES_FILE" ]; then
-  NEW_NODES_COUNT=$FILTERED_NODES_COUNT
+# 持久化 Bloom 索引 O(1) 判断每个节点是否出现过，并将本次节点记入当日分段；
+# 超过 SEEN_KEEP_DAYS 天未再出现的节点随分段过期淘汰，首次运行时用旧的 previous_nodes.txt 初始化
+python3 seen_nodes.py "$FILTERED_NODES" -o "$TEMP_NEW_RAW_NODES" -d "$SEEN_INDEX_DIR" -D "$SEEN_KEEP_DAYS" -s "$PREVIOUS_NODES_FILE" | tee -a "$CLASH_LOG"
+if [ "${PIPESTATUS[0]}" -ne 0 ]; then
+  echo "  警告: 节点索引不可用，全部 $FILTERED_NODES_COUNT 个节点视为新节点。" | tee -a "$CLASH_LOG"
   cp "$FILTERED_NODES" "$TEMP_NEW_RAW_NODES"
-  echo "  首次运行: 发现 $NEW_NODES_COUNT 个节点。" | tee -a "$CLASH_LOG"
-else
-  sort "$PREVIOUS_NODES_FILE" > "$TEMP_DIR/previous_nodes.sorted"
-  sort "$FILTERED_NODES" > "$TEMP_DIR/filtered_nodes.sorted"
-  comm -13 "$TEMP_DIR/previous_nodes.sorted" "$TEMP_DIR/filtered_nodes.sorted" > "$TEMP_NEW_RAW_NODES"
-  NEW_NODES_COUNT=$(wc -l < "$TEMP_NEW_RAW_NODES")
-  echo "  发现 $NEW_NODES_COUNT 个新节点。" | tee -a "$CLASH_LOG"
 fi
-cp "$FILTERED_NODES" "$PREVIOUS_NODES_FILE"
-rm -f "$TEMP_DIR/previous_nodes.sorted" "$TEMP_DIR/filtered_nodes.sorted"
+NEW_NODES_COUNT=$(wc -l < "$TEMP_NEW_RAW_NODES")
+echo "  发现 $NEW_NODES_COUNT 个新节点。" | tee -a "$CLASH_LOG"
 
 if [ "$NEW_NODES_COUNT" -eq 0 ]; then
   echo "没有新节点需要测试。退出。" | tee -a "$CLASH_LOG"
@@ -109,6 +108,61 @@ fi
 PARSED_NODES_COUNT=$(jq '. | length' "$TEMP_PARSED_NODES_JSON")
 echo "  成功解析 $PARSED_NODES_COUNT 个节点。" | tee -a "$CLASH_LOG"
 
+# TCP 预筛：绝大多数失效节点在 TCP 层即不可达，先以异步原始连接探测 server:port (相同端点只探测一次)，
+# 只有可连通的节点才进入 Clash 核心做完整测试；UDP 协议节点无法探测，直接保留
+echo "  TCP 预筛节点端点..." | tee -a "$CLASH_LOG"
+python3 subscribe/prescreen.py -i "$TEMP_PARSED_NODES_JSON" -n "$PRESCREEN_CONCURRENCY" -t "$PRESCREEN_TIMEOUT" 2>&1 | tee -a "$CLASH_LOG"
+if [ "${PIPESTATUS[0]}" -eq 0 ]; then
+  PARSED_NODES_COUNT=$(jq '. | length' "$TEMP_PARSED_NODES_JSON")
+  echo "  预筛后剩余 $PARSED_NODES_COUNT 个节点。" | tee -a "$CLASH_LOG"
+else
+  echo "  警告: TCP 预筛失败，全部节点进入完整测试。" | tee -a "$CLASH_LOG"
+fi
+if [ "$PARSED_NODES_COUNT" -eq 0 ]; then
+  echo "预筛后没有可连通的节点。退出。" | tee -a "$CLASH_LOG"
+  exit 0
+fi
+
+# 按端点排序，使共享 server:port 的节点落在同一批次，test_clash_api.py 每个端点只先测一个代表节点
+jq -c 'sort_by(.type // "", (.server // "" | tostring | ascii_downcase), (.port // "" | tostring))' "$TEMP_PARSED_NODES_JSON" > "$TEMP_DIR/parsed_nodes_sorted.json" \
+  && mv "$TEMP_DIR/parsed_nodes_sorted.json" "$TEMP_PARSED_NODES_JSON"
+
+# 启动常驻 Clash 核心，各批次通过控制器 PUT /configs?force=true 热加载节点，避免每批次重启与重复加载 GeoIP
+cat << EOF > "$TEMP_DIR/clash_bootstrap.yaml"
+port: 7890
+socks-port: 7891
+mode: rule
+log-level: warning
+allow-lan: false
+external-controller: 127.0.0.1:9090
+secret: ""
+
+proxies: []
+rules:
+  - MATCH,DIRECT
+EOF
+./clash/clash -f "$TEMP_DIR/clash_bootstrap.yaml" -d . >> "$TEMP_DIR/clash_core.log" 2>&1 &
+CLASH_PID=$!
+trap 'kill $CLASH_PID 2>/dev/null' EXIT
+
+CORE_READY=0
+for ((wait=0; wait<60; wait++)); do
+  if ! ps -p $CLASH_PID > /dev/null; then
+    break
+  fi
+  if curl -s --connect-timeout 1 "http://127.0.0.1:9090/version" > /dev/null; then
+    CORE_READY=1
+    break
+  fi
+  sleep 0.5
+done
+if [ "$CORE_READY" -ne 1 ]; then
+  echo "错误: Clash 核心启动失败，查看 $TEMP_DIR/clash_core.log。退出。" | tee -a "$CLASH_LOG"
+  cat "$TEMP_DIR/clash_core.log"
+  exit 1
+fi
+echo "  Clash 核心已就绪 (PID: $CLASH_PID)。" | tee -a "$CLASH_LOG"
+
 # 分轮测试
 TOTAL_ROUNDS=$(( (PARSED_NODES_COUNT + MAX_NODES_PER_ROUND - 1) / MAX_NODES_PER_ROUND ))
 echo "将分 $TOTAL_ROUNDS 轮测试，每轮最多 $MAX_NODES_PER_ROUND 个节点。" | tee -a "$CLASH_LOG"
@@ -185,73 +239,62 @@ with open(sys.argv[1], "a") as f:
     # 保存批次配置文件供调试
     cp "$TEMP_CLASH_CONFIG" "$TEMP_DIR/clash_config_batch_$i.yaml"
 
-    echo "  运行 Clash 测试批次 $((i+1))..." | tee -a "$CLASH_LOG"
-    ./clash/clash -f "$TEMP_CLASH_CONFIG" -d . > "$CLASH_LOG" 2>&1 &
-    CLASH_PID=$!
-    sleep 15
+    echo "  热加载 Clash 测试批次 $((i+1))..." | tee -a "$CLASH_LOG"
     if ! ps -p $CLASH_PID > /dev/null; then
-      echo "错误: Clash 启动失败，查看 $CLASH_LOG。继续下一批次。" | tee -a "$CLASH_LOG"
-      cat "$CLASH_LOG"
-      continue
+      echo "错误: Clash 核心已退出，查看 $TEMP_DIR/clash_core.log。退出。" | tee -a "$CLASH_LOG"
+      cat "$TEMP_DIR/clash_core.log"
+      exit 1
     fi
 
-    if ! curl -s --connect-timeout 5 "http://127.0.0.1:9090/proxies" > /dev/null; then
-      echo "错误: Clash API (127.0.0.1:9090) 不可用，查看 $CLASH_LOG。继续下一批次。" | tee -a "$CLASH_LOG"
-      cat "$CLASH_LOG"
-      kill $CLASH_PID 2>/dev/null
+    if ! python3 subscribe/clashcore.py -c "$TEMP_CLASH_CONFIG" -a 127.0.0.1:9090 -t 30 >> "$CLASH_LOG" 2>&1; then
+      echo "错误: 批次 $((i+1)) 配置热加载失败，继续下一批次。" | tee -a "$CLASH_LOG"
       continue
     fi
 
-    BATCH_ALL_NODES_FILE="$TEMP_DIR/batch_all_$i.txt"
-    python3 test_clash_api.py "$BATCH_ALL_NODES_FILE" 2>&1 | tee -a "$CLASH_LOG"
+    BATCH_ALL_NODES_FILE="$TEMP_DIR/batch_all_$i.jsonl"
+    python3 test_clash_api.py "$BATCH_ALL_NODES_FILE" -c "$TEMP_CLASH_CONFIG" 2>&1 | tee -a "$CLASH_LOG"
 
-    kill $CLASH_PID 2>/dev/null
-
-    # 合并测试通过的节点
+    # 合并测试通过的节点 (结果为 JSON Lines: name, delay, error, attempts)
     python3 -c '
 import sys, json
-passed_nodes_file = sys.argv[1]
+results_file = sys.argv[1]
 all_nodes_json = sys.argv[2]
 batch_json = sys.argv[3]
-with open(passed_nodes_file, "r", encoding="utf-8") as f:
-    passed = {line.split(":")[0].strip(): True for line in f if ": timeout" not in line and ": error" not in line}
+all_nodes_file = sys.argv[4]
+passed = {}
+with open(results_file, "r", encoding="utf-8") as f:
+    for line in f:
+        try:
+            row = json.loads(line)
+        except ValueError:
+            continue
+        if row.get("delay") is not None:
+            passed[row["name"]] = row["delay"]
 with open(batch_json, "r", encoding="utf-8") as f:
     batch_nodes = json.load(f)
 with open(all_nodes_json, "r", encoding="utf-8") as f:
-    all_nodes = json.load(f) if f.read(1) else []
-all_nodes.extend([node for node in batch_nodes if node["name"] in passed])
+    content = f.read().strip()
+all_nodes = json.loads(content) if content else []
+passed_nodes = [node for node in batch_nodes if node["name"] in passed]
+all_nodes.extend(passed_nodes)
 with open(all_nodes_json, "w", encoding="utf-8") as f:
     json.dump(all_nodes, f, indent=2, ensure_ascii=False)
-' "$BATCH_ALL_NODES_FILE" "$ALL_PASSED_NODES_JSON" "$TEMP_DIR/batch_$i.json"
-
-    # 追加通过节点到 data/all.txt
-    python3 -c '
-import sys, json
-passed_nodes_file = sys.argv[1]
-batch_json = sys.argv[2]
-all_nodes_file = sys.argv[3]
 try:
-    with open(passed_nodes_file, "r", encoding="utf-8") as f:
-        passed = {line.split(":")[0].strip(): True for line in f if ": timeout" not in line and ": error" not in line}
-    with open(batch_json, "r", encoding="utf-8") as f:
-        batch_nodes = json.load(f)
     with open(all_nodes_file, "a", encoding="utf-8") as f:
-        for node in batch_nodes:
-            if node["name"] in passed:
-                f.write(f"{node['name']}: passed\n")
+        for node in passed_nodes:
+            f.write(node["name"] + ": passed\n")
 except Exception as e:
     print(f"错误: 追加到 {all_nodes_file} 失败: {e}")
-' "$BATCH_ALL_NODES_FILE" "$TEMP_DIR/batch_$i.json" "$ALL_NODES_FILE" || {
-      echo "警告: 追加通过节点到 $ALL_NODES_FILE 失败，查看脚本输出。" | tee -a "$CLASH_LOG"
+' "$BATCH_ALL_NODES_FILE" "$ALL_PASSED_NODES_JSON" "$TEMP_DIR/batch_$i.json" "$ALL_NODES_FILE" || {
+      echo "警告: 合并通过节点失败，查看脚本输出。" | tee -a "$CLASH_LOG"
     }
 
     # 验证文件存在并记录通过节点数
-    BATCH_PASSED_COUNT=$(grep -c ": passed" "$BATCH_ALL_NODES_FILE" 2>/dev/null || echo 0)
+    BATCH_PASSED_COUNT=$(jq -s '[.[] | select(.delay != null)] | length' "$BATCH_ALL_NODES_FILE" 2>/dev/null || echo 0)
     echo "  批次 $((i+1)) 测试完成: $BATCH_PASSED_COUNT 个节点通过。" | tee -a "$CLASH_LOG"
     if [ "$BATCH_PASSED_COUNT" -eq 0 ]; then
       echo "  警告: 批次 $((i+1)) 无通过节点，检查 $BATCH_ALL_NODES_FILE 和 $CLASH_LOG。" | tee -a "$CLASH_LOG"
-      grep ": timeout" "$BATCH_ALL_NODES_FILE" | head -n 5 >> "$CLASH_LOG"
-      grep ": error" "$BATCH_ALL_NODES_FILE" | head -n 5 >> "$CLASH_LOG"
+      jq -s -c 'group_by(.error) | map({error: .[0].error, count: length})' "$BATCH_ALL_NODES_FILE" >> "$CLASH_LOG" 2>/dev/null
     fi
     if [ -s "$ALL_PASSED_NODES_JSON" ]; then
       echo "  批次 $((i+1)) 通过节点已保存到 $ALL_PASSED_NODES_JSON 和 $ALL_NODES_FILE。" | tee -a "$CLASH_LOG"
@@ -259,10 +302,10 @@ except Exception as e:
       echo "  警告: 批次 $((i+1)) 无通过节点，$ALL_PASSED_NODES_JSON 可能为空。" | tee -a "$CLASH_LOG"
     fi
 
-    # 提交批次结果
+    # 提交批次结果；data/seen_nodes 下的二进制 Bloom 分段每轮运行只在步骤 7 提交一次，避免每个批次都向历史写入一份
     git config user.name 'github-actions[bot]'
     git config user.email 'github-actions[bot]@users.noreply.github.com'
-    git add data/parsed_nodes.json data/passed_nodes.json data/all.txt data/clash.log data/convert_nodes.log data/test_clash_api.log data/previous_nodes.txt data/clash_config_batch_*.yaml data/prefilter_nodes.log data/failed_sub_urls.txt
+    git add data/parsed_nodes.json data/passed_nodes.json data/all.txt data/clash.log data/convert_nodes.log data/test_clash_api.log data/seen_nodes.log data/clash_config_batch_*.yaml data/prefilter_nodes.log data/failed_sub_urls.txt data/source_health.json
     git commit -m "保存轮次 $((round+1)) 批次 $((i+1)) 结果" || echo "无中间结果需要提交"
     git push || {
       echo "错误: git push 失败，查看远程仓库状态：" | tee -a "$CLASH_LOG"
@@ -276,6 +319,10 @@ except Exception as e:
   ls -t "$TEMP_DIR"/clash_config_batch_*.yaml 2>/dev/null | tail -n +$MAX_BATCH_FILES | xargs -I {} rm -f {}
 done
 
+# 关闭常驻 Clash 核心
+kill $CLASH_PID 2>/dev/null
+trap - EXIT
+
 # 步骤 6: 生成最终 Clash 配置文件
 echo "步骤 6: 生成最终 Clash 配置文件..." | tee -a "$CLASH_LOG"
 if [ ! -s "$ALL_PASSED_NODES_JSON" ]; then
@@ -353,7 +400,7 @@ echo "节点测试完成，$PASSED_NODES_COUNT 个节点保存到 $FINAL_CLASH_C
 # 步骤 7: 提交最终结果
 git config user.name 'github-actions[bot]'
 git config user.email 'github-actions[bot]@users.noreply.github.com'
-git add data/parsed_nodes.json data/passed_nodes.json data/all.txt data/clash.log data/convert_nodes.log data/test_clash_api.log data/previous_nodes.txt data/clash_config.yaml data/clash_config_batch_*.yaml data/prefilter_nodes.log data/failed_sub_urls.txt
+git add data/parsed_nodes.json data/passed_nodes.json data/all.txt data/clash.log data/convert_nodes.log data/test_clash_api.log data/seen_nodes data/seen_nodes.log data/clash_config.yaml data/clash_config_batch_*.yaml data/prefilter_nodes.log data/failed_sub_urls.txt data/source_health.json
 git commit -m "保存最终结果: $PASSED_NODES_COUNT 个节点通过" || echo "无最终结果需要提交"
 git push || {
   echo "错误: git push 失败，查看远程仓库状态：" | tee -a "$CLASH_LOG"
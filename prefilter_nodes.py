@@ -0,0 +1,296 @@
+#!/usr/bin/env python3
+
+import argparse
+import base64
+import binascii
+import hashlib
+import heapq
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import urllib.parse
+
+SUPPORTED_SCHEMES = ("hysteria2", "vmess", "trojan", "ss", "ssr", "vless")
+LINK_PATTERN = re.compile(r"^(?:hysteria2|vmess|trojan|ss|ssr|vless)://\S+", re.I)
+
+# 只影响节点显示名称、不影响连通性的参数
+REMARK_PARAMS = {"remarks", "remark", "group", "ps", "name", "tag"}
+
+# 内存模式下每个摘要在 set 中的估算占用 (16 字节 bytes 对象 + 哈希表槽位)
+ENTRY_COST = 120
+
+# 归并模式下缓冲区每条记录除链接字符串外的估算占用 (元组、摘要、序号与列表槽位)
+RECORD_COST = 200
+
+def b64decode(text):
+    """兼容 urlsafe、缺失填充与换行的 base64 解码"""
+    text = text.strip().replace("-", "+").replace("_", "/")
+    text = re.sub(r"\s+", "", text)
+    text += "=" * (-len(text) % 4)
+    return base64.b64decode(text, validate=False)
+
+def canonical_query(query):
+    params = urllib.parse.parse_qsl(query, keep_blank_values=True)
+    items = sorted((k.lower(), v) for k, v in params if k.lower() not in REMARK_PARAMS)
+    return urllib.parse.urlencode(items, quote_via=urllib.parse.quote)
+
+def canonical_host(host, port, default_port):
+    host = (host or "").strip("[]").lower().rstrip(".")
+    return f"{host}:{port or default_port}"
+
+def canonical_vmess(body):
+    try:
+        config = json.loads(b64decode(body).decode("utf-8", errors="ignore"))
+    except (ValueError, binascii.Error):
+        return None
+    if not isinstance(config, dict):
+        return None
+    items = {str(k).lower(): str(v).strip() for k, v in config.items() if str(k).lower() not in REMARK_PARAMS}
+    items["add"] = items.get("add", "").lower()
+    return "vmess|" + json.dumps(items, sort_keys=True, ensure_ascii=False)
+
+def canonical_ss(body):
+    body = body.split("#", 1)[0]
+    body, _, query = body.partition("?")
+    body = body.rstrip("/")
+    if "@" not in body:
+        # ss://base64(method:password@host:port)
+        try:
+            body = b64decode(body).decode("utf-8", errors="ignore")
+        except (ValueError, binascii.Error):
+            return None
+    userinfo, _, address = body.rpartition("@")
+    userinfo = urllib.parse.unquote(userinfo)
+    if ":" not in userinfo:
+        try:
+            userinfo = b64decode(userinfo).decode("utf-8", errors="ignore")
+        except (ValueError, binascii.Error):
+            return None
+    method, _, password = userinfo.partition(":")
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        return None
+    return f"ss|{method.lower()}|{password}|{canonical_host(host, port, 0)}|{canonical_query(query)}"
+
+def canonical_ssr(body):
+    try:
+        text = b64decode(body.split("#", 1)[0]).decode("utf-8", errors="ignore")
+    except (ValueError, binascii.Error):
+        return None
+    main, _, query = text.partition("/?")
+    parts = main.rsplit(":", 5)
+    if len(parts) != 6:
+        return None
+    host, port, protocol, method, obfs, password = parts
+    try:
+        password = b64decode(password).decode("utf-8", errors="ignore")
+    except (ValueError, binascii.Error):
+        pass
+    params = []
+    for key, value in urllib.parse.parse_qsl(query, keep_blank_values=True):
+        if key.lower() in REMARK_PARAMS:
+            continue
+        try:
+            value = b64decode(value).decode("utf-8", errors="ignore")
+        except (ValueError, binascii.Error):
+            pass
+        params.append((key.lower(), value))
+    return f"ssr|{canonical_host(host, port, 0)}|{protocol}|{method.lower()}|{obfs}|{password}|{sorted(params)}"
+
+def canonical_uri(scheme, link):
+    """trojan / vless / hysteria2 等标准 URI：去掉 #备注，统一大小写、默认端口与参数顺序"""
+    try:
+        parts = urllib.parse.urlsplit(link)
+        port = parts.port
+    except ValueError:
+        return None
+    if not parts.hostname:
+        return None
+    userinfo = urllib.parse.unquote(parts.netloc.rpartition("@")[0])
+    address = canonical_host(parts.hostname, port, 443)
+    return f"{scheme}|{userinfo}|{address}|{parts.path.rstrip('/')}|{canonical_query(parts.query)}"
+
+def canonicalize(link):
+    """返回链接的规范化形式，无法解析时返回 None"""
+    scheme, _, body = link.partition("://")
+    scheme = scheme.lower()
+    try:
+        if scheme == "vmess":
+            return canonical_vmess(body.split("#", 1)[0]) or canonical_uri(scheme, link)
+        if scheme == "ss":
+            return canonical_ss(body)
+        if scheme == "ssr":
+            return canonical_ssr(body)
+        return canonical_uri(scheme, link)
+    except Exception as e:
+        logging.debug(f"规范化失败: {link[:80]} - {e}")
+        return None
+
+def fingerprint(link):
+    """16 字节节点指纹，无法规范化的链接退化为对原文去掉备注后取摘要"""
+    canonical = canonicalize(link) or link.split("#", 1)[0]
+    return hashlib.blake2b(canonical.encode("utf-8", errors="ignore"), digest_size=16).digest()
+
+def iter_sources(inputs):
+    """逐个来源产出 (来源名, 行迭代器)，目录中每个文件视为一个来源，首行 '# url' 作为来源名"""
+    for path in inputs:
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, x) for x in os.listdir(path) if x.endswith(".txt"))
+        else:
+            files = [path]
+        for file in files:
+            if not os.path.isfile(file):
+                logging.warning(f"输入文件不存在: {file}")
+                continue
+            with open(file, "r", encoding="utf-8", errors="ignore") as f:
+                first = f.readline()
+                name = first[1:].strip() if first.startswith("#") else file
+                if not first.startswith("#"):
+                    yield name, _chain(first, f)
+                else:
+                    yield name, f
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+class Deduplicator:
+    """
+    基于 16 字节指纹的流式去重：内存预算内使用摘要集合并直接输出，
+    超出预算后溢写为按指纹排序的分块文件，最后多路归并输出
+    """
+
+    def __init__(self, output, memory_mb=256, workdir=None):
+        self.output = output
+        self.budget = max(1, int(memory_mb * 1024 * 1024))
+        self.limit = max(1, self.budget // ENTRY_COST)
+        self.workdir = workdir
+        self.seen = set()
+        self.buffer = []
+        self.buffered = 0
+        self.chunks = []
+        self.spilled = False
+        self.seq = 0
+        self.sources = []
+        self.stats = []
+
+    def add_source(self, name):
+        self.sources.append(name)
+        self.stats.append({"source": name, "total": 0, "invalid": 0, "duplicate": 0})
+        return len(self.sources) - 1
+
+    def feed(self, source, line):
+        link = line.strip()
+        stat = self.stats[source]
+        if not LINK_PATTERN.match(link):
+            if link and not link.startswith("#"):
+                stat["invalid"] += 1
+            return
+        stat["total"] += 1
+        digest = fingerprint(link)
+        self.seq += 1
+
+        if not self.spilled:
+            if digest in self.seen:
+                stat["duplicate"] += 1
+                return
+            self.seen.add(digest)
+            self.output.write(link + "\n")
+            if len(self.seen) >= self.limit:
+                self._spill_seen()
+            return
+
+        # 缓冲区保存完整链接，按实际字节数而非条数判断是否溢写
+        self.buffer.append((digest, self.seq, source, link))
+        self.buffered += sys.getsizeof(link) + RECORD_COST
+        if self.buffered >= self.budget:
+            self._flush_buffer()
+
+    def _write_chunk(self, records):
+        fd, path = tempfile.mkstemp(prefix="prefilter_", suffix=".chunk", dir=self.workdir)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            for digest, seq, source, link in records:
+                f.write(f"{digest.hex()}\t{seq}\t{source}\t{link}\n")
+        self.chunks.append(path)
+
+    def _spill_seen(self):
+        # 已输出的指纹以 seq=0 写入分块，归并时优先于后续任何同指纹记录
+        logging.info(f"摘要集合达到内存预算 ({len(self.seen)} 条)，切换为外部归并模式")
+        self._write_chunk((digest, 0, -1, "") for digest in sorted(self.seen))
+        self.seen = set()
+        self.spilled = True
+
+    def _flush_buffer(self):
+        self.buffer.sort()
+        self._write_chunk(self.buffer)
+        self.buffer = []
+        self.buffered = 0
+
+    def _read_chunk(self, path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                digest, seq, source, link = line.rstrip("\n").split("\t", 3)
+                yield digest, int(seq), int(source), link
+
+    def finish(self):
+        if not self.spilled:
+            return
+        if self.buffer:
+            self._flush_buffer()
+        previous = None
+        try:
+            for digest, seq, source, link in heapq.merge(*(self._read_chunk(x) for x in self.chunks)):
+                if digest == previous:
+                    if source >= 0:
+                        self.stats[source]["duplicate"] += 1
+                    continue
+                previous = digest
+                if source >= 0:
+                    self.output.write(link + "\n")
+        finally:
+            for path in self.chunks:
+                os.remove(path)
+            self.chunks = []
+
+def report(stats):
+    total = sum(x["total"] for x in stats)
+    duplicate = sum(x["duplicate"] for x in stats)
+    for item in stats:
+        item["ratio"] = round(item["duplicate"] / item["total"], 4) if item["total"] else 0.0
+    stats.sort(key=lambda x: (x["ratio"], x["total"]), reverse=True)
+    for item in stats:
+        logging.info(f"来源 {item['source']}: 节点 {item['total']}，重复 {item['duplicate']} ({item['ratio']:.2%})，无效行 {item['invalid']}")
+    ratio = duplicate / total if total else 0
+    return {"total": total, "duplicate": duplicate, "unique": total - duplicate, "ratio": round(ratio, 4), "sources": stats}
+
+if __name__ == "__main__":
+    logging.basicConfig(filename="data/prefilter_nodes.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="按规范化节点指纹流式去重，替代 sort -u")
+    parser.add_argument("inputs", nargs="+", help="原始节点文件或按来源拆分的目录 (目录内每个 .txt 为一个来源)")
+    parser.add_argument("-o", "--output", default="data/filtered_nodes.txt", help="去重后的节点文件")
+    parser.add_argument("-m", "--memory", type=float, default=256, help="内存中摘要集合的预算 (MB)，超出后外部归并")
+    parser.add_argument("-r", "--report", default="", help="按来源统计重复率的 JSON 报告文件")
+    args = parser.parse_args()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    tmpfile = f"{args.output}.tmp"
+    with open(tmpfile, "w", encoding="utf-8") as out:
+        dedup = Deduplicator(out, memory_mb=args.memory, workdir=os.path.dirname(os.path.abspath(args.output)))
+        for name, lines in iter_sources(args.inputs):
+            source = dedup.add_source(name)
+            for line in lines:
+                dedup.feed(source, line)
+        dedup.finish()
+    os.replace(tmpfile, args.output)
+
+    summary = report(dedup.stats)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2, ensure_ascii=False)
+    sys.stdout.write(
+        f"  预过滤: {len(summary['sources'])} 个来源，{summary['total']} 个节点，去重后 {summary['unique']} 个，重复率 {summary['ratio']:.2%}。\n"
+    )
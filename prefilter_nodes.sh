@@ -1,6 +1,8 @@
 #!/bin/bash
 # prefilter_nodes.sh
 
+SOURCES_DIR="data/temp/sources"
+
 # 检查输入文件
 if [ ! -s data/temp_all_raw_nodes.txt ]; then
   echo "警告: data/temp_all_raw_nodes.txt 为空，跳过预过滤" >> data/fetch_nodes.log
@@ -8,6 +10,11 @@ if [ ! -s data/temp_all_raw_nodes.txt ]; then
   exit 0
 fi
 
-# 去重并过滤无效节点
-cat data/temp_all_raw_nodes.txt | grep -E "^(hysteria2|vmess|trojan|ss|ssr|vless)://" | sort -u > data/filtered_nodes.txt
+# 按规范化指纹去重 (忽略 #备注、参数顺序、base64 填充差异)，优先使用按来源拆分的目录以统计各来源重复率
+if [ -d "$SOURCES_DIR" ] && [ -n "$(ls -A "$SOURCES_DIR" 2>/dev/null)" ]; then
+  INPUTS="$SOURCES_DIR"
+else
+  INPUTS="data/temp_all_raw_nodes.txt"
+fi
+python3 prefilter_nodes.py "$INPUTS" -o data/filtered_nodes.txt -r data/prefilter_report.json >> data/fetch_nodes.log 2>&1
 echo "预过滤完成，生成 data/filtered_nodes.txt，节点数: $(wc -l < data/filtered_nodes.txt)" >> data/fetch_nodes.log
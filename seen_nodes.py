@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import time
+
+from prefilter_nodes import LINK_PATTERN, fingerprint
+
+logging.basicConfig(filename="data/seen_nodes.log", level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+MAGIC = b"SEENBLM1"
+
+# magic, 位数 m, 哈希次数 k, 设计容量, 已插入数量, 创建时间
+HEADER = struct.Struct("<8sQIQQd")
+HEADER_SIZE = 64
+
+class BloomFilter:
+    """
+    基于 mmap 的持久化 Bloom 过滤器，键为 prefilter_nodes.fingerprint 的 16 字节指纹，
+    前后 8 字节作为两个独立哈希做双重哈希 (h1 + i * h2) 得到 k 个位置
+    """
+
+    def __init__(self, path, capacity=2000000, error_rate=0.0001):
+        self.path = path
+        if not os.path.exists(path):
+            self._create(path, capacity, error_rate)
+
+        self.file = open(path, "r+b")
+        self.mm = mmap.mmap(self.file.fileno(), 0)
+        magic, self.bits, self.hashes, self.capacity, self.count, self.created = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or len(self.mm) < HEADER_SIZE + (self.bits + 7) // 8:
+            self.close()
+            raise ValueError(f"无效的索引文件: {path}")
+
+    @staticmethod
+    def _create(path, capacity, error_rate):
+        capacity = max(int(capacity), 1000)
+        error_rate = min(max(error_rate, 1e-9), 0.5)
+        bits = int(math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        hashes = max(1, int(round(bits / capacity * math.log(2))))
+
+        tmpfile = f"{path}.tmp"
+        with open(tmpfile, "wb") as f:
+            f.write(HEADER.pack(MAGIC, bits, hashes, capacity, 0, time.time()).ljust(HEADER_SIZE, b"\0"))
+            f.truncate(HEADER_SIZE + (bits + 7) // 8)
+        os.replace(tmpfile, path)
+        logging.info(f"创建索引分段 {path}: 容量 {capacity}，误判率 {error_rate}，{bits} 位，{hashes} 个哈希")
+
+    def _positions(self, digest):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.bits for i in range(self.hashes)]
+
+    def __contains__(self, digest):
+        mm = self.mm
+        for pos in self._positions(digest):
+            if not mm[HEADER_SIZE + (pos >> 3)] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, digest):
+        """插入指纹，返回插入前是否(可能)已存在"""
+        mm = self.mm
+        existed = True
+        for pos in self._positions(digest):
+            index = HEADER_SIZE + (pos >> 3)
+            bit = 1 << (pos & 7)
+            value = mm[index]
+            if not value & bit:
+                mm[index] = value | bit
+                existed = False
+        if not existed:
+            self.count += 1
+        return existed
+
+    def close(self):
+        if getattr(self, "mm", None) is None:
+            self.file.close()
+            return
+        if not self.mm.closed:
+            HEADER.pack_into(self.mm, 0, MAGIC, self.bits, self.hashes, self.capacity, self.count, self.created)
+            self.mm.flush()
+            self.mm.close()
+        self.file.close()
+
+class SeenIndex:
+    """
+    按时间分段的"见过"索引：每个分段覆盖 rotate 天，本次运行的节点写入当前分段，
+    查询时检查仍在有效期内的所有分段。超过 days 天的分段整体删除，
+    因此 days 天内未再出现的节点会自然淘汰，无需逐条删除
+    """
+
+    def __init__(self, directory, days=7, rotate=1, error_rate=0.0001, capacity=2000000, now=None):
+        self.directory = directory
+        self.rotate = max(int(rotate), 1)
+        self.generations = max(int(math.ceil(max(days, 1) / self.rotate)), 1)
+        # 多个分段的误判率近似相加，按分段数均摊总误判率
+        self.error_rate = error_rate / self.generations
+        self.capacity = capacity
+        now = time.time() if now is None else now
+        self.current = int(now // 86400) // self.rotate
+        self.segments = []
+        self.active = None
+        os.makedirs(directory, exist_ok=True)
+
+    def _segment_name(self, generation):
+        day = datetime.date(1970, 1, 1) + datetime.timedelta(days=generation * self.rotate)
+        return f"{day.strftime('%Y%m%d')}.bloom"
+
+    def _generation(self, filename):
+        try:
+            day = datetime.datetime.strptime(filename.split(".", 1)[0], "%Y%m%d").date()
+        except ValueError:
+            return None
+        return (day - datetime.date(1970, 1, 1)).days // self.rotate
+
+    def open(self):
+        """删除过期分段并打开有效分段，当前分段不存在时按历史最大插入量调整容量后创建"""
+        largest = 0
+        for filename in sorted(os.listdir(self.directory)):
+            if not filename.endswith(".bloom"):
+                continue
+            path = os.path.join(self.directory, filename)
+            generation = self._generation(filename)
+            if generation is None or generation <= self.current - self.generations or generation > self.current:
+                os.remove(path)
+                logging.info(f"淘汰过期索引分段: {filename}")
+                continue
+            try:
+                segment = BloomFilter(path)
+            except (ValueError, OSError) as e:
+                logging.error(f"索引分段损坏，已删除: {filename} - {e}")
+                os.remove(path)
+                continue
+            largest = max(largest, segment.count)
+            if generation == self.current:
+                self.active = segment
+            else:
+                self.segments.append(segment)
+
+        if self.active is None:
+            capacity = max(self.capacity, int(largest * 1.25))
+            path = os.path.join(self.directory, self._segment_name(self.current))
+            self.active = BloomFilter(path, capacity=capacity, error_rate=self.error_rate)
+        self.segments.append(self.active)
+        return self
+
+    @property
+    def empty(self):
+        return all(segment.count == 0 for segment in self.segments)
+
+    def __contains__(self, digest):
+        return any(digest in segment for segment in self.segments)
+
+    def check(self, link, update=True):
+        """返回链接是否为新节点，update 为 True 时同时记入当前分段以刷新其最近出现时间"""
+        digest = fingerprint(link)
+        seen = any(digest in segment for segment in self.segments if segment is not self.active)
+        if update:
+            seen = self.active.add(digest) or seen
+        elif not seen:
+            seen = digest in self.active
+        return not seen
+
+    def add(self, link):
+        self.active.add(fingerprint(link))
+
+    def stats(self):
+        items = []
+        for segment in self.segments:
+            ratio = (1 - math.exp(-segment.hashes * segment.count / segment.bits)) ** segment.hashes
+            items.append(
+                {
+                    "segment": os.path.basename(segment.path),
+                    "count": segment.count,
+                    "capacity": segment.capacity,
+                    "size": os.path.getsize(segment.path),
+                    "error_rate": ratio,
+                }
+            )
+        return items
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.active = None
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, *args):
+        self.close()
+
+def iter_links(path):
+    with open(path, "r", encoding="utf-8", errors="ignore") as f:
+        for line in f:
+            link = line.strip()
+            if LINK_PATTERN.match(link):
+                yield link
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="基于持久化 Bloom 过滤器的新节点识别，替代 sort + comm")
+    parser.add_argument("input", help="待检查的节点文件")
+    parser.add_argument("-o", "--output", default="", help="新节点输出文件，为空时只更新索引")
+    parser.add_argument("-d", "--directory", default="data/seen_nodes", help="索引分段目录")
+    parser.add_argument("-D", "--days", type=int, default=7, help="节点连续多少天未出现后从索引中淘汰")
+    parser.add_argument("-r", "--rotate", type=int, default=1, help="每个索引分段覆盖的天数")
+    parser.add_argument("-e", "--error-rate", type=float, default=0.0001, help="索引整体允许的误判率")
+    parser.add_argument("-c", "--capacity", type=int, default=2000000, help="新建分段的最小设计容量")
+    parser.add_argument("-s", "--seed", default="", help="索引为空时用于初始化的历史节点文件 (如 previous_nodes.txt)")
+    parser.add_argument("-n", "--dry-run", action="store_true", help="只检查不更新索引")
+    args = parser.parse_args()
+
+    starttime = time.time()
+    total, fresh = 0, 0
+    with SeenIndex(args.directory, args.days, args.rotate, args.error_rate, args.capacity) as index:
+        if index.empty and args.seed and os.path.isfile(args.seed):
+            seeded = 0
+            for link in iter_links(args.seed):
+                index.add(link)
+                seeded += 1
+            logging.info(f"使用 {args.seed} 初始化索引: {seeded} 个节点")
+
+        out = open(args.output, "w", encoding="utf-8") if args.output else None
+        try:
+            for link in iter_links(args.input):
+                total += 1
+                if index.check(link, update=not args.dry_run):
+                    fresh += 1
+                    if out:
+                        out.write(link + "\n")
+        finally:
+            if out:
+                out.close()
+
+        for item in index.stats():
+            logging.info(
+                f"索引分段 {item['segment']}: {item['count']}/{item['capacity']} 个节点，{item['size'] / 1048576:.1f}MB，估算误判率 {item['error_rate']:.6f}"
+            )
+
+    cost = time.time() - starttime
+    logging.info(f"检查完成: 总计 {total}，新节点 {fresh}，耗时 {cost:.2f}s")
+    sys.stdout.write(f"  检查 {total} 个节点，新节点 {fresh} 个，耗时 {cost:.2f}s。\n")
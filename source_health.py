@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+import json
+import logging
+import os
+import random
+import time
+
+# 平滑系数: 新样本在平均延迟 / 字节数 / 节点数中的权重
+EWMA_ALPHA = 0.3
+
+class SourceHealth:
+    """
+    订阅来源健康记录：连续失败次数、最近成功时间、平均延迟、字节数与节点产出。
+    连续失败的来源按指数退避推迟下次拉取，可拉取的来源按节点产出排序，高产来源优先
+    """
+
+    def __init__(self, path, base_backoff=3600, max_backoff=7 * 86400):
+        self.path = path
+        self.base_backoff = max(base_backoff, 60)
+        self.max_backoff = max(max_backoff, self.base_backoff)
+        self.records = {}
+        if path and os.path.isfile(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    self.records = json.load(f) or {}
+            except (ValueError, OSError) as e:
+                logging.warning(f"来源健康记录 {path} 无法读取，重新开始记录: {e}")
+                self.records = {}
+
+    def get(self, url):
+        return self.records.get(url, {})
+
+    def due(self, url, now=None):
+        now = time.time() if now is None else now
+        return self.get(url).get("next_poll", 0) <= now
+
+    def priority(self, url):
+        """未拉取过的来源优先探索，其余按平均节点数降序、平均延迟升序"""
+        record = self.get(url)
+        if not record.get("polls", 0):
+            return (0, 0, 0)
+        return (1, -record.get("links", 0), record.get("latency", 0))
+
+    def schedule(self, urls, now=None, force=False):
+        """返回 (本次需要拉取的来源, 因退避跳过的来源)，前者按优先级排序"""
+        now = time.time() if now is None else now
+        due, skipped = [], []
+        for url in urls:
+            if force or self.due(url, now):
+                due.append(url)
+            else:
+                skipped.append(url)
+        due.sort(key=self.priority)
+        return due, skipped
+
+    def record(self, url, success, latency=0, size=0, links=0, error=None, now=None):
+        now = time.time() if now is None else now
+        record = self.records.setdefault(url, {"polls": 0, "successes": 0, "failures": 0, "last_success": 0})
+        record["polls"] = record.get("polls", 0) + 1
+        record["last_attempt"] = int(now)
+        record["latency"] = self._smooth(record.get("latency"), latency)
+
+        if success:
+            record["successes"] = record.get("successes", 0) + 1
+            record["failures"] = 0
+            record["last_success"] = int(now)
+            record["bytes"] = int(self._smooth(record.get("bytes"), size))
+            record["links"] = round(self._smooth(record.get("links"), links), 1)
+            record["next_poll"] = 0
+            record.pop("error", None)
+        else:
+            record["failures"] = record.get("failures", 0) + 1
+            record["error"] = error
+            # 连续失败按指数退避，加入抖动避免大量来源在同一轮集中恢复
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (record["failures"] - 1))
+            record["next_poll"] = int(now + backoff * random.uniform(0.8, 1.0))
+        return record
+
+    @staticmethod
+    def _smooth(previous, value):
+        if previous is None:
+            return float(value)
+        return previous * (1 - EWMA_ALPHA) + float(value) * EWMA_ALPHA
+
+    def prune(self, urls):
+        """删除已不在来源列表中的记录"""
+        keep = set(urls)
+        for url in list(self.records):
+            if url not in keep:
+                del self.records[url]
+
+    def save(self):
+        if not self.path:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmpfile = f"{self.path}.tmp"
+        with open(tmpfile, "w", encoding="utf-8") as f:
+            json.dump(self.records, f, indent=2, ensure_ascii=False, sort_keys=True)
+        os.replace(tmpfile, self.path)
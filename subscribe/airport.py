@@ -216,7 +216,7 @@ class AirPort:
 
         try:
             request = urllib.request.Request(self.send_email, data=data, headers=headers, method="POST")
-            response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+            response = utils.urlopen(request, timeout=10)
             if not response or response.getcode() != 200:
                 return False
 
@@ -247,7 +247,7 @@ class AirPort:
 
         try:
             request = urllib.request.Request(self.reg, data=data, headers=headers, method="POST")
-            response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+            response = utils.urlopen(request, timeout=10)
             code = 400 if not response else response.getcode()
             if code != 200:
                 logger.error(f"[RegisterError] request error when register, domain: {self.ref}, code={code}")
@@ -344,7 +344,7 @@ class AirPort:
         try:
             proxies = []
             request = urllib.request.Request(self.fetch, headers=self.headers)
-            response = urllib.request.urlopen(request, timeout=5, context=utils.CTX)
+            response = utils.urlopen(request, timeout=5)
             if response.getcode() != 200:
                 return proxies
 
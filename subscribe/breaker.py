@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+import random
+import threading
+import time
+import urllib
+import urllib.error
+import urllib.parse
+from dataclasses import dataclass
+
+from logger import logger
+
+# circuit states
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(urllib.error.URLError):
+    """raised instead of sending a request to a host whose circuit is open"""
+
+    def __init__(self, host: str, remain: float) -> None:
+        super().__init__(f"circuit open for {host}, retry after {remain:.1f}s")
+        self.host = host
+        self.remain = remain
+
+
+@dataclass
+class RetryPolicy(object):
+    # max number of attempts, including the first one
+    attempts: int = 3
+
+    # delay before the second attempt in seconds
+    backoff: float = 0.5
+
+    # growth factor of the delay between two attempts
+    factor: float = 2.0
+
+    # upper bound of a single delay
+    max_delay: float = 10.0
+
+    # spread delays with full jitter so that workers hitting the same host do not retry in lockstep
+    jitter: bool = True
+
+    def delay(self, attempt: int) -> float:
+        """seconds to wait after the given failed attempt (1-based)"""
+        delay = min(self.max_delay, max(0, self.backoff) * (self.factor ** max(0, attempt - 1)))
+        return random.uniform(0, delay) if self.jitter else delay
+
+    def sleep(self, attempt: int) -> None:
+        delay = self.delay(attempt)
+        if delay > 0:
+            time.sleep(delay)
+
+
+@dataclass
+class Circuit(object):
+    state: str = CLOSED
+
+    # consecutive failures since the last success
+    failures: int = 0
+
+    # how many times the circuit has been opened, doubles cooldown each time
+    trips: int = 0
+
+    # timestamp when an open circuit may let a probe through
+    until: float = 0
+
+    # a half-open circuit allows only one request in flight
+    probing: bool = False
+
+    # requests rejected without touching the network
+    rejected: int = 0
+
+
+class CircuitBreaker(object):
+    """
+    Per-host circuit breaker shared by all threads of a process. After threshold consecutive failures a host
+    is opened and every request to it fails fast until cooldown expires, then a single probe is allowed
+    (half-open): success closes the circuit, failure opens it again with a doubled cooldown
+    """
+
+    def __init__(self, threshold: int = 5, cooldown: float = 30, max_cooldown: float = 600) -> None:
+        self.threshold = max(1, threshold)
+        self.cooldown = max(1, cooldown)
+        self.max_cooldown = max(self.cooldown, max_cooldown)
+        self.lock = threading.Lock()
+        self.circuits = {}
+
+    @staticmethod
+    def host(url: str) -> str:
+        try:
+            return (urllib.parse.urlsplit(url).hostname or "").lower()
+        except ValueError:
+            return ""
+
+    def allow(self, url: str) -> bool:
+        host = self.host(url)
+        if not host:
+            return True
+
+        with self.lock:
+            circuit = self.circuits.get(host, None)
+            if circuit is None or circuit.state == CLOSED:
+                return True
+
+            now = time.time()
+            if circuit.state == OPEN and now >= circuit.until:
+                circuit.state, circuit.probing = HALF_OPEN, False
+
+            if circuit.state == HALF_OPEN and not circuit.probing:
+                circuit.probing = True
+                return True
+
+            circuit.rejected += 1
+            return False
+
+    def check(self, url: str) -> None:
+        """raise CircuitOpenError if requests to the host of url are currently short-circuited"""
+        if self.allow(url):
+            return
+
+        host = self.host(url)
+        with self.lock:
+            circuit = self.circuits.get(host, Circuit())
+            remain = max(0, circuit.until - time.time())
+
+        raise CircuitOpenError(host=host, remain=remain)
+
+    def success(self, url: str) -> None:
+        host = self.host(url)
+        if not host:
+            return
+
+        with self.lock:
+            circuit = self.circuits.get(host, None)
+            if circuit is None:
+                return
+
+            if circuit.state != CLOSED:
+                logger.info(f"[CircuitBreaker] host {host} recovered, close circuit")
+
+            circuit.state, circuit.failures, circuit.trips, circuit.probing = CLOSED, 0, 0, False
+
+    def failure(self, url: str) -> None:
+        host = self.host(url)
+        if not host:
+            return
+
+        with self.lock:
+            circuit = self.circuits.setdefault(host, Circuit())
+            circuit.failures += 1
+            circuit.probing = False
+
+            if circuit.state == HALF_OPEN or circuit.failures >= self.threshold:
+                cooldown = min(self.max_cooldown, self.cooldown * (2**circuit.trips))
+                circuit.state, circuit.until = OPEN, time.time() + cooldown
+                circuit.trips += 1
+                logger.warning(
+                    f"[CircuitBreaker] open circuit for {host} after {circuit.failures} failures, cooldown: {cooldown:.0f}s"
+                )
+
+    def record(self, url: str, error: Exception = None, status: int = 200) -> None:
+        """classify a finished request, only network errors, 5xx and 429 count as host failures"""
+        if isinstance(error, CircuitOpenError):
+            return
+
+        if error is not None and not isinstance(error, urllib.error.HTTPError):
+            self.failure(url)
+        else:
+            code = error.code if isinstance(error, urllib.error.HTTPError) else status
+            if code >= 500 or code == 429:
+                self.failure(url)
+            else:
+                self.success(url)
+
+    def stats(self) -> dict[str, dict]:
+        with self.lock:
+            return {
+                host: {
+                    "state": circuit.state,
+                    "failures": circuit.failures,
+                    "trips": circuit.trips,
+                    "rejected": circuit.rejected,
+                }
+                for host, circuit in self.circuits.items()
+            }
@@ -17,6 +17,7 @@ import urllib.request
 from collections import defaultdict
 
 import executable
+import selector
 import utils
 import yaml
 
@@ -33,15 +34,24 @@ DOWNLOAD_URL = [
 EXTERNAL_CONTROLLER = "127.0.0.1:9090"
 
 
-def generate_config(path: str, proxies: list, filename: str) -> list:
+def generate_config(
+    path: str,
+    proxies: list,
+    filename: str,
+    mixed_port: int = 7890,
+    controller: str = EXTERNAL_CONTROLLER,
+    secret: str = "",
+) -> list:
     os.makedirs(path, exist_ok=True)
     external_config = filter_proxies(proxies)
     config = {
-        "mixed-port": 7890,
-        "external-controller": EXTERNAL_CONTROLLER,
+        "mixed-port": mixed_port,
+        "external-controller": controller,
         "mode": "Rule",
         "log-level": "silent",
     }
+    if secret:
+        config["secret"] = secret
 
     config.update(external_config)
     with open(os.path.join(path, filename), "w+", encoding="utf8") as f:
@@ -616,7 +626,15 @@ def verify(item: dict, mihomo: bool = True) -> bool:
         return False
 
 
-def check(proxy: dict, api_url: str, timeout: int, test_url: str, delay: int, strict: bool = False) -> bool:
+def check(
+    proxy: dict,
+    api_url: str,
+    timeout: int,
+    test_url: str,
+    delay: int,
+    strict: bool = False,
+    samples: dict = None,
+) -> bool:
     proxy_name = ""
     try:
         proxy_name = urllib.parse.quote(proxy.get("name", ""))
@@ -634,7 +652,7 @@ def check(proxy: dict, api_url: str, timeout: int, test_url: str, delay: int, st
     if strict:
         targets.append(random.choice(DOWNLOAD_URL))
     try:
-        alive, allowed = True, False
+        alive, allowed, delays = True, False, []
         for target in targets:
             target = urllib.parse.quote(target)
             url = f"{base_url}{target}"
@@ -648,7 +666,13 @@ def check(proxy: dict, api_url: str, timeout: int, test_url: str, delay: int, st
                 alive = False
                 break
 
+            delays.append(data.get("delay"))
+
         if alive:
+            # measured delays of alive nodes are kept for ranking, see selector.py
+            if samples is not None:
+                samples[selector.endpoint(proxy)] = delays
+
             # filter and check US(for speed) proxies as candidates for ChatGPT/OpenAI/New Bing/Google Bard
             proxy_name = proxy.get("name", "")
             if proxy.pop("chatgpt", False) and not proxy_name.endswith(utils.CHATGPT_FLAG):
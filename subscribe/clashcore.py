@@ -0,0 +1,262 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import utils
+import yaml
+from logger import logger
+
+import clash
+
+# port offset between two warm cores running side by side
+PORT_STEP = 10
+
+
+class ClashCore(object):
+    """
+    A long-running mihomo process whose proxies are hot-swapped through the external controller
+    (PUT /configs?force=true) instead of restarting the binary for every batch
+    """
+
+    def __init__(
+        self,
+        binpath: str,
+        workspace: str,
+        index: int = 0,
+        mixed_port: int = 7890,
+        controller_port: int = 9090,
+        secret: str = "",
+    ) -> None:
+        self.binpath = os.path.abspath(binpath)
+        self.workspace = os.path.abspath(workspace)
+        self.index = max(0, index)
+        self.mixed_port = mixed_port + self.index * PORT_STEP
+        self.controller = f"127.0.0.1:{controller_port + self.index * PORT_STEP}"
+        self.secret = utils.trim(secret)
+        self.process = None
+
+    @property
+    def api_url(self) -> str:
+        return self.controller
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def _request(self, path: str, method: str = "GET", body: dict = None, timeout: float = 5) -> tuple[int, str]:
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers["Authorization"] = f"Bearer {self.secret}"
+
+        data = None if body is None else json.dumps(body).encode("utf8")
+        request = urllib.request.Request(
+            url=f"http://{self.controller}{path}", data=data, headers=headers, method=method
+        )
+
+        try:
+            response = urllib.request.urlopen(request, timeout=timeout)
+            return response.getcode(), str(response.read(), encoding="utf8")
+        except urllib.error.HTTPError as e:
+            try:
+                message = str(e.read(), encoding="utf8")
+            except:
+                message = ""
+            return e.code, message
+        except Exception as e:
+            return -1, str(e)
+
+    def _write(self, proxies: list, filename: str) -> tuple[str, list]:
+        os.makedirs(self.workspace, exist_ok=True)
+        items = clash.generate_config(
+            path=self.workspace,
+            proxies=proxies,
+            filename=filename,
+            mixed_port=self.mixed_port,
+            controller=self.controller,
+            secret=self.secret,
+        )
+
+        return os.path.join(self.workspace, filename), items
+
+    def start(self, timeout: float = 30) -> bool:
+        """launch the core once with an empty config, returns after the controller answers"""
+        if self.alive:
+            return True
+
+        utils.chmod(self.binpath)
+
+        # bootstrap without any proxy group, mihomo refuses empty groups
+        config = {
+            "mixed-port": self.mixed_port,
+            "external-controller": self.controller,
+            "mode": "Rule",
+            "log-level": "silent",
+            "proxies": [],
+            "rules": ["MATCH,DIRECT"],
+        }
+        if self.secret:
+            config["secret"] = self.secret
+
+        os.makedirs(self.workspace, exist_ok=True)
+        filepath = os.path.join(self.workspace, f"bootstrap-{self.index}.yaml")
+        with open(filepath, "w+", encoding="utf8") as f:
+            yaml.dump(config, f, allow_unicode=True)
+
+        logger.info(f"[ClashCore] startup clash now, workspace: {self.workspace}, controller: {self.controller}")
+
+        self.process = subprocess.Popen(
+            [self.binpath, "-d", self.workspace, "-f", filepath],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        deadline = time.time() + max(timeout, 1)
+        while time.time() < deadline:
+            if not self.alive:
+                logger.error(f"[ClashCore] clash exited during startup, code: {self.process.returncode}")
+                return False
+
+            code, _ = self._request(path="/version", timeout=2)
+            if code == 200:
+                return True
+
+            time.sleep(0.2)
+
+        logger.error(f"[ClashCore] controller {self.controller} not ready after {timeout}s")
+        self.stop()
+        return False
+
+    def names(self) -> set[str]:
+        code, content = self._request(path="/proxies")
+        if code != 200:
+            return set()
+
+        try:
+            return set(json.loads(content).get("proxies", {}).keys())
+        except:
+            return set()
+
+    def reload(self, filepath: str, expected: set = None, timeout: float = 15) -> bool:
+        """swap the running config for filepath and wait until /proxies exposes the new proxy set"""
+        # core may be owned by the caller (attached by controller address only)
+        if self.process is not None and not self.alive:
+            logger.error(f"[ClashCore] clash exited unexpectedly, code: {self.process.returncode}")
+            return False
+
+        filepath = os.path.abspath(filepath)
+        code, message = self._request(
+            path="/configs?force=true", method="PUT", body={"path": filepath, "payload": ""}, timeout=timeout
+        )
+        if code not in [200, 204]:
+            logger.error(f"[ClashCore] reload config failed, code: {code}, message: {message}")
+            return False
+
+        if expected is None:
+            try:
+                with open(filepath, "r", encoding="utf8") as f:
+                    config = yaml.load(f, Loader=yaml.SafeLoader) or {}
+                expected = set(p.get("name", "") for p in config.get("proxies", []) if isinstance(p, dict))
+            except:
+                expected = set()
+
+        deadline = time.time() + max(timeout, 1)
+        while time.time() < deadline:
+            if expected.issubset(self.names()):
+                return True
+
+            time.sleep(0.2)
+
+        logger.error(f"[ClashCore] proxies not ready after reload, expected: {len(expected)}, file: {filepath}")
+        return False
+
+    def load(self, proxies: list, filename: str = "", timeout: float = 15) -> list:
+        """write proxies as a new config and hot-swap it, returns the deduplicated proxies actually loaded"""
+        filename = utils.trim(filename) or f"config-{self.index}.yaml"
+        filepath, items = self._write(proxies=proxies, filename=filename)
+
+        expected = set(p.get("name", "") for p in items if isinstance(p, dict))
+        if not self.reload(filepath=filepath, expected=expected, timeout=timeout):
+            return []
+
+        return items
+
+    def stop(self) -> None:
+        if self.process is None:
+            return
+
+        try:
+            self.process.terminate()
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        except:
+            logger.error(f"[ClashCore] terminate clash process error, controller: {self.controller}")
+
+        self.process = None
+
+    def __enter__(self) -> "ClashCore":
+        self.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-c",
+        "--config",
+        type=str,
+        required=True,
+        help="config file to hot-swap into the running core",
+    )
+
+    parser.add_argument(
+        "-a",
+        "--api",
+        type=str,
+        required=False,
+        default=clash.EXTERNAL_CONTROLLER,
+        help="external controller address of the running core",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--secret",
+        type=str,
+        required=False,
+        default="",
+        help="external controller secret",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        required=False,
+        default=15,
+        help="max seconds to wait until the new proxies appear",
+    )
+
+    args = parser.parse_args()
+
+    # attach to a core launched by the caller, never spawn one here
+    core = ClashCore(binpath="", workspace=os.path.dirname(os.path.abspath(args.config)), secret=args.secret)
+    core.controller = utils.trim(args.api)
+
+    code, _ = core._request(path="/version", timeout=3)
+    if code != 200:
+        logger.error(f"[ClashCore] controller {core.controller} is unreachable")
+        sys.exit(1)
+
+    sys.exit(0 if core.reload(filepath=args.config, timeout=args.timeout) else 1)
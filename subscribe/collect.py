@@ -4,6 +4,7 @@
 # @Time    : 2022-07-15
 
 import argparse
+import base64
 import itertools
 import os
 import random
@@ -25,6 +26,8 @@ from urlvalidator import isurl
 from workflow import TaskConfig
 
 import clash
+import emitter
+import prescreen
 import subconverter
 
 PATH = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
@@ -255,7 +258,19 @@ def aggregate(args: argparse.Namespace) -> None:
     else:
         binpath = os.path.join(workspace, clash_bin)
         confif_file = "config.yaml"
-        proxies = clash.generate_config(workspace, list(proxies), confif_file)
+
+        # nodes whose endpoint refuses connections never reach clash, same defaults as the prescreen block of process
+        candidates = list(proxies)
+        if not args.bypass:
+            candidates, _ = prescreen.screen(
+                proxies=candidates,
+                concurrency=4096,
+                timeout=3,
+                tls=False,
+                cachefile=os.path.join(PATH, "data", "dns-cache.json"),
+            )
+
+        proxies = clash.generate_config(workspace, candidates, confif_file)
 
         # 可执行权限
         utils.chmod(binpath)
@@ -316,9 +331,6 @@ def aggregate(args: argparse.Namespace) -> None:
     if os.path.exists(supplier) and os.path.isfile(supplier):
         os.remove(supplier)
 
-    with open(supplier, "w+", encoding="utf8") as f:
-        yaml.dump(data, f, allow_unicode=True)
-
     if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
         os.remove(generate_conf)
 
@@ -331,21 +343,51 @@ def aggregate(args: argparse.Namespace) -> None:
         list_only = False if target == "v2ray" or target == "mixed" or "ss" in target else not args.all
         targets.append((convert_name, filename, target, list_only, args.vitiate))
 
-    for t in targets:
-        success = subconverter.generate_conf(generate_conf, t[0], source, t[1], t[2], True, t[3], t[4])
-        if not success:
-            logger.error(f"cannot generate subconverter config file for target: {t[2]}")
-            continue
+    # clash, v2ray, mixed and singbox are rendered in process, subconverter only handles the rest
+    natives = [t for t in targets if emitter.supported(target=t[2], list_only=t[3])]
+    for t in natives:
+        try:
+            content = emitter.emit(proxies=nodes, target=t[2], emoji=True, list_only=t[3], ignore_exclude=t[4])
+            if t[2] == "v2ray" or t[2] == "mixed":
+                content = base64.b64encode(content.encode(encoding="UTF8")).decode(encoding="UTF8")
 
-        if subconverter.convert(binname=subconverter_bin, artifact=t[0]):
             filepath = os.path.join(DATA_BASE, t[1])
-            shutil.move(os.path.join(PATH, "subconverter", t[1]), filepath)
+            with open(filepath, "w+", encoding="utf8") as f:
+                f.write(content)
+
+            records[t[1]] = filepath
+        except Exception as e:
+            logger.error(f"cannot render proxies for target: {t[2]}, message: {str(e)}")
+
+    others = [t for t in targets if t not in natives]
+    if others:
+        with open(supplier, "w+", encoding="utf8") as f:
+            yaml.dump(data, f, allow_unicode=True)
+
+    # one subconverter launch converts all remaining targets
+    outputs = subconverter.batch_convert(
+        binname=subconverter_bin,
+        source=source,
+        targets=[{"target": t[2], "emoji": True, "list_only": t[3], "ignore_exclude": t[4]} for t in others],
+        filepath=generate_conf,
+    )
+    for t in others:
+        if (t[2], t[3]) in outputs:
+            filepath = os.path.join(DATA_BASE, t[1])
+            shutil.move(outputs[(t[2], t[3])], filepath)
 
             records[t[1]] = filepath
 
+    workflow.cleanup(os.path.join(PATH, "subconverter"), ["generate.ini"])
+
     if len(records) > 0:
-        os.remove(supplier)
+        if os.path.exists(supplier) and os.path.isfile(supplier):
+            os.remove(supplier)
     else:
+        if not os.path.exists(supplier):
+            with open(supplier, "w+", encoding="utf8") as f:
+                yaml.dump(data, f, allow_unicode=True)
+
         logger.error(f"all targets convert failed, you can view the temporary file: {supplier}")
         sys.exit(1)
 
@@ -438,6 +480,15 @@ if __name__ == "__main__":
         help="generate full configuration for clash",
     )
 
+    parser.add_argument(
+        "-b",
+        "--bypass",
+        dest="bypass",
+        action="store_true",
+        default=False,
+        help="don't pre-screen node endpoints with raw tcp connects before usability checks",
+    )
+
     parser.add_argument(
         "-c",
         "--chuck",
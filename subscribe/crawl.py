@@ -8,7 +8,6 @@ import gzip
 import importlib
 import itertools
 import json
-import multiprocessing
 import os
 import random
 import re
@@ -23,20 +22,22 @@ import urllib
 import urllib.error
 import urllib.parse
 import urllib.request
+from concurrent import futures
 from copy import deepcopy
 from dataclasses import dataclass
 from functools import cache
-from multiprocessing.managers import ListProxy
-from multiprocessing.synchronize import Semaphore
 
 import airport
+import extractor
 import push
 import utils
 import workflow
 import yaml
 from logger import logger
 from origin import Origin
+from pagecache import PageCache
 from urlvalidator import isurl
+from workerpool import WorkerPool
 from yaml.constructor import ConstructorError
 
 SEPARATOR = "-"
@@ -62,6 +63,18 @@ SINGLE_LINK_FLAG = "singlelink://"
 # environment key
 SINGLE_PROXIES_ENV_NAME = "ALLOW_SINGLE_LINK"
 
+# validators and extracted subscriptions of crawled pages
+PAGE_CACHE_FILE = "page-cache.json"
+
+# enabled by batch_crawl, pages are downloaded unconditionally when it is None
+PAGE_CACHE: PageCache = None
+
+# default wall-clock limit of a crawl script in seconds
+SCRIPT_TIMEOUT = 1800
+
+# worker processes executing crawl scripts, created on first use and kept for the process lifetime
+SCRIPT_POOL: WorkerPool = None
+
 
 @cache
 def allow_single_link() -> bool:
@@ -137,43 +150,41 @@ def batch_crawl(conf: dict, num_threads: int = 50, display: bool = True) -> list
         # save it to environment
         os.environ[SINGLE_PROXIES_ENV_NAME] = str(allow).lower()
 
+        # reuse subscriptions extracted from pages that have not changed since the last run
+        enable_cache(conf.get("cache", {}))
+
         records, threshold = {}, conf.get("threshold", 1)
 
+        # spider families run concurrently, each one is parallel inside itself as well
+        families = {}
+
         if connectable:
             # Google
             google_spider = conf.get("google", {})
             if google_spider:
-                push_to = google_spider.get("push_to", [])
-                exclude = google_spider.get("exclude", "")
-                notinurl = google_spider.get("notinurl", [])
-                qdr = int(google_spider.get("qdr", 7))
-                limits = int(google_spider.get("limits", 100))
-                records.update(
-                    crawl_google(
-                        qdr=qdr,
-                        push_to=push_to,
-                        exclude=exclude,
-                        limits=limits,
-                        notinurl=notinurl,
-                    )
+                families["google"] = (
+                    crawl_google,
+                    {
+                        "qdr": int(google_spider.get("qdr", 7)),
+                        "push_to": google_spider.get("push_to", []),
+                        "exclude": google_spider.get("exclude", ""),
+                        "limits": int(google_spider.get("limits", 100)),
+                        "notinurl": google_spider.get("notinurl", []),
+                    },
                 )
 
             # yanex
             yandex_spider = conf.get("yandex", {})
             if yandex_spider:
-                push_to = yandex_spider.get("push_to", [])
-                exclude = yandex_spider.get("exclude", "")
-                notinurl = yandex_spider.get("notinurl", [])
-                within = int(yandex_spider.get("within", 2))
-                pages = int(yandex_spider.get("pages", 5))
-                records.update(
-                    crawl_yandex(
-                        within=within,
-                        push_to=push_to,
-                        exclude=exclude,
-                        pages=pages,
-                        notinurl=notinurl,
-                    )
+                families["yandex"] = (
+                    crawl_yandex,
+                    {
+                        "within": int(yandex_spider.get("within", 2)),
+                        "push_to": yandex_spider.get("push_to", []),
+                        "exclude": yandex_spider.get("exclude", ""),
+                        "pages": int(yandex_spider.get("pages", 5)),
+                        "notinurl": yandex_spider.get("notinurl", []),
+                    },
                 )
 
             # Telegram
@@ -181,63 +192,77 @@ def batch_crawl(conf: dict, num_threads: int = 50, display: bool = True) -> list
             if telegram_spider and telegram_spider.get("users", {}):
                 users = telegram_spider.get("users")
                 pages = max(telegram_spider.get("pages", 1), 1)
-                records.update(crawl_telegram(users=users, pages=pages))
+                families["telegram"] = (crawl_telegram, {"users": users, "pages": pages})
 
             # Twitter
             twitter_spider = conf.get("twitter", {})
             if twitter_spider:
-                records.update(crawl_twitter(tasks=twitter_spider))
+                families["twitter"] = (crawl_twitter, {"tasks": twitter_spider})
 
         # skip crawl if mode == 2
         if mode != 2:
             # Github
             github_spider = conf.get("github", {})
             if github_spider and github_spider.get("push_to", []):
-                push_to = github_spider.get("push_to")
-                pages = github_spider.get("pages", 1)
-                exclude = github_spider.get("exclude", "")
-                spams = github_spider.get("spams", [])
-                records.update(crawl_github(limits=pages, push_to=push_to, exclude=exclude, spams=spams))
+                families["github"] = (
+                    crawl_github,
+                    {
+                        "limits": github_spider.get("pages", 1),
+                        "push_to": github_spider.get("push_to"),
+                        "exclude": github_spider.get("exclude", ""),
+                        "spams": github_spider.get("spams", []),
+                    },
+                )
 
             # Github Repository
             repositories = conf.get("repositories", {})
             if repositories:
-                records.update(crawl_github_repo(repos=repositories))
+                families["repositories"] = (crawl_github_repo, {"repos": repositories})
 
             # Page
             pages = conf.get("pages", {})
             if pages:
-                records.update(crawl_pages(pages=pages, origin=Origin.PAGE.name))
+                families["pages"] = (crawl_pages, {"pages": pages, "origin": Origin.PAGE.name})
 
             # Scripts
             scripts = conf.get("scripts", {})
             if scripts:
-                items = batch_call(scripts)
-                if items:
-                    for item in items:
-                        if not item or type(item) != dict:
-                            continue
-
-                        if item.get("saved", False):
-                            datasets.append(item)
-                            continue
-
-                        task = deepcopy(item)
-                        subs = task.pop("sub", None)
-                        checked = task.pop("checked", True)
-                        if type(subs) not in [str, list]:
-                            continue
-                        if type(subs) == str:
-                            subs = [subs]
-                        for sub in subs:
-                            if utils.isblank(sub):
-                                continue
-
-                            if checked:
-                                remark(source=task, defeat=0, discovered=True)
-                                peristedtasks[sub] = task
-                            else:
-                                records.update({sub: task})
+                families["scripts"] = (batch_call, {"tasks": scripts, "timeouts": conf.get("timeouts", {})})
+
+        # merge results as soon as a family finishes instead of waiting for the slowest one
+        for name, result in schedule_spiders(families=families, conf=conf.get("scheduler", {})):
+            if name != "scripts":
+                records.update(result or {})
+                continue
+
+            for item in result or []:
+                if not item or type(item) != dict:
+                    continue
+
+                if item.get("saved", False):
+                    datasets.append(item)
+                    continue
+
+                task = deepcopy(item)
+                subs = task.pop("sub", None)
+                checked = task.pop("checked", True)
+                if type(subs) not in [str, list]:
+                    continue
+                if type(subs) == str:
+                    subs = [subs]
+                for sub in subs:
+                    if utils.isblank(sub):
+                        continue
+
+                    if checked:
+                        remark(source=task, defeat=0, discovered=True)
+                        peristedtasks[sub] = task
+                    else:
+                        records.update({sub: task})
+
+        if PAGE_CACHE is not None:
+            PAGE_CACHE.save()
+            logger.info(f"[CrawlInfo] page cache stats: {PAGE_CACHE.stats()}")
 
         # remain
         if should_persist:
@@ -358,6 +383,74 @@ def batch_crawl(conf: dict, num_threads: int = 50, display: bool = True) -> list
     return datasets
 
 
+def enable_cache(conf: dict) -> None:
+    global PAGE_CACHE
+
+    if not conf or not isinstance(conf, dict) or not conf.get("enable", True):
+        PAGE_CACHE = None
+        return
+
+    directory = utils.trim(conf.get("directory", ""))
+    if not directory:
+        directory = os.path.join(os.path.abspath(os.path.dirname(os.path.dirname(__file__))), "data")
+
+    ttl = max(conf.get("ttl", 86400), 0)
+    PAGE_CACHE = PageCache(cachefile=os.path.join(directory, PAGE_CACHE_FILE), ttl=ttl)
+
+
+def fetch_page(url: str, extract: typing.Callable[[str], dict], headers: dict = None, params: list = None) -> dict:
+    """download a page and extract subscriptions from it, unchanged pages reuse the cached result"""
+    if PAGE_CACHE is None:
+        content = utils.http_get(url=url, headers=headers)
+        return extract(content) if content else {}
+
+    # single links are part of the extracted result
+    params = [allow_single_link()] + (params or [])
+    return PAGE_CACHE.fetch(url=url, extract=extract, headers=headers, params=params)
+
+
+def schedule_spiders(families: dict[str, tuple], conf: dict = None) -> typing.Iterator[tuple[str, typing.Any]]:
+    """
+    run spider families concurrently under one request budget and yield (name, result) in completion order,
+    conf supports 'concurrency' for the max number of in-flight requests and 'rates' for per-host requests per second
+    """
+    if not families:
+        return
+
+    conf = conf if isinstance(conf, dict) else {}
+    utils.THROTTLE.configure(concurrency=conf.get("concurrency", 64), rates=conf.get("rates", {}))
+
+    starttime, summary = time.time(), {}
+
+    def run(name: str, func: typing.Callable, params: dict) -> tuple[typing.Any, float]:
+        start = time.time()
+        try:
+            return func(**params), time.time() - start
+        except Exception:
+            logger.error(f"[CrawlError] spider {name} crawl error\n{traceback.format_exc()}")
+            return None, time.time() - start
+
+    try:
+        with futures.ThreadPoolExecutor(max_workers=len(families)) as executor:
+            tasks = {executor.submit(run, k, v[0], v[1]): k for k, v in families.items()}
+            for future in futures.as_completed(tasks):
+                name = tasks[future]
+                result, cost = future.result()
+
+                count = len(result) if isinstance(result, (dict, list)) else 0
+                summary[name] = {"count": count, "cost": round(cost, 2)}
+                logger.info(f"[CrawlInfo] spider {name} finished, found {count} items, cost: {cost:.2f}s")
+
+                yield name, result
+    finally:
+        stats = utils.THROTTLE.stats()
+        utils.THROTTLE.reset()
+
+        logger.info(
+            f"[CrawlInfo] all spiders finished, cost: {time.time() - starttime:.2f}s, summary: {summary}, throttle: {stats}"
+        )
+
+
 def crawlable() -> tuple[int, bool]:
     # 0: crawl and aggregate | 1: crawl only | 2: aggregate only
     mode = os.environ.get("WORKFLOW_MODE", "0")
@@ -398,11 +491,7 @@ def crawl_telegram_page(
         return {}
 
     limits = max(1, limits)
-    content = utils.http_get(url=url)
-    if not content:
-        return {}
-
-    return extract_subscribes(
+    extract = lambda content: extract_subscribes(
         content=content,
         push_to=pts,
         include=include,
@@ -413,6 +502,8 @@ def crawl_telegram_page(
         reversed=True,
     )
 
+    return fetch_page(url=url, extract=extract, params=[pts, include, exclude, limits, config])
+
 
 def crawl_telegram(users: dict, pages: int = 1, limits: int = 3) -> dict:
     if not users:
@@ -443,30 +534,29 @@ def crawl_single_repo(username: str, repo: str, push_to: list = [], limits: int
     limits = max(1, limits)
     url = f"https://api.github.com/repos/{username.strip()}/{repo.strip()}/commits?per_page={limits}"
 
-    content = utils.http_get(url=url)
-    if content == "":
-        return {}
-
-    try:
-        commits = json.loads(content)
+    def extract_commit(content: str) -> dict:
         collections = {}
-        for item in commits:
-            content = utils.http_get(url=item.get("url", ""))
-            if not content:
-                continue
-            commit = json.loads(content)
-            files = commit.get("files", [])
-            for file in files:
-                patch = file.get("patch", "")
-                collections.update(
-                    extract_subscribes(
-                        content=patch,
-                        push_to=push_to,
-                        source=Origin.REPO.name,
-                        exclude=exclude,
-                    )
+        for file in json.loads(content).get("files", []):
+            patch = file.get("patch", "")
+            collections.update(
+                extract_subscribes(
+                    content=patch,
+                    push_to=push_to,
+                    source=Origin.REPO.name,
+                    exclude=exclude,
                 )
+            )
         return collections
+
+    def extract_commits(content: str) -> dict:
+        # a commit never changes, cached ones are answered with 304 and cost no rate limit
+        collections = {}
+        for item in json.loads(content):
+            collections.update(fetch_page(url=item.get("url", ""), extract=extract_commit, params=[push_to, exclude]))
+        return collections
+
+    try:
+        return fetch_page(url=url, extract=extract_commits, params=[push_to, exclude])
     except:
         logger.error(f"[GithubCrawl] crawl from github error, username: {username}\trepo: {repo}")
         return {}
@@ -847,11 +937,7 @@ def crawl_single_page(
         logger.error(f"[PageCrawl] cannot crawl from page: {url}")
         return {}
 
-    content = utils.http_get(url=url, headers=headers)
-    if content == "":
-        return {}
-
-    return extract_subscribes(
+    extract = lambda content: extract_subscribes(
         content=content,
         push_to=push_to,
         include=include,
@@ -861,6 +947,8 @@ def crawl_single_page(
         nocache=nocache,
     )
 
+    return fetch_page(url=url, extract=extract, headers=headers, params=[push_to, include, exclude, config, origin, nocache])
+
 
 def crawl_pages(
     pages: dict,
@@ -899,7 +987,7 @@ def extract_twitter_cookies(retry: int = 2) -> str:
     headers = None
     try:
         request = urllib.request.Request(url="https://twitter.com/", headers=utils.DEFAULT_HTTP_HEADERS)
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         headers = response.headers
     except urllib.error.HTTPError as e:
         if e.code != 302:
@@ -1075,90 +1163,29 @@ def extract_subscribes(
     if not content:
         return {}
     try:
-        limits, collections, proxies = max(1, limits), {}, []
-        sub_regex = r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+(?:(?:(?:/index.php)?/api/v1/client/subscribe\?token=[a-zA-Z0-9]{16,32})|(?:/link/[a-zA-Z0-9]+\?(?:sub|mu|clash)=\d))"
-        extra_regex = r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+/sub\?(?:\S+)?target=\S+"
-        protocal_regex = r"(?:vmess|trojan|ss|ssr|snell|hysteria2|vless|hysteria)://[a-zA-Z0-9:.?+=@%&#_\-/]{10,}"
-
-        regex = f"{sub_regex}|{extra_regex}"
-
-        if include:
-            try:
-                if not include.startswith("|"):
-                    pattern = f"{regex}|{include}"
-                else:
-                    pattern = f"{regex}{include}"
-
-                subscribes = re.findall(pattern, content, flags=re.I)
-            except:
-                logger.error(f"[ExtractError] maybe pattern 'include' exists some problems, include: {include}")
-                subscribes = re.findall(regex, content)
-        else:
-            subscribes = re.findall(regex, content, flags=re.I)
-
-        # 去重会打乱原本按日期排序的特性一致无法优先选择离当前时间较近的元素
-        # subscribes = list(set(subscribes))
-
-        if reversed:
-            subscribes.reverse()
-
-        for sub in subscribes:
-            items = [sub]
-            # subconverter url
-            if "url=" in sub:
-                qs, items = urllib.parse.urlparse(sub.replace("&amp;", "&")).query, []
-                urls = urllib.parse.parse_qs(qs).get("url", [])
-                if not urls:
-                    continue
-
-                for url in urls:
-                    if not utils.isurl(url):
-                        if allow_single_link():
-                            proxies.extend([x for x in url.split("|") if re.match(protocal_regex, x, flags=re.I)])
-                        continue
-
-                    items.extend([x for x in url.split("|") if not re.match(extra_regex, x, flags=re.I)])
-
-            for s in items:
-                try:
-                    if include and not re.match(
-                        r"https?://(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+.*",
-                        s,
-                    ):
-                        continue
-
-                    if exclude and re.search(exclude, s):
-                        continue
-                except:
-                    logger.error(
-                        f"[ExtractError] maybe pattern 'include' or 'exclude' exists some problems, include: {include}\texclude: {exclude}"
-                    )
-
-                # 强制使用https协议
-                # s = s.replace("http://", "https://", 1).strip()
-                params = {"push_to": push_to, "origin": source, "nocache": nocache}
-                if config:
-                    params.update(config)
-                collections[s] = params
-
-            if len(collections) >= limits:
-                break
+        single_link = allow_single_link()
+        result = extractor.get(include=include, exclude=exclude).scan(
+            content=content, limits=limits, reversed=reversed, single_link=single_link
+        )
 
-        if allow_single_link():
-            try:
-                groups = re.findall(protocal_regex, content, flags=re.I)
-                if groups:
-                    proxies.extend([x.lower().strip() for x in groups if x])
-                    params = {
-                        "push_to": push_to,
-                        "origin": source,
-                        "proxies": list(set(proxies)),
-                    }
-                    if config:
-                        params.update(config)
-                    collections[SINGLE_LINK_FLAG] = params
-            except:
-                logger.error(f"[ExtractError] failed to extract single proxy")
+        collections = {}
+        for s in result.subscribes:
+            # 强制使用https协议
+            # s = s.replace("http://", "https://", 1).strip()
+            params = {"push_to": push_to, "origin": source, "nocache": nocache}
+            if config:
+                params.update(config)
+            collections[s] = params
+
+        if single_link and result.proxies:
+            params = {
+                "push_to": push_to,
+                "origin": source,
+                "proxies": list(set(result.proxies)),
+            }
+            if config:
+                params.update(config)
+            collections[SINGLE_LINK_FLAG] = params
 
         return collections
     except:
@@ -1228,6 +1255,95 @@ def remark(source: dict, defeat: int = 0, discovered: bool = True) -> None:
         source["origin"] = Origin.TEMPORARY.name
 
 
+# bytes requested by the lightweight subscription probe
+PROBE_SIZE = 4096
+
+# a clash config whose proxies list has at least one item
+PROXIES_MARKER = re.compile(r"^proxies:[ \t]*(?:\[[ \t]*\{|\r?\n(?:[ \t]*(?:#.*)?\r?\n)*[ \t]*-[ \t]+\S)", flags=re.M)
+
+
+def inspect_content(
+    content: str, subscription: str, remain: float, spare_time: float, tolerance: float
+) -> tuple[bool, bool]:
+    """decide availability and expiry from the full subscription content"""
+
+    # response text is too short, ignore
+    if len(content) < 32:
+        return False, False
+
+    if utils.isb64encode(content):
+        # parse and detect whether the subscription has expired
+        return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
+
+    try:
+        proxies = yaml.load(content, Loader=yaml.SafeLoader).get("proxies", [])
+    except ConstructorError:
+        yaml.add_multi_constructor("str", lambda loader, suffix, node: str(node.value), Loader=yaml.SafeLoader)
+        proxies = yaml.load(content, Loader=yaml.FullLoader).get("proxies", [])
+    except:
+        proxies = []
+
+    if proxies is None or len(proxies) == 0:
+        return False, True
+
+    # 根据订阅信息判断是否有效
+    return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
+
+
+def probe_status(url: str, remain: float = 0, spare_time: float = 0, tolerance: float = 0) -> tuple[bool, bool]:
+    """
+    request only the first PROBE_SIZE bytes and decide from headers plus a prefix sniff, returns
+    (available, expired) or None when inconclusive. Servers ignoring Range are read up to the prefix and dropped
+    """
+    headers = {"User-Agent": "clash.meta", "Range": f"bytes=0-{PROBE_SIZE - 1}"}
+    request = urllib.request.Request(url=url, headers=headers)
+    try:
+        response = utils.urlopen(request, timeout=10)
+    except urllib.error.HTTPError as e:
+        # some servers reject the ranged request itself (403, 405, 416...), only a missing resource is definite
+        if 400 <= e.code < 500 and e.code not in [404, 410]:
+            e.close()
+            return None
+
+        raise
+
+    try:
+        status = response.getcode()
+        if status not in [200, 206]:
+            return None
+
+        subscription = response.getheader("subscription-userinfo")
+        content_range = utils.trim(response.getheader("Content-Range", ""))
+        prefix = response.read(PROBE_SIZE + 1)
+    finally:
+        response.close()
+
+    # the probe already holds the whole body when it is shorter than the requested range
+    if status == 206:
+        total = content_range.rsplit("/", maxsplit=1)[-1]
+        size = int(total) if total.isdigit() else -1
+    else:
+        size = len(prefix) if len(prefix) <= PROBE_SIZE else -1
+
+    if size == len(prefix):
+        try:
+            content = str(prefix, encoding="utf8")
+        except UnicodeDecodeError:
+            return None
+
+        return inspect_content(content, subscription, remain, spare_time, tolerance)
+
+    # the prefix may end in the middle of a multi-byte character
+    text = str(prefix[:PROBE_SIZE], encoding="utf8", errors="ignore")
+
+    # a prefix can only prove the content is non-empty, an empty proxies list needs the full read
+    sniff = text[: len(text) - len(text) % 4]
+    if utils.isb64encode(sniff, padding=False) or PROXIES_MARKER.search(text):
+        return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
+
+    return None
+
+
 def check_status(
     url: str,
     retry: int = 2,
@@ -1235,6 +1351,7 @@ def check_status(
     spare_time: float = 0,
     tolerance: float = 0,
     connectable: bool = True,
+    probe: bool = True,
 ) -> tuple[bool, bool]:
     """
     url: subscription link
@@ -1242,43 +1359,28 @@ def check_status(
     remain: minimum remaining traffic flow
     spare_time: minimum remaining time
     tolerance: waiting time after expiration
+    probe: try a ranged request first and fall back to the full download only when it is inconclusive
     """
     if not url or retry <= 0:
         return False, connectable
 
     try:
+        if probe:
+            result = probe_status(url=url, remain=remain, spare_time=spare_time, tolerance=tolerance)
+            if result is not None:
+                return result
+
         headers = {"User-Agent": "clash.meta"}
         request = urllib.request.Request(url=url, headers=headers)
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         if response.getcode() != 200:
             return False, connectable
 
         content = str(response.read(), encoding="utf8")
 
-        # response text is too short, ignore
-        if len(content) < 32:
-            return False, False
-
         # 订阅流量信息
         subscription = response.getheader("subscription-userinfo")
-
-        if utils.isb64encode(content):
-            # parse and detect whether the subscription has expired
-            return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
-
-        try:
-            proxies = yaml.load(content, Loader=yaml.SafeLoader).get("proxies", [])
-        except ConstructorError:
-            yaml.add_multi_constructor("str", lambda loader, suffix, node: str(node.value), Loader=yaml.SafeLoader)
-            proxies = yaml.load(content, Loader=yaml.FullLoader).get("proxies", [])
-        except:
-            proxies = []
-
-        if proxies is None or len(proxies) == 0:
-            return False, True
-
-        # 根据订阅信息判断是否有效
-        return is_expired(header=subscription, remain=remain, spare_time=spare_time, tolerance=tolerance)
+        return inspect_content(content, subscription, remain, spare_time, tolerance)
     except urllib.error.HTTPError as e:
         try:
             message = str(e.read(), encoding="utf8")
@@ -1294,6 +1396,7 @@ def check_status(
                 spare_time=spare_time,
                 tolerance=tolerance,
                 connectable=connectable,
+                probe=probe,
             )
 
         return False, expired
@@ -1305,6 +1408,7 @@ def check_status(
             spare_time=spare_time,
             tolerance=tolerance,
             connectable=connectable,
+            probe=probe,
         )
 
 
@@ -1551,7 +1655,7 @@ def collect_airport(
 
         try:
             request = urllib.request.Request(url=url, headers=headers, method="GET")
-            response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+            response = utils.urlopen(request, timeout=10)
 
             return response.geturl()
         except:
@@ -1596,7 +1700,7 @@ def collect_airport(
 
             try:
                 request = urllib.request.Request(url=url, headers=utils.DEFAULT_HTTP_HEADERS, method="GET")
-                response = urllib.request.urlopen(request, timeout=6, context=utils.CTX)
+                response = utils.urlopen(request, timeout=6)
 
                 # do not redirect
                 # opener = urllib.request.build_opener(utils.NoRedirect)
@@ -1715,58 +1819,51 @@ def validate_domain(url: str, rigid: bool = True, chuck: bool = False) -> bool:
         return False
 
 
-def batch_call(tasks: dict) -> list[dict]:
+def batch_call(tasks: dict, timeouts: dict = None) -> list[dict]:
     if not tasks:
         return []
 
+    global SCRIPT_POOL
+
+    timeouts = timeouts if isinstance(timeouts, dict) else {}
     try:
-        num_thread = max(min(len(tasks), 50), 1)
-        with multiprocessing.Manager() as manager:
-            availables = manager.list()
-            processes = []
-            semaphore = multiprocessing.Semaphore(num_thread)
-            time.sleep(random.randint(1, 3))
-            for k, v in tasks.items():
-                semaphore.acquire()
-                p = multiprocessing.Process(target=call, args=(k, v, availables, semaphore))
-                p.start()
-                processes.append(p)
-            for p in processes:
-                p.join()
-
-            return list(availables)
-    except:
-        traceback.print_exc()
-        return []
+        if SCRIPT_POOL is None:
+            SCRIPT_POOL = WorkerPool(func=execute_script, size=min(len(tasks), 50), timeout=SCRIPT_TIMEOUT)
 
+        jobs = [[k, (k, v), timeouts.get(k, SCRIPT_TIMEOUT)] for k, v in tasks.items() if k]
 
-def call(script: str, params: dict, availables: ListProxy, semaphore: Semaphore) -> None:
-    try:
-        if not script:
-            return
+        availables, records, starttime = [], [], time.time()
+        for subscribes, record in SCRIPT_POOL.run(jobs=jobs):
+            records.append(record)
+            if record.error:
+                logger.error(f"[ScriptError] script: {record.name} failed, cost: {record.cost:.2f}s, reason: {record.error}")
+            elif subscribes and type(subscribes) == list:
+                availables.extend(subscribes)
 
-        subscribes = execute_script(script=script, params=params)
-        if subscribes and type(subscribes) == list:
-            availables.extend(subscribes)
-    finally:
-        if semaphore is not None and isinstance(semaphore, Semaphore):
-            semaphore.release()
+        failed = [r.name for r in records if r.error]
+        logger.info(
+            f"[ScriptInfo] finished execute {len(records)} scripts, failed: {len(failed)}, found {len(availables)} items, cost: {time.time() - starttime:.2f}s, details: {[vars(r) for r in records]}"
+        )
+
+        return availables
+    except:
+        traceback.print_exc()
+        return []
 
 
 def execute_script(script: str, params: dict = {}) -> list[dict]:
+    """run a crawl script in a worker of SCRIPT_POOL, failures are raised so the pool records their reason"""
     try:
         # format: a.b.c#function or a-b.c#_function or a#function and so on
         regex = r"^([a-zA-Z0-9_]+|([0-9a-zA-Z_]+([a-zA-Z0-9_\-]+)?\.)+)[a-zA-Z0-9_\-]+#[a-zA-Z_]+[0-9a-zA-Z_]+$"
         if not re.match(regex, script):
-            logger.info(f"[ScriptError] script execute error because script: {script} is invalidate")
-            return []
+            raise ValueError(f"script: {script} is invalidate")
 
         path, func_name = script.split("#", maxsplit=1)
         path = f"scripts.{path}"
         module = importlib.import_module(path)
         if not hasattr(module, func_name):
-            logger.error(f"script: {path} not exists function {func_name}")
-            return []
+            raise AttributeError(f"script: {path} not exists function {func_name}")
 
         func = getattr(module, func_name)
 
@@ -1775,8 +1872,7 @@ def execute_script(script: str, params: dict = {}) -> list[dict]:
 
         subscribes = func(params)
         if type(subscribes) != list:
-            logger.error(f"[ScriptError] return value error, need a list, but got a {type(subscribes)}")
-            return []
+            raise TypeError(f"return value error, need a list, but got a {type(subscribes)}")
 
         endtime = time.time()
         logger.info(
@@ -1785,6 +1881,6 @@ def execute_script(script: str, params: dict = {}) -> list[dict]:
 
         subscribes = [s for s in subscribes if type(s) == dict and s.get("push_to", [])]
         return subscribes
-    except:
+    except Exception:
         logger.error(f"[ScriptError] occur error run script: {script}, message: \n{traceback.format_exc()}")
-        return []
+        raise
@@ -0,0 +1,440 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import json
+import os
+import re
+import urllib
+import urllib.parse
+from copy import deepcopy
+from functools import cache
+
+import utils
+import yaml
+from logger import logger
+
+PATH = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
+
+# targets rendered in process, the rest are still converted by subconverter
+NATIVE_TARGETS = set(["clash", "v2ray", "mixed", "singbox"])
+
+# proxy types kept by each share link target
+LINK_TYPES = {
+    "v2ray": set(["vmess", "vless"]),
+    "mixed": set(["ss", "ssr", "vmess", "vless", "trojan", "hysteria", "hysteria2", "tuic"]),
+}
+
+# same as the 'exclude' written to generate.ini when rules of subconverter are ignored
+LOOSE_EXCLUDE = "(流量|过期|剩余|时间|Expire|Traffic)"
+
+# leading flags and pictographs removed before a new emoji is added, like remove_old_emoji of subconverter
+OLD_EMOJI = re.compile(r"^(?:[\U0001F1E6-\U0001F1FF]{2}|[\U0001F300-\U0001FAFF\u2600-\u27BF][\uFE0F\u200D\U0001F300-\U0001FAFF]*)\s*")
+
+
+def supported(target: str, list_only: bool = True) -> bool:
+    """whether the target can be rendered without subconverter, full clash and singbox profiles need its rule templates"""
+    target = utils.trim(target).lower()
+    if target in LINK_TYPES:
+        return True
+
+    return target in NATIVE_TARGETS and list_only
+
+
+@cache
+def exclude_pattern(ignore_exclude: bool = False) -> re.Pattern:
+    """node remarks filter, the same one subconverter applies from pref.toml"""
+    if ignore_exclude:
+        return re.compile(LOOSE_EXCLUDE, flags=re.I)
+
+    filepath = os.path.join(PATH, "subconverter", "pref.toml")
+    try:
+        with open(filepath, "r", encoding="utf8") as f:
+            for line in f.readlines():
+                line = line.strip()
+                if line.startswith("exclude_remarks"):
+                    patterns = json.loads(line.split("=", maxsplit=1)[1].strip())
+                    return re.compile("|".join(patterns))
+    except Exception:
+        logger.warning(f"[Emitter] cannot load exclude_remarks from {filepath}, use default pattern")
+
+    return re.compile(LOOSE_EXCLUDE, flags=re.I)
+
+
+@cache
+def emoji_patterns() -> dict:
+    return utils.load_emoji_pattern()
+
+
+def prepare(proxies: list[dict], emoji: bool = True, ignore_exclude: bool = False) -> list[dict]:
+    """filter out informational nodes and prefix region emojis, proxies given are left untouched"""
+    pattern, patterns = exclude_pattern(ignore_exclude), emoji_patterns() if emoji else {}
+
+    nodes = []
+    for proxy in proxies:
+        if not proxy or not isinstance(proxy, dict):
+            continue
+
+        name = str(proxy.get("name", "")).strip()
+        if not name or pattern.search(name):
+            continue
+
+        node = deepcopy(proxy)
+        if emoji:
+            name = OLD_EMOJI.sub("", name)
+            flag = utils.get_emoji(text=name, patterns=patterns)
+            node["name"] = f"{flag} {name}" if flag else name
+
+        nodes.append(node)
+
+    return nodes
+
+
+def b64encode(text: str, urlsafe: bool = False, padding: bool = True) -> str:
+    data = text.encode("utf8")
+    content = base64.urlsafe_b64encode(data) if urlsafe else base64.b64encode(data)
+    content = content.decode("utf8")
+    return content if padding else content.rstrip("=")
+
+
+def truthy(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in ["true", "1"]
+
+    return bool(value)
+
+
+def first(value, default: str = "") -> str:
+    """scalar of a value that may be a list, e.g. h2-opts.host or http-opts.path"""
+    if isinstance(value, (list, tuple)):
+        return str(value[0]) if value else default
+
+    return default if value is None else str(value)
+
+
+def transport(proxy: dict) -> tuple[str, str, str]:
+    """(network, host, path) of v2ray style transports, path carries the service name for grpc"""
+    network = utils.trim(proxy.get("network", "")) or "tcp"
+    host, path = "", ""
+
+    if network == "ws":
+        opts = proxy.get("ws-opts", {}) or {}
+        headers = opts.get("headers", {}) or {}
+        host, path = first(headers.get("Host", "")), first(opts.get("path", ""))
+    elif network == "grpc":
+        opts = proxy.get("grpc-opts", {}) or {}
+        path = first(opts.get("grpc-service-name", ""))
+    elif network == "h2":
+        opts = proxy.get("h2-opts", {}) or {}
+        host, path = first(opts.get("host", "")), first(opts.get("path", ""))
+    elif network == "http":
+        opts = proxy.get("http-opts", {}) or {}
+        headers = opts.get("headers", {}) or {}
+        host, path = first(headers.get("Host", "")), first(opts.get("path", ""))
+
+    return network, host, path
+
+
+def query(params: dict) -> str:
+    return urllib.parse.urlencode({k: v for k, v in params.items() if v not in [None, "", False]}, safe="/:")
+
+
+def ss_plugin(proxy: dict) -> tuple[str, str]:
+    """(plugin, options) in the SIP003 format shared by share links and sing-box"""
+    plugin, opts = utils.trim(proxy.get("plugin", "")), proxy.get("plugin-opts", {}) or {}
+    if plugin == "obfs":
+        options = [f"obfs={opts.get('mode', 'http')}"]
+        if opts.get("host", ""):
+            options.append(f"obfs-host={opts.get('host')}")
+        return "obfs-local", ";".join(options)
+    elif plugin == "v2ray-plugin":
+        options = [f"mode={opts.get('mode', 'websocket')}"]
+        if opts.get("host", ""):
+            options.append(f"host={opts.get('host')}")
+        if opts.get("path", ""):
+            options.append(f"path={opts.get('path')}")
+        if truthy(opts.get("tls", False)):
+            options.append("tls")
+        return "v2ray-plugin", ";".join(options)
+
+    return "", ""
+
+
+def to_link(proxy: dict) -> str:
+    """share link of a clash proxy, empty when the type has no link format"""
+    kind = utils.trim(proxy.get("type", "")).lower()
+    name = urllib.parse.quote(str(proxy.get("name", "")), safe="")
+    server, port = proxy.get("server", ""), proxy.get("port", "")
+    address = f"[{server}]" if ":" in str(server) else server
+    insecure = truthy(proxy.get("skip-cert-verify", False))
+
+    if kind == "ss":
+        userinfo = b64encode(f"{proxy.get('cipher', '')}:{proxy.get('password', '')}", urlsafe=True, padding=False)
+        plugin, options = ss_plugin(proxy)
+        suffix = f"/?plugin={urllib.parse.quote(f'{plugin};{options}')}" if plugin else ""
+        return f"ss://{userinfo}@{address}:{port}{suffix}#{name}"
+
+    if kind == "ssr":
+        params = query(
+            {
+                "obfsparam": b64encode(str(proxy.get("obfs-param", "") or ""), urlsafe=True, padding=False),
+                "protoparam": b64encode(str(proxy.get("protocol-param", "") or ""), urlsafe=True, padding=False),
+                "remarks": b64encode(str(proxy.get("name", "")), urlsafe=True, padding=False),
+            }
+        )
+        password = b64encode(str(proxy.get("password", "")), urlsafe=True, padding=False)
+        body = f"{server}:{port}:{proxy.get('protocol', '')}:{proxy.get('cipher', '')}:{proxy.get('obfs', '')}:{password}/?{params}"
+        return "ssr://" + b64encode(body, urlsafe=True, padding=False)
+
+    if kind == "vmess":
+        network, host, path = transport(proxy)
+        item = {
+            "v": "2",
+            "ps": str(proxy.get("name", "")),
+            "add": server,
+            "port": str(port),
+            "id": proxy.get("uuid", ""),
+            "aid": str(proxy.get("alterId", 0)),
+            "scy": proxy.get("cipher", "auto"),
+            "net": network,
+            "type": "none",
+            "host": host,
+            "path": path,
+            "tls": "tls" if truthy(proxy.get("tls", False)) else "",
+            "sni": proxy.get("servername", ""),
+            "fp": proxy.get("client-fingerprint", ""),
+        }
+        return "vmess://" + b64encode(json.dumps(item, ensure_ascii=False, separators=(",", ":")))
+
+    if kind == "vless":
+        network, host, path = transport(proxy)
+        reality = proxy.get("reality-opts", {}) or {}
+        security = "reality" if reality else ("tls" if truthy(proxy.get("tls", False)) else "none")
+        params = query(
+            {
+                "encryption": "none",
+                "security": security,
+                "sni": proxy.get("servername", ""),
+                "fp": proxy.get("client-fingerprint", ""),
+                "pbk": reality.get("public-key", ""),
+                "sid": reality.get("short-id", ""),
+                "flow": proxy.get("flow", ""),
+                "type": network,
+                "host": host,
+                "path": path if network != "grpc" else "",
+                "serviceName": path if network == "grpc" else "",
+                "allowInsecure": "1" if insecure else "",
+            }
+        )
+        return f"vless://{proxy.get('uuid', '')}@{address}:{port}?{params}#{name}"
+
+    if kind == "trojan":
+        network, host, path = transport(proxy)
+        params = query(
+            {
+                "sni": proxy.get("sni", ""),
+                "fp": proxy.get("client-fingerprint", ""),
+                "type": network if network != "tcp" else "",
+                "host": host,
+                "path": path if network != "grpc" else "",
+                "serviceName": path if network == "grpc" else "",
+                "allowInsecure": "1" if insecure else "",
+            }
+        )
+        password = urllib.parse.quote(str(proxy.get("password", "")), safe="")
+        return f"trojan://{password}@{address}:{port}" + (f"?{params}" if params else "") + f"#{name}"
+
+    if kind == "hysteria2":
+        params = query(
+            {
+                "sni": proxy.get("sni", ""),
+                "obfs": proxy.get("obfs", ""),
+                "obfs-password": proxy.get("obfs-password", ""),
+                "insecure": "1" if insecure else "",
+            }
+        )
+        password = urllib.parse.quote(str(proxy.get("password", "") or proxy.get("auth", "")), safe="")
+        return f"hysteria2://{password}@{address}:{port}" + (f"?{params}" if params else "") + f"#{name}"
+
+    if kind == "hysteria":
+        params = query(
+            {
+                "protocol": proxy.get("protocol", ""),
+                "auth": proxy.get("auth-str", "") or proxy.get("auth_str", ""),
+                "peer": proxy.get("sni", ""),
+                "insecure": "1" if insecure else "",
+                "upmbps": str(proxy.get("up", "")).split(" ")[0],
+                "downmbps": str(proxy.get("down", "")).split(" ")[0],
+                "alpn": ",".join(proxy.get("alpn", []) or []),
+                "obfs": proxy.get("obfs", ""),
+            }
+        )
+        return f"hysteria://{address}:{port}?{params}#{name}"
+
+    if kind == "tuic":
+        params = query(
+            {
+                "congestion_control": proxy.get("congestion-controller", ""),
+                "udp_relay_mode": proxy.get("udp-relay-mode", ""),
+                "alpn": ",".join(proxy.get("alpn", []) or []),
+                "sni": proxy.get("sni", ""),
+                "allow_insecure": "1" if insecure else "",
+            }
+        )
+        userinfo = f"{proxy.get('uuid', '')}:{urllib.parse.quote(str(proxy.get('password', '')), safe='')}"
+        return f"tuic://{userinfo}@{address}:{port}?{params}#{name}"
+
+    return ""
+
+
+def tls_options(proxy: dict, enabled: bool, server_name: str = "") -> dict:
+    if not enabled:
+        return {}
+
+    tls = {"enabled": True, "insecure": truthy(proxy.get("skip-cert-verify", False))}
+    if server_name:
+        tls["server_name"] = server_name
+
+    alpn = proxy.get("alpn", [])
+    if alpn:
+        tls["alpn"] = alpn if isinstance(alpn, list) else [alpn]
+
+    fingerprint = proxy.get("client-fingerprint", "")
+    if fingerprint:
+        tls["utls"] = {"enabled": True, "fingerprint": fingerprint}
+
+    reality = proxy.get("reality-opts", {}) or {}
+    if reality:
+        tls["reality"] = {
+            "enabled": True,
+            "public_key": reality.get("public-key", ""),
+            "short_id": reality.get("short-id", ""),
+        }
+
+    return tls
+
+
+def transport_options(proxy: dict) -> dict:
+    network, host, path = transport(proxy)
+    if network == "ws":
+        item = {"type": "ws", "path": path or "/"}
+        if host:
+            item["headers"] = {"Host": host}
+        return item
+    elif network == "grpc":
+        return {"type": "grpc", "service_name": path}
+    elif network in ["h2", "http"]:
+        item = {"type": "http", "path": path or "/"}
+        if host:
+            item["host"] = [host]
+        return item
+
+    return {}
+
+
+def to_outbound(proxy: dict) -> dict:
+    """sing-box outbound of a clash proxy, empty when sing-box does not support the type"""
+    kind = utils.trim(proxy.get("type", "")).lower()
+    try:
+        port = int(proxy.get("port", 0))
+    except (TypeError, ValueError):
+        return {}
+
+    outbound = {"type": "", "tag": str(proxy.get("name", "")), "server": proxy.get("server", ""), "server_port": port}
+
+    if kind == "ss":
+        outbound.update(
+            {"type": "shadowsocks", "method": proxy.get("cipher", ""), "password": str(proxy.get("password", ""))}
+        )
+        plugin, options = ss_plugin(proxy)
+        if plugin:
+            outbound.update({"plugin": plugin, "plugin_opts": options})
+    elif kind == "vmess":
+        outbound.update(
+            {
+                "type": "vmess",
+                "uuid": proxy.get("uuid", ""),
+                "security": proxy.get("cipher", "auto"),
+                "alter_id": int(proxy.get("alterId", 0) or 0),
+            }
+        )
+        tls = tls_options(proxy, truthy(proxy.get("tls", False)), proxy.get("servername", ""))
+    elif kind == "vless":
+        outbound.update({"type": "vless", "uuid": proxy.get("uuid", "")})
+        if proxy.get("flow", ""):
+            outbound["flow"] = proxy.get("flow")
+        enabled = truthy(proxy.get("tls", False)) or bool(proxy.get("reality-opts", {}))
+        tls = tls_options(proxy, enabled, proxy.get("servername", ""))
+    elif kind == "trojan":
+        outbound.update({"type": "trojan", "password": str(proxy.get("password", ""))})
+        tls = tls_options(proxy, True, proxy.get("sni", ""))
+    elif kind == "hysteria2":
+        outbound.update({"type": "hysteria2", "password": str(proxy.get("password", "") or proxy.get("auth", ""))})
+        if proxy.get("obfs", ""):
+            outbound["obfs"] = {"type": proxy.get("obfs"), "password": str(proxy.get("obfs-password", ""))}
+        tls = tls_options(proxy, True, proxy.get("sni", ""))
+    elif kind == "hysteria":
+        outbound.update({"type": "hysteria", "auth_str": str(proxy.get("auth-str", "") or proxy.get("auth_str", ""))})
+        for key, field in [("up", "up_mbps"), ("down", "down_mbps")]:
+            speed = re.match(r"^\d+", str(proxy.get(key, "")))
+            if speed:
+                outbound[field] = int(speed.group(0))
+        if proxy.get("obfs", ""):
+            outbound["obfs"] = proxy.get("obfs")
+        tls = tls_options(proxy, True, proxy.get("sni", ""))
+    elif kind == "tuic":
+        outbound.update(
+            {
+                "type": "tuic",
+                "uuid": proxy.get("uuid", ""),
+                "password": str(proxy.get("password", "")),
+                "congestion_control": proxy.get("congestion-controller", "") or "cubic",
+                "udp_relay_mode": proxy.get("udp-relay-mode", "") or "native",
+            }
+        )
+        tls = tls_options(proxy, True, proxy.get("sni", ""))
+    elif kind in ["socks5", "http"]:
+        outbound.update({"type": "socks" if kind == "socks5" else "http"})
+        if proxy.get("username", ""):
+            outbound.update({"username": str(proxy.get("username")), "password": str(proxy.get("password", ""))})
+        tls = tls_options(proxy, kind == "http" and truthy(proxy.get("tls", False)), proxy.get("sni", ""))
+    else:
+        return {}
+
+    if kind != "ss" and tls:
+        outbound["tls"] = tls
+
+    if kind in ["vmess", "vless", "trojan"]:
+        options = transport_options(proxy)
+        if options:
+            outbound["transport"] = options
+
+    return outbound
+
+
+def emit(
+    proxies: list[dict],
+    target: str,
+    emoji: bool = True,
+    list_only: bool = True,
+    ignore_exclude: bool = False,
+) -> str:
+    """
+    render proxies for a native target: clash proxies yaml, v2ray and mixed share link lists or sing-box outbounds json.
+    Share link lists are returned in plain text, the caller base64 encodes them like subconverter output
+    """
+    target = utils.trim(target).lower()
+    if not supported(target=target, list_only=list_only):
+        raise ValueError(f"target {target} cannot be rendered natively, list: {list_only}")
+
+    nodes = prepare(proxies=proxies, emoji=emoji, ignore_exclude=ignore_exclude)
+
+    if target == "clash":
+        return yaml.dump({"proxies": nodes}, allow_unicode=True)
+
+    if target == "singbox":
+        outbounds = [x for x in [to_outbound(p) for p in nodes] if x]
+        return json.dumps({"outbounds": outbounds}, ensure_ascii=False, indent=2)
+
+    types = LINK_TYPES.get(target)
+    links = [to_link(p) for p in nodes if utils.trim(p.get("type", "")).lower() in types]
+    return "\n".join([x for x in links if x])
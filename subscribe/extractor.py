@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+import re
+import sys
+import urllib
+import urllib.parse
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+from logger import logger
+from urlvalidator import isurl
+
+# domain part shared by all subscription patterns
+DOMAIN = r"(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+"
+
+# airport subscription path: v2board token or sspanel link
+SUBSCRIBE_PATH = r"(?:(?:(?:/index.php)?/api/v1/client/subscribe\?token=[a-zA-Z0-9]{16,32})|(?:/link/[a-zA-Z0-9]+\?(?:sub|mu|clash)=\d))"
+
+SUBSCRIBE_REGEX = rf"https?://{DOMAIN}{SUBSCRIBE_PATH}"
+SUBCONVERTER_REGEX = rf"https?://{DOMAIN}/sub\?(?:\S+)?target=\S+"
+SHARE_LINK_REGEX = r"(?:vmess|trojan|ss|ssr|snell|hysteria2|vless|hysteria)://[a-zA-Z0-9:.?+=@%&#_\-/]{10,}"
+
+# compiled once per process and reused by crawl and scripts
+SUBSCRIBE = re.compile(SUBSCRIBE_REGEX, flags=re.I)
+
+# subscription whose scheme may be omitted, e.g. in shared plain text
+SUBSCRIBE_LOOSE = re.compile(rf"(?:https?://)?{DOMAIN}{SUBSCRIBE_PATH}", flags=re.I)
+SUBCONVERTER = re.compile(SUBCONVERTER_REGEX, flags=re.I)
+SHARE_LINK = re.compile(SHARE_LINK_REGEX, flags=re.I)
+HTTP_URL = re.compile(rf"https?://{DOMAIN}.*")
+
+# one http(s) url per line
+URL_LINE = re.compile(r"^https?:\/\/[^\s]+", flags=re.M)
+
+
+@dataclass
+class Extracted(object):
+    # subscription urls in the order they appear
+    subscribes: list[str] = field(default_factory=list)
+
+    # single share links found in the page or unpacked from subconverter urls
+    proxies: list[str] = field(default_factory=list)
+
+
+class Extractor(object):
+    """
+    Single-pass link scanner built once per (include, exclude) pair. Subscriptions, subconverter urls
+    and share links are matched by one alternation and classified by the named group that matched
+    """
+
+    def __init__(self, include: str = "", exclude: str = "") -> None:
+        self.include = include or ""
+        self.exclude = None
+
+        alternatives = [f"(?P<sub>{SUBSCRIBE_REGEX})", f"(?P<conv>{SUBCONVERTER_REGEX})"]
+        custom = self.include.removeprefix("|")
+        if custom:
+            try:
+                re.compile(custom, flags=re.I)
+                alternatives.append(f"(?P<custom>{custom})")
+            except re.error:
+                logger.error(f"[ExtractError] maybe pattern 'include' exists some problems, include: {include}")
+                self.include = ""
+
+        alternatives.append(f"(?P<link>{SHARE_LINK_REGEX})")
+        self.pattern = re.compile("|".join(alternatives), flags=re.I)
+
+        if exclude:
+            try:
+                self.exclude = re.compile(exclude)
+            except re.error:
+                logger.error(f"[ExtractError] maybe pattern 'exclude' exists some problems, exclude: {exclude}")
+
+    def accept(self, url: str) -> bool:
+        if self.include and not HTTP_URL.match(url):
+            return False
+
+        return not (self.exclude and self.exclude.search(url))
+
+    def unpack(self, url: str, single_link: bool = False) -> tuple[list[str], list[str]]:
+        """split a subconverter url into the subscriptions and share links carried by its url= parameter"""
+        qs = urllib.parse.urlparse(url.replace("&amp;", "&")).query
+        subscribes, proxies = [], []
+        for item in urllib.parse.parse_qs(qs).get("url", []):
+            if not isurl(item):
+                if single_link:
+                    proxies.extend([x for x in item.split("|") if SHARE_LINK.match(x)])
+                continue
+
+            subscribes.extend([x for x in item.split("|") if not SUBCONVERTER.match(x)])
+
+        return subscribes, proxies
+
+    def scan(
+        self,
+        content: str,
+        limits: int = sys.maxsize,
+        reversed: bool = False,
+        single_link: bool = False,
+    ) -> Extracted:
+        result = Extracted()
+        if not content:
+            return result
+
+        limits, candidates = max(1, limits), []
+        for match in self.pattern.finditer(content):
+            kind = match.lastgroup
+            if kind == "link":
+                if single_link:
+                    # keep the historical normalization of page-level share links
+                    result.proxies.append(match.group(0).lower().strip())
+            else:
+                candidates.append(match.group(0))
+
+        # keep the page order, callers prefer the newest items on date-sorted pages
+        if reversed:
+            candidates.reverse()
+
+        seen = set()
+        for candidate in candidates:
+            items = [candidate]
+            if "url=" in candidate:
+                items, proxies = self.unpack(candidate, single_link=single_link)
+                result.proxies.extend(proxies)
+
+            for item in items:
+                if item in seen or not self.accept(item):
+                    continue
+
+                seen.add(item)
+                result.subscribes.append(item)
+
+            if len(result.subscribes) >= limits:
+                break
+
+        return result
+
+
+@lru_cache(maxsize=64)
+def get(include: str = "", exclude: str = "") -> Extractor:
+    """extractor compiled for the given include/exclude patterns, cached for the lifetime of the process"""
+    return Extractor(include=include, exclude=exclude)
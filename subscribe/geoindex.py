@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+import bisect
+import hashlib
+import ipaddress
+import json
+import os
+import time
+import typing
+
+from logger import logger
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def country_name(record: dict) -> str:
+    """same label as geoip2 reader.country(ip).country.names['zh-CN']"""
+    if not isinstance(record, dict):
+        return ""
+
+    return ((record.get("country") or {}).get("names") or {}).get("zh-CN", "")
+
+
+def file_hash(filepath: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+class GeoIndex(object):
+    """
+    Range index of a mmdb file: the search tree is walked once into sorted (start, end, label) arrays per
+    address family, adjacent networks with the same label are merged, and batches of addresses are resolved
+    with searchsorted when numpy is available or bisect otherwise. The arrays are cached on disk next to the
+    database and keyed by its content hash, so the walk only happens when the mmdb file changes
+    """
+
+    def __init__(self, labels: list[str], ranges: dict[int, tuple[list[int], list[int], list[int]]]) -> None:
+        # distinct labels, ranges refer to them by position
+        self.labels = labels
+
+        # ip version -> (starts, ends, label indexes) sorted by start
+        self.ranges = {}
+        for version, (starts, ends, codes) in ranges.items():
+            if np is not None:
+                # 128-bit keys are compared as big-endian bytes, which keeps the numeric order
+                dtype = np.uint64 if version == 4 else "S16"
+                starts = np.array([self._key(x, version) for x in starts], dtype=dtype)
+                ends = np.array([self._key(x, version) for x in ends], dtype=dtype)
+                codes = np.array(codes, dtype=np.int32)
+
+            self.ranges[version] = (starts, ends, codes)
+
+    @staticmethod
+    def _key(value: int, version: int) -> typing.Any:
+        if np is None or version == 4:
+            return value
+
+        return value.to_bytes(16, "big")
+
+    @classmethod
+    def walk(cls, filepath: str, label: typing.Callable[[dict], str] = country_name) -> "GeoIndex":
+        import maxminddb
+
+        labels, positions = [], {}
+        ranges = {4: ([], [], []), 6: ([], [], [])}
+
+        with maxminddb.open_database(filepath) as reader:
+            for network, record in reader:
+                name = label(record)
+                if not name:
+                    continue
+
+                code = positions.get(name, None)
+                if code is None:
+                    code = positions[name] = len(labels)
+                    labels.append(name)
+
+                starts, ends, codes = ranges[network.version]
+                start, end = int(network.network_address), int(network.broadcast_address)
+
+                # networks come out of the tree in address order, merge contiguous ones with the same label
+                if codes and codes[-1] == code and ends[-1] + 1 == start:
+                    ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+                    codes.append(code)
+
+        return cls(labels=labels, ranges=ranges)
+
+    @classmethod
+    def load(
+        cls,
+        filepath: str,
+        cachedir: str = "",
+        kind: str = "country",
+        label: typing.Callable[[dict], str] = country_name,
+    ) -> "GeoIndex":
+        """index of filepath, built from the database or read from the cache, None when it cannot be built"""
+        if not filepath or not os.path.isfile(filepath):
+            return None
+
+        try:
+            digest = file_hash(filepath)
+        except Exception:
+            logger.error(f"[GeoIndex] cannot read mmdb file: {filepath}")
+            return None
+
+        cachedir = cachedir or os.path.dirname(os.path.abspath(filepath))
+        cachefile = os.path.join(cachedir, f"{os.path.basename(filepath)}.{kind}.{digest}.json")
+
+        if os.path.isfile(cachefile):
+            try:
+                with open(cachefile, "r", encoding="utf8") as f:
+                    data = json.load(f)
+
+                ranges = {int(k): tuple(v) for k, v in data.get("ranges", {}).items()}
+                return cls(labels=data.get("labels", []), ranges=ranges)
+            except Exception:
+                logger.warning(f"[GeoIndex] ignore broken index cache: {cachefile}")
+
+        starttime = time.time()
+        try:
+            index = cls.walk(filepath=filepath, label=label)
+        except Exception as e:
+            # old maxminddb releases cannot iterate the search tree
+            logger.error(f"[GeoIndex] cannot build range index for {filepath}, message: {str(e)}")
+            return None
+
+        logger.info(
+            f"[GeoIndex] built range index for {os.path.basename(filepath)}, ranges: {index.size()}, cost: {time.time()-starttime:.2f}s"
+        )
+
+        try:
+            os.makedirs(cachedir, exist_ok=True)
+
+            # indexes of older databases are useless once the file changed
+            prefix = f"{os.path.basename(filepath)}.{kind}."
+            for name in os.listdir(cachedir):
+                if name.startswith(prefix) and name.endswith(".json"):
+                    os.remove(os.path.join(cachedir, name))
+
+            tmpfile = f"{cachefile}.tmp"
+            with open(tmpfile, "w+", encoding="utf8") as f:
+                json.dump({"labels": index.labels, "ranges": index.export()}, f, ensure_ascii=False)
+            os.replace(tmpfile, cachefile)
+        except Exception:
+            logger.warning(f"[GeoIndex] cannot save index cache to {cachefile}")
+
+        return index
+
+    def export(self) -> dict[int, list[list[int]]]:
+        data = {}
+        for version, (starts, ends, codes) in self.ranges.items():
+            if np is None:
+                data[version] = [list(starts), list(ends), list(codes)]
+            elif version == 4:
+                data[version] = [starts.tolist(), ends.tolist(), codes.tolist()]
+            else:
+                data[version] = [
+                    [int.from_bytes(x.ljust(16, b"\x00"), "big") for x in starts.tolist()],
+                    [int.from_bytes(x.ljust(16, b"\x00"), "big") for x in ends.tolist()],
+                    codes.tolist(),
+                ]
+
+        return data
+
+    def size(self) -> int:
+        return sum(len(x[0]) for x in self.ranges.values())
+
+    def lookup(self, ips: list[str]) -> list[str]:
+        """labels of ips in the same order, empty string for invalid or unknown addresses"""
+        results = [""] * len(ips or [])
+        groups = {4: ([], []), 6: ([], [])}
+
+        for i, ip in enumerate(ips or []):
+            try:
+                address = ipaddress.ip_address(ip)
+            except ValueError:
+                continue
+
+            if address.version == 6 and address.ipv4_mapped:
+                address = address.ipv4_mapped
+
+            positions, keys = groups[address.version]
+            positions.append(i)
+            keys.append(int(address))
+
+        for version, (positions, keys) in groups.items():
+            if not keys or version not in self.ranges:
+                continue
+
+            for i, code in zip(positions, self._search(version, keys)):
+                if code >= 0:
+                    results[i] = self.labels[code]
+
+        return results
+
+    def _search(self, version: int, keys: list[int]) -> list[int]:
+        starts, ends, codes = self.ranges[version]
+        if len(starts) == 0:
+            return [-1] * len(keys)
+
+        if np is None:
+            found = []
+            for key in keys:
+                i = bisect.bisect_right(starts, key) - 1
+                found.append(codes[i] if i >= 0 and key <= ends[i] else -1)
+            return found
+
+        values = np.array([self._key(x, version) for x in keys], dtype=starts.dtype)
+        indexes = np.searchsorted(starts, values, side="right") - 1
+        clipped = np.clip(indexes, 0, None)
+        matched = (indexes >= 0) & (values <= ends[clipped])
+        return np.where(matched, codes[clipped], -1).tolist()
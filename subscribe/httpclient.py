@@ -0,0 +1,533 @@
+# -*- coding: utf-8 -*-
+
+import base64
+import collections
+import http.client
+import io
+import os
+import ssl
+import threading
+import time
+import urllib
+import urllib.error
+import urllib.parse
+import urllib.request
+import zlib
+from dataclasses import dataclass, field
+
+
+# status codes followed when redirects are allowed
+REDIRECT_CODES = {301, 302, 303, 307, 308}
+
+# default cap of a response body after decompression
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# bytes pulled from the socket per read
+CHUNK_SIZE = 64 * 1024
+
+# error responses larger than this are not buffered and their connection is dropped
+MAX_ERROR_BODY = 1024 * 1024
+
+# errors raised when the server has silently closed an idle keep-alive connection
+STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    ConnectionResetError,
+    ConnectionAbortedError,
+    BrokenPipeError,
+)
+
+
+@dataclass(frozen=True)
+class Proxy(object):
+    host: str
+    port: int
+
+    # value of the Proxy-Authorization header, empty when the proxy needs no credentials
+    auth: str = ""
+
+
+def proxy_for(scheme: str, host: str) -> Proxy:
+    """
+    http proxy configured for scheme through HTTP_PROXY / HTTPS_PROXY, the same way urllib.request.urlopen
+    picks it, None when the host is listed in NO_PROXY or no proxy is configured
+    """
+    address = urllib.request.getproxies().get(scheme, "")
+    if not address or urllib.request.proxy_bypass(host):
+        return None
+
+    parts = urllib.parse.urlsplit(address if "://" in address else f"http://{address}")
+    if parts.scheme.lower() not in ["http", "https"] or not parts.hostname:
+        raise urllib.error.URLError(f"unsupported proxy: {address}")
+
+    auth = ""
+    if parts.username is not None:
+        credential = f"{urllib.parse.unquote(parts.username)}:{urllib.parse.unquote(parts.password or '')}"
+        auth = "Basic " + base64.b64encode(credential.encode("utf8")).decode("ascii")
+
+    return Proxy(host=parts.hostname, port=parts.port or 80, auth=auth)
+
+
+class BodyTooLargeError(IOError):
+    """raised as soon as a response body grows beyond the configured cap"""
+
+    def __init__(self, url: str, limit: int, size: int, declared: bool = False) -> None:
+        source = "declared by Content-Length" if declared else "received"
+        super().__init__(f"response body exceeds {limit} bytes, {source}: {size}, url: {url}")
+        self.url = url
+        self.limit = limit
+        self.size = size
+
+
+@dataclass
+class HostStats(object):
+    # number of requests sent
+    requests: int = 0
+
+    # new tcp connections opened
+    created: int = 0
+
+    # requests served by an idle keep-alive connection
+    reused: int = 0
+
+    # tls handshakes resumed from the session cache
+    resumed: int = 0
+
+    # connections dropped because they stayed idle too long or the pool was full
+    evicted: int = 0
+
+    # requests failed with a network error
+    errors: int = 0
+
+
+class HTTPSConnection(http.client.HTTPSConnection):
+    """https connection which resumes tls sessions cached by the pool for the same host"""
+
+    def __init__(self, host: str, port: int = None, timeout: float = 10, context: ssl.SSLContext = None, pool=None):
+        super().__init__(host=host, port=port, timeout=timeout, context=context)
+        self.pool = pool
+        self.resumed = False
+
+    def connect(self) -> None:
+        # establishes the CONNECT tunnel first when the connection goes through a proxy
+        http.client.HTTPConnection.connect(self)
+
+        server = self._tunnel_host or self.host
+        key = (server, self._tunnel_port or self.port)
+        session = self.pool.session(key) if self.pool else None
+        try:
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server, session=session)
+        except ValueError:
+            # cached session does not match the context, handshake from scratch
+            self.sock = self._context.wrap_socket(self.sock, server_hostname=server)
+
+        self.resumed = self.sock.session_reused
+        if self.pool:
+            self.pool.remember(key, self.sock.session)
+
+
+@dataclass
+class IdleConnection(object):
+    conn: http.client.HTTPConnection
+    since: float = field(default_factory=time.time)
+
+
+class Response(object):
+    """
+    A minimal stand-in for the object returned by urllib.request.urlopen, the underlying
+    connection goes back to the pool as soon as the body has been fully consumed
+    """
+
+    def __init__(self, pool, key: tuple, conn: http.client.HTTPConnection, response: http.client.HTTPResponse, url: str):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.msg = response.reason
+
+    def getcode(self) -> int:
+        return self.status
+
+    def geturl(self) -> str:
+        return self.url
+
+    def info(self) -> http.client.HTTPMessage:
+        return self.headers
+
+    def getheader(self, name: str, default: str = None) -> str:
+        return self.headers.get(name, default)
+
+    def read(self, amt: int = None) -> bytes:
+        if self.conn is None:
+            return b""
+
+        try:
+            data = self.response.read() if amt is None else self.response.read(amt)
+        except Exception:
+            self.close()
+            raise
+
+        if amt is None or not data or self.response.isclosed():
+            self._release()
+
+        return data
+
+    def _release(self) -> None:
+        conn, self.conn = self.conn, None
+        if conn is None:
+            return
+
+        if self.response.isclosed() and not self.response.will_close:
+            self.pool.release(self.key, conn)
+        else:
+            conn.close()
+
+    def close(self) -> None:
+        # unread body left on the wire, the connection can not be reused
+        conn, self.conn = self.conn, None
+        if conn is not None:
+            self.response.close()
+            conn.close()
+
+    def __enter__(self) -> "Response":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __del__(self) -> None:
+        try:
+            self.close()
+        except:
+            pass
+
+
+class ConnectionPool(object):
+    """
+    Thread-safe keep-alive connection pool keyed by (scheme, host, port, proxy), the number of idle connections
+    is bounded per host and in total, idle connections older than idle_timeout are evicted on access. Proxies
+    from HTTP_PROXY / HTTPS_PROXY / NO_PROXY are honoured like urllib does, https is tunnelled with CONNECT
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 64,
+        per_host: int = 8,
+        idle_timeout: float = 60,
+        context: ssl.SSLContext = None,
+    ) -> None:
+        self.maxsize = max(1, maxsize)
+        self.per_host = max(1, per_host)
+        self.idle_timeout = max(1, idle_timeout)
+        self.context = context or ssl.create_default_context()
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+        self.idles = collections.OrderedDict()
+        self.sessions = {}
+        self.counters = collections.defaultdict(HostStats)
+
+    def _check_fork(self) -> None:
+        # sockets inherited from the parent process must never be shared
+        if self.pid == os.getpid():
+            return
+
+        self.pid = os.getpid()
+        self.idles = collections.OrderedDict()
+        self.sessions = {}
+        self.counters = collections.defaultdict(HostStats)
+
+    def session(self, key: tuple) -> ssl.SSLSession:
+        with self.lock:
+            return self.sessions.get(key, None)
+
+    def remember(self, key: tuple, session: ssl.SSLSession) -> None:
+        if session is None:
+            return
+
+        with self.lock:
+            self.sessions[key] = session
+
+    def _evict(self, now: float) -> None:
+        """drop expired idle connections, must be called with lock held"""
+        for key in list(self.idles.keys()):
+            queue = self.idles[key]
+            while queue and now - queue[0].since > self.idle_timeout:
+                queue.popleft().conn.close()
+                self.counters[key[1]].evicted += 1
+            if not queue:
+                del self.idles[key]
+
+    def acquire(self, key: tuple, timeout: float) -> tuple[http.client.HTTPConnection, bool]:
+        scheme, host, port, proxy = key
+        with self.lock:
+            self._check_fork()
+            self._evict(time.time())
+
+            queue = self.idles.get(key, None)
+            if queue:
+                conn = queue.pop().conn
+                if not queue:
+                    del self.idles[key]
+                else:
+                    self.idles.move_to_end(key)
+
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+
+        if proxy is None:
+            address, number = host, port
+        else:
+            address, number = proxy.host, proxy.port
+
+        if scheme == "https":
+            conn = HTTPSConnection(host=address, port=number, timeout=timeout, context=self.context, pool=self)
+            if proxy is not None:
+                headers = {"Proxy-Authorization": proxy.auth} if proxy.auth else None
+                conn.set_tunnel(host, port, headers=headers)
+        else:
+            conn = http.client.HTTPConnection(host=address, port=number, timeout=timeout)
+
+        return conn, False
+
+    def release(self, key: tuple, conn: http.client.HTTPConnection) -> None:
+        if conn.sock is None:
+            return
+
+        if isinstance(conn.sock, ssl.SSLSocket):
+            # tls 1.3 delivers session tickets after the handshake, refresh the cached one
+            self.remember((key[1], key[2]), conn.sock.session)
+
+        with self.lock:
+            if self.pid != os.getpid():
+                conn.close()
+                return
+
+            queue = self.idles.setdefault(key, collections.deque())
+            self.idles.move_to_end(key)
+            queue.append(IdleConnection(conn=conn))
+            if len(queue) > self.per_host:
+                queue.popleft().conn.close()
+                self.counters[key[1]].evicted += 1
+
+            total = sum(len(q) for q in self.idles.values())
+            while total > self.maxsize:
+                # least recently used host gives up its oldest connection first
+                oldest = next(iter(self.idles))
+                self.idles[oldest].popleft().conn.close()
+                self.counters[oldest[1]].evicted += 1
+                if not self.idles[oldest]:
+                    del self.idles[oldest]
+                total -= 1
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        body: bytes,
+        headers: dict,
+        timeout: float,
+    ) -> Response:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme.lower()
+        if scheme not in ["http", "https"] or not parts.hostname:
+            raise urllib.error.URLError(f"unsupported url: {url}")
+
+        port = parts.port or (443 if scheme == "https" else 80)
+        proxy = proxy_for(scheme, parts.hostname)
+        key = (scheme, parts.hostname.lower(), port, proxy)
+        target = parts.path or "/"
+        if parts.query:
+            target += f"?{parts.query}"
+
+        if proxy is not None and scheme == "http":
+            # plain http goes through the proxy as an absolute-form request
+            target = urllib.parse.urlunsplit((scheme, parts.netloc, target, "", ""))
+            if proxy.auth:
+                headers = {**(headers or {}), "Proxy-Authorization": proxy.auth}
+
+        while True:
+            conn, reused = self.acquire(key=key, timeout=timeout)
+            with self.lock:
+                stats = self.counters[key[1]]
+                stats.requests += 1
+                if reused:
+                    stats.reused += 1
+                else:
+                    stats.created += 1
+
+            try:
+                conn.request(method, target, body=body, headers=headers)
+                response = conn.getresponse()
+            except STALE_ERRORS as e:
+                conn.close()
+                if reused:
+                    # peer closed the idle connection, retry once on a fresh one
+                    continue
+
+                with self.lock:
+                    stats.errors += 1
+                raise urllib.error.URLError(e)
+            except (OSError, http.client.HTTPException) as e:
+                conn.close()
+                with self.lock:
+                    stats.errors += 1
+                raise urllib.error.URLError(e)
+
+            if not reused and getattr(conn, "resumed", False):
+                with self.lock:
+                    stats.resumed += 1
+
+            return Response(pool=self, key=key, conn=conn, response=response, url=url)
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        body: bytes = None,
+        headers: dict = None,
+        timeout: float = 10,
+        allow_redirects: bool = True,
+        max_redirects: int = 10,
+    ) -> Response:
+        """
+        send a request through a pooled connection, behaves like urllib.request.urlopen: redirects are
+        followed and HTTPError is raised for status codes >= 400
+        """
+        method = method.upper()
+        headers = dict(headers or {})
+
+        for _ in range(max(0, max_redirects) + 1):
+            response = self._send(method=method, url=url, body=body, headers=headers, timeout=timeout)
+            status = response.status
+
+            if allow_redirects and status in REDIRECT_CODES and response.getheader("Location"):
+                location = urllib.parse.urljoin(url, response.getheader("Location"))
+                # drain the small redirect body so the connection can be reused
+                response.read()
+
+                if status == 303 or (status in [301, 302] and method == "POST"):
+                    method, body = "GET", None
+                    headers = {k: v for k, v in headers.items() if k.lower() not in ["content-type", "content-length"]}
+
+                url = location
+                continue
+
+            if status >= 400:
+                # buffer the error body so the connection goes back to the pool even if nobody reads it
+                content = response.read(MAX_ERROR_BODY)
+                if response.conn is not None:
+                    response.close()
+
+                fp = io.BytesIO(content)
+                raise urllib.error.HTTPError(url, status, response.reason, response.headers, fp)
+
+            return response
+
+        raise urllib.error.HTTPError(url, status, "too many redirects", response.headers, response)
+
+    def stats(self) -> dict[str, dict]:
+        with self.lock:
+            result = {}
+            for host, item in self.counters.items():
+                result[host] = {
+                    "requests": item.requests,
+                    "created": item.created,
+                    "reused": item.reused,
+                    "resumed": item.resumed,
+                    "evicted": item.evicted,
+                    "errors": item.errors,
+                    "ratio": round(item.reused / item.requests, 4) if item.requests else 0.0,
+                }
+
+            return result
+
+    def clear(self) -> None:
+        with self.lock:
+            for queue in self.idles.values():
+                for item in queue:
+                    item.conn.close()
+
+            self.idles.clear()
+            self.sessions.clear()
+
+
+def _decompressor(encoding: str, head: bytes):
+    """incremental decompressor for the declared content-encoding, gzip magic is sniffed when undeclared"""
+    if encoding in ["gzip", "x-gzip"] or (not encoding and head[:2] == b"\x1f\x8b"):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        # servers disagree whether deflate means zlib-wrapped or raw stream
+        return zlib.decompressobj(zlib.MAX_WBITS if len(head) >= 2 and (head[0] * 256 + head[1]) % 31 == 0 else -zlib.MAX_WBITS)
+
+    return None
+
+
+def read_body(response, max_size: int = MAX_BODY_SIZE, chunk_size: int = CHUNK_SIZE) -> bytes:
+    """
+    stream the body of a urllib or pooled response in chunks, decompressing gzip/deflate on the fly,
+    raises BodyTooLargeError once more than max_size bytes have been received or produced
+    """
+    url = response.geturl() if hasattr(response, "geturl") else ""
+    max_size = max(1, max_size)
+    headers = response.headers
+
+    encoding = (headers.get("Content-Encoding", "") or "").strip().lower()
+    length = (headers.get("Content-Length", "") or "").strip()
+    if length.isdigit() and int(length) > max_size:
+        response.close()
+        raise BodyTooLargeError(url=url, limit=max_size, size=int(length), declared=True)
+
+    buffer, received, decompressor = bytearray(), 0, None
+    while True:
+        chunk = response.read(chunk_size)
+        if not chunk:
+            break
+
+        received += len(chunk)
+        if received > max_size:
+            response.close()
+            raise BodyTooLargeError(url=url, limit=max_size, size=received)
+
+        if received == len(chunk):
+            decompressor = _decompressor(encoding, chunk)
+
+        if decompressor is None:
+            buffer.extend(chunk)
+        else:
+            # bound the output of every step so that a decompression bomb never materializes
+            data = chunk
+            while data:
+                buffer.extend(decompressor.decompress(data, max_size - len(buffer) + 1))
+                if len(buffer) > max_size:
+                    break
+                data = decompressor.unconsumed_tail
+
+        if len(buffer) > max_size:
+            response.close()
+            raise BodyTooLargeError(url=url, limit=max_size, size=len(buffer))
+
+    if decompressor is not None:
+        buffer.extend(decompressor.flush())
+        if len(buffer) > max_size:
+            raise BodyTooLargeError(url=url, limit=max_size, size=len(buffer))
+
+    return bytes(buffer)
+
+
+def decode_body(content: bytes, headers=None) -> str:
+    """decode once with the charset declared by the response, utf-8 otherwise"""
+    charset = "utf8"
+    if headers is not None and hasattr(headers, "get_content_charset"):
+        charset = headers.get_content_charset() or charset
+
+    try:
+        return content.decode(charset)
+    except (UnicodeDecodeError, LookupError):
+        return content.decode("utf8", errors="ignore")
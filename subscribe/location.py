@@ -8,12 +8,18 @@ import math
 import os
 import re
 import socket
+import typing
 import urllib
 from collections import defaultdict
 
 import utils
+from geoindex import GeoIndex
 from geoip2 import database
 from logger import logger
+from resolver import Resolver
+
+# filename of the dns cache persisted next to the mmdb
+DNS_CACHE_FILE = "dns-cache.json"
 
 
 def download_mmdb(repo: str, target: str, filepath: str, retry: int = 3) -> bool:
@@ -107,7 +113,7 @@ def load_mmdb(
     return database.Reader(filepath)
 
 
-def rename(proxy: dict, reader: database.Reader) -> dict:
+def rename(proxy: dict, reader: database.Reader, addresses: dict = None, countries: dict = None) -> dict:
     if not proxy or not isinstance(proxy, dict):
         return None
 
@@ -117,7 +123,10 @@ def rename(proxy: dict, reader: database.Reader) -> dict:
         return proxy
 
     try:
-        ip = socket.gethostbyname(address)
+        # resolved in bulk by regularize, fall back to the system resolver when called alone
+        ip = addresses.get(address, "") if addresses is not None else socket.gethostbyname(address)
+        if not ip:
+            raise ValueError(f"cannot resolve {address}")
 
         # fake ip
         if ip.startswith("198.18.0."):
@@ -125,8 +134,12 @@ def rename(proxy: dict, reader: database.Reader) -> dict:
             return proxy
 
         name = proxy.get("name", "")
-        response = reader.country(ip)
-        country = response.country.names.get("zh-CN", "")
+        if countries is not None:
+            # looked up in one batch through the range index
+            country = countries.get(ip, "")
+        else:
+            response = reader.country(ip)
+            country = response.country.names.get("zh-CN", "")
 
         if country == "中国":
             # TODO: may be a transit node, need to further confirm landing ip address
@@ -152,6 +165,7 @@ def regularize(
     show_progress: bool = True,
     locate: bool = False,
     digits: int = 2,
+    select: typing.Callable[[list[dict]], list[dict]] = None,
 ) -> list[dict]:
     if not proxies or not isinstance(proxies, list):
         return proxies
@@ -167,19 +181,38 @@ def regularize(
         # load mmdb
         reader = load_mmdb(repo=repo, directory=directory, filename=filename, update=update)
         if reader:
-            tasks = [[p, reader] for p in proxies if p and isinstance(p, dict)]
-            proxies = utils.multi_thread_run(rename, tasks, num_threads, show_progress, "")
+            proxies = [p for p in proxies if p and isinstance(p, dict)]
+
+            # thousands of proxies share a handful of servers, resolve each hostname once
+            resolver = Resolver(cachefile=os.path.join(directory, DNS_CACHE_FILE))
+            addresses = resolver.resolve([utils.trim(p.get("server", "")) for p in proxies])
+            resolver.save()
+            logger.info(f"resolved {len(addresses)} server addresses, dns cache stats: {resolver.stats()}")
+
+            index = GeoIndex.load(filepath=os.path.join(directory, filename))
+            if index:
+                ips = list(set([x for x in addresses.values() if x]))
+                countries = dict(zip(ips, index.lookup(ips)))
+                proxies = [rename(proxy=p, reader=reader, addresses=addresses, countries=countries) for p in proxies]
+            else:
+                tasks = [[p, reader, addresses] for p in proxies]
+                proxies = utils.multi_thread_run(rename, tasks, num_threads, show_progress, "")
+
+            reader.close()
         else:
             logger.error(f"skip rename proxies due to cannot load mmdb: {filename}")
 
-    records = defaultdict(list)
     for proxy in proxies:
         name = re.sub(r"(\d+|(\d+)?(-\d+)?[A-Z])$", "", proxy.get("name", "")).strip()
-        if not name:
-            name = "未知地域"
+        proxy["name"] = name or "未知地域"
 
-        proxy["name"] = name
-        records[name].append(proxy)
+    # names are regions now, the selection may drop nodes before they are numbered
+    if select:
+        proxies = select(proxies)
+
+    records = defaultdict(list)
+    for proxy in proxies:
+        records[proxy["name"]].append(proxy)
 
     results = list()
     for name, nodes in records.items():
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import json
+import os
+import threading
+import time
+import typing
+from copy import deepcopy
+
+import utils
+from logger import logger
+
+
+class PageCache(object):
+    """
+    Validator cache for crawled pages. Every page keeps its ETag, Last-Modified, a hash of the body and the
+    subscriptions extracted from it. Pages are fetched with conditional requests and extraction is skipped
+    when the server answers 304 or the body hash is unchanged. Entries expire after ttl seconds
+    """
+
+    def __init__(self, cachefile: str = "", ttl: float = 86400) -> None:
+        self.cachefile = cachefile
+        self.ttl = max(0, ttl)
+        self.lock = threading.Lock()
+
+        # url -> {etag, modified, digest, signature, expire, result}
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.unchanged = 0
+
+        if self.cachefile:
+            self.load()
+
+    def load(self) -> None:
+        if not self.cachefile or not os.path.isfile(self.cachefile):
+            return
+
+        try:
+            with open(self.cachefile, "r", encoding="utf8") as f:
+                records = json.load(f)
+
+            now = time.time()
+            with self.lock:
+                for url, entry in records.items():
+                    if isinstance(entry, dict) and entry.get("expire", 0) > now:
+                        self.entries[url] = entry
+        except Exception:
+            logger.warning(f"[PageCache] ignore broken page cache file: {self.cachefile}")
+
+    def save(self) -> None:
+        if not self.cachefile:
+            return
+
+        now = time.time()
+        with self.lock:
+            records = {k: v for k, v in self.entries.items() if v.get("expire", 0) > now}
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cachefile))
+            os.makedirs(directory, exist_ok=True)
+
+            tmpfile = f"{self.cachefile}.tmp"
+            with open(tmpfile, "w+", encoding="utf8") as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(tmpfile, self.cachefile)
+        except Exception:
+            logger.error(f"[PageCache] cannot save page cache to {self.cachefile}")
+
+    @staticmethod
+    def signature(params: typing.Any) -> str:
+        """fingerprint of the extraction parameters, a cached result is only reused for the same parameters"""
+        text = json.dumps(params, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.md5(text.encode("utf8")).hexdigest()
+
+    def get(self, url: str, signature: str = "") -> dict:
+        with self.lock:
+            entry = self.entries.get(url, None)
+            if not entry or entry.get("expire", 0) <= time.time() or entry.get("signature", "") != signature:
+                return {}
+
+            return entry
+
+    def fetch(
+        self,
+        url: str,
+        extract: typing.Callable[[str], dict],
+        headers: dict = None,
+        params: typing.Any = None,
+        retry: int = 3,
+    ) -> dict:
+        """
+        download url with the validators of its cached copy and return the extracted subscriptions,
+        extract is only called when the page really changed
+        """
+        signature = self.signature(params)
+        entry = self.get(url=url, signature=signature)
+
+        status, content, validators = utils.http_revalidate(
+            url=url,
+            headers=headers,
+            etag=entry.get("etag", ""),
+            modified=entry.get("modified", ""),
+            retry=retry,
+        )
+
+        if status == 304 and entry:
+            with self.lock:
+                self.hits += 1
+                entry["etag"] = validators.get("etag", "") or entry.get("etag", "")
+                entry["modified"] = validators.get("modified", "") or entry.get("modified", "")
+
+            return deepcopy(entry.get("result", {}))
+
+        if status != 200 or not content:
+            return {}
+
+        digest = hashlib.blake2b(content.encode("utf8"), digest_size=16).hexdigest()
+        if entry and entry.get("digest", "") == digest:
+            with self.lock:
+                self.unchanged += 1
+                entry["etag"] = validators.get("etag", "")
+                entry["modified"] = validators.get("modified", "")
+
+            return deepcopy(entry.get("result", {}))
+
+        result = extract(content) or {}
+        with self.lock:
+            self.misses += 1
+            self.entries[url] = {
+                "etag": validators.get("etag", ""),
+                "modified": validators.get("modified", ""),
+                "digest": digest,
+                "signature": signature,
+                "expire": time.time() + self.ttl,
+                "result": deepcopy(result),
+            }
+
+        return result
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.unchanged + self.misses
+            return {
+                "size": len(self.entries),
+                "hits": self.hits,
+                "unchanged": self.unchanged,
+                "misses": self.misses,
+                "ratio": round((self.hits + self.unchanged) / total, 4) if total else 0.0,
+            }
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import time
+from dataclasses import dataclass
+
+import utils
+from logger import logger
+from resolver import Resolver
+
+# protocols carried over udp cannot be probed with a tcp handshake, they always go on to the full check
+UDP_TYPES = {"hysteria", "hysteria2", "tuic", "wireguard", "mieru"}
+
+# protocols that always speak tls on the server port
+TLS_TYPES = {"trojan", "anytls"}
+
+CTX = ssl.create_default_context()
+CTX.check_hostname = False
+CTX.verify_mode = ssl.CERT_NONE
+
+
+@dataclass(frozen=True)
+class Endpoint(object):
+    # resolved address of the server
+    address: str
+
+    port: int
+
+    # server name of the tls handshake, empty for a plain tcp probe
+    sni: str = ""
+
+
+def server_name(proxy: dict) -> str:
+    """sni of the tls handshake the node performs on its server port, empty when it does not use tls"""
+    kind = utils.trim(str(proxy.get("type", ""))).lower()
+    if kind not in TLS_TYPES and not proxy.get("tls", False):
+        return ""
+
+    for key in ["sni", "servername"]:
+        value = proxy.get(key, "")
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+
+    return utils.trim(str(proxy.get("server", "")))
+
+
+def endpoint(proxy: dict, addresses: dict[str, str], tls: bool = False) -> Endpoint:
+    """probe target of the node, None when it cannot be probed over tcp"""
+    if utils.trim(str(proxy.get("type", ""))).lower() in UDP_TYPES:
+        return None
+
+    try:
+        port = int(proxy.get("port", 0))
+    except (TypeError, ValueError):
+        return None
+
+    server = utils.trim(str(proxy.get("server", "")))
+    return Endpoint(address=addresses.get(server, ""), port=port, sni=server_name(proxy) if tls else "")
+
+
+async def probe(semaphore: asyncio.Semaphore, target: Endpoint, timeout: float) -> bool:
+    if not target.address or not 0 < target.port <= 65535:
+        return False
+
+    async with semaphore:
+        writer = None
+        try:
+            connection = asyncio.open_connection(
+                host=target.address,
+                port=target.port,
+                ssl=CTX if target.sni else None,
+                server_hostname=target.sni or None,
+            )
+            _, writer = await asyncio.wait_for(connection, timeout=timeout)
+            return True
+        except Exception:
+            return False
+        finally:
+            if writer is not None:
+                writer.close()
+                try:
+                    await asyncio.wait_for(writer.wait_closed(), timeout=1)
+                except Exception:
+                    pass
+
+
+async def probe_all(targets: list[Endpoint], concurrency: int, timeout: float) -> dict[Endpoint, bool]:
+    semaphore = asyncio.Semaphore(concurrency)
+    answers = await asyncio.gather(*[probe(semaphore, x, timeout) for x in targets])
+    return dict(zip(targets, answers))
+
+
+def raise_nofile(wanted: int) -> int:
+    """lift the soft open files limit towards wanted and return the usable concurrency"""
+    try:
+        import resource
+
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        limit = wanted + 256 if hard == resource.RLIM_INFINITY else min(hard, wanted + 256)
+        if soft < limit:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (limit, hard))
+            soft = limit
+
+        return max(1, min(wanted, soft - 256))
+    except Exception:
+        # windows has no rlimit, keep far below the default select limit
+        return max(1, min(wanted, 512))
+
+
+def reachable(
+    proxies: list[dict],
+    concurrency: int = 4096,
+    timeout: float = 3,
+    tls: bool = False,
+    cachefile: str = "",
+) -> list[bool]:
+    """
+    whether the endpoint of every node accepts a raw tcp connection, or completes a tls handshake with the
+    configured sni when tls is true. Every distinct endpoint is probed once however many nodes share it,
+    nodes that cannot be probed over tcp are always considered reachable
+    """
+    if not proxies:
+        return []
+
+    resolver = Resolver(cachefile=cachefile, concurrency=256)
+    addresses = resolver.resolve([utils.trim(str(p.get("server", ""))) for p in proxies])
+    resolver.save()
+
+    targets = [endpoint(proxy=p, addresses=addresses, tls=tls) for p in proxies]
+    distinct = list(set([x for x in targets if x is not None]))
+
+    concurrency = raise_nofile(max(1, concurrency))
+    results = asyncio.run(probe_all(targets=distinct, concurrency=concurrency, timeout=max(0.1, timeout)))
+
+    return [target is None or results.get(target, False) for target in targets]
+
+
+def screen(
+    proxies: list[dict],
+    concurrency: int = 4096,
+    timeout: float = 3,
+    tls: bool = False,
+    cachefile: str = "",
+) -> tuple[list[dict], list[dict]]:
+    """split proxies into (reachable, unreachable), see reachable"""
+    proxies = [p for p in proxies or [] if p and isinstance(p, dict)]
+    if not proxies:
+        return [], []
+
+    starttime = time.time()
+    flags = reachable(proxies=proxies, concurrency=concurrency, timeout=timeout, tls=tls, cachefile=cachefile)
+
+    reachables, unreachables = [], []
+    for proxy, flag in zip(proxies, flags):
+        if flag:
+            reachables.append(proxy)
+        else:
+            unreachables.append(proxy)
+
+    logger.info(
+        f"[Prescreen] probed {len(proxies)} nodes, reachable: {len(reachables)}, "
+        f"unreachable: {len(unreachables)}, tls: {tls}, cost: {time.time()-starttime:.2f}s"
+    )
+    return reachables, unreachables
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-i",
+        "--input",
+        type=str,
+        required=True,
+        help="json file of clash proxies to screen",
+    )
+
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        required=False,
+        default="",
+        help="json file of reachable proxies, overwrite the input file by default",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--concurrency",
+        type=int,
+        required=False,
+        default=4096,
+        help="max connections in flight",
+    )
+
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        type=float,
+        required=False,
+        default=3,
+        help="seconds to wait for every connection",
+    )
+
+    parser.add_argument(
+        "-s",
+        "--tls",
+        dest="tls",
+        action="store_true",
+        default=False,
+        help="complete a tls handshake with the configured sni for tls nodes",
+    )
+
+    args = parser.parse_args()
+    with open(args.input, "r", encoding="utf8") as f:
+        nodes = json.load(f)
+
+    cachefile = os.path.join(os.path.dirname(os.path.abspath(args.input)), "dns-cache.json")
+    reachables, _ = screen(
+        proxies=nodes,
+        concurrency=args.concurrency,
+        timeout=args.timeout,
+        tls=args.tls,
+        cachefile=cachefile,
+    )
+
+    output = args.output or args.input
+    with open(output, "w", encoding="utf8") as f:
+        json.dump(reachables, f, ensure_ascii=False, indent=2)
+
+    print(f"prescreen finished, total: {len(nodes)}, reachable: {len(reachables)}")
@@ -9,9 +9,7 @@ import copy
 import itertools
 import json
 import os
-import random
 import re
-import subprocess
 import sys
 import time
 from copy import deepcopy
@@ -30,10 +28,20 @@ from origin import Origin
 from workflow import TaskConfig
 
 import clash
+import clashcore
+import emitter
+import prescreen
+import selector
 import subconverter
 
 PATH = os.path.abspath(os.path.dirname(os.path.dirname(__file__)))
 
+# hashes of the last content pushed to every storage item
+PUSH_STATE_FILE = "push-state.json"
+
+# historical stability of every node endpoint, used to rank nodes
+NODE_STATS_FILE = "node-stats.json"
+
 
 @dataclass
 class ProcessConfig(object):
@@ -55,6 +63,9 @@ class ProcessConfig(object):
     # max acceptable delay
     delay: int = 5000
 
+    # tcp/tls pre-screening before nodes are loaded into clash
+    prescreen: dict = field(default_factory=dict)
+
 
 def load_configs(
     url: str,
@@ -68,6 +79,7 @@ def load_configs(
         update_conf.update(config.get("update", {}))
         crawl_conf.update(config.get("crawl", {}))
         storage.update(config.get("storage", {}))
+        prescreen_conf.update(config.get("prescreen", {}))
 
         nonlocal engine
         engine = utils.trim(storage.get("engine", "")) or engine
@@ -89,6 +101,8 @@ def load_configs(
         params["config"] = crawl_conf.get("config", {})
         params["enable"] = crawl_conf.get("enable", True)
         params["singlelink"] = crawl_conf.get("singlelink", False)
+        params["cache"] = crawl_conf.get("cache", {})
+        params["scheduler"] = crawl_conf.get("scheduler", {})
 
         threshold = max(crawl_conf.get("threshold", 1), 1)
         params["threshold"] = threshold
@@ -205,7 +219,7 @@ def load_configs(
         params["pages"] = pages
 
         # spider's config for scripts
-        scripts_conf, scripts = spiders.get("scripts", []), {}
+        scripts_conf, scripts, timeouts = spiders.get("scripts", []), {}, {}
 
         for script in scripts_conf:
             enable = script.pop("enable", True)
@@ -221,7 +235,14 @@ def load_configs(
             task_conf["engine"] = engine
 
             scripts[path] = task_conf
+
+            # wall-clock limit of the script, the script is cancelled once exceeded
+            timeout = script.pop("timeout", 0)
+            if isinstance(timeout, (int, float)) and timeout > 0:
+                timeouts[path] = timeout
+
         params["scripts"] = scripts
+        params["timeouts"] = timeouts
 
     def verify(storage: dict, groups: dict) -> bool:
         if not isinstance(storage, dict) or not isinstance(groups, dict):
@@ -260,7 +281,7 @@ def load_configs(
 
     tasks, delay = [], sys.maxsize
     engine, storage, groups = "", {}, {}
-    params, crawl_conf, update_conf = {}, {}, {}
+    params, crawl_conf, update_conf, prescreen_conf = {}, {}, {}, {}
 
     try:
         if re.match(
@@ -305,6 +326,7 @@ def load_configs(
         groups=groups,
         update=update_conf,
         delay=delay,
+        prescreen=prescreen_conf,
     )
 
 
@@ -546,137 +568,181 @@ def aggregate(args: argparse.Namespace) -> None:
 
         datasets[data[0]] = data[1]
 
-    for k, v in groups.items():
-        if not v:
-            logger.error(f"task is empty, group=[{k}]")
-            continue
-
-        arrays = [datasets.get(x, []) for x in v]
-        proxies = list(itertools.chain.from_iterable(arrays))
-        if len(proxies) == 0:
-            logger.error(f"exit because cannot fetch any proxy node, group=[{k}]")
-            continue
-
-        workspace = os.path.join(PATH, "clash")
-        binpath = os.path.join(workspace, clash_bin)
-        filename = "config.yaml"
-        proxies = clash.generate_config(workspace, proxies, filename)
-
-        # filer
-        skip = utils.trim(os.environ.get("SKIP_ALIVE_CHECK", "false")).lower() in ["true", "1"]
-        nochecks, starttime = proxies, time.time()
-
-        if not skip:
-            checks, nochecks = workflow.liveness_fillter(proxies=proxies)
-            if checks:
-                # executable
-                utils.chmod(binpath)
-
-                logger.info(f"startup clash now, workspace: {workspace}, config: {filename}")
-                process = subprocess.Popen(
-                    [
-                        binpath,
-                        "-d",
-                        workspace,
-                        "-f",
-                        os.path.join(workspace, filename),
-                    ]
-                )
-
-                logger.info(f"clash start success, begin check proxies, group: {k}\tcount: {len(checks)}")
-                time.sleep(random.randint(5, 8))
+    # uploads run in background while the next group is being checked
+    scheduler = push.PushScheduler(
+        pushtool=pushtool,
+        parallelism=storages.get("parallelism", 4),
+        rate=storages.get("rate", 0),
+        statefile=os.path.join(PATH, "data", PUSH_STATE_FILE),
+        remote=storages.get("compare", False),
+    )
+    uploads = []
 
-                params = [
-                    [p, clash.EXTERNAL_CONTROLLER, args.timeout, args.url, process_config.delay, False]
-                    for p in checks
-                    if isinstance(p, dict)
-                ]
+    # measured delays and node history shared by all groups
+    ranker = selector.Selector(statefile=os.path.join(PATH, "data", NODE_STATS_FILE), limit=process_config.delay)
 
-                # check
-                masks = utils.multi_thread_run(
-                    func=clash.check,
-                    tasks=params,
-                    num_threads=args.num,
-                    show_progress=display,
-                )
+    # one warm clash core shared by all groups, proxies are hot-swapped per group
+    workspace = os.path.join(PATH, "clash")
+    core = clashcore.ClashCore(binpath=os.path.join(workspace, clash_bin), workspace=workspace)
 
-                # close clash client
-                try:
-                    process.terminate()
-                except:
-                    logger.error(f"terminate clash process error, group: {k}")
+    # the core, node history and pending uploads must be released even when a group fails halfway
+    try:
+        for k, v in groups.items():
+            if not v:
+                logger.error(f"task is empty, group=[{k}]")
+                continue
 
-                availables = [checks[i] for i in range(len(checks)) if masks[i]]
-                nochecks.extend(availables)
+            arrays = [datasets.get(x, []) for x in v]
+            proxies = list(itertools.chain.from_iterable(arrays))
+            if len(proxies) == 0:
+                logger.error(f"exit because cannot fetch any proxy node, group=[{k}]")
+                continue
 
-                dead = len(checks) - len(availables)
-                logger.info(f"proxies check finished, total: {len(checks)}, alive: {len(availables)}, dead: {dead}")
+            filename = "config.yaml"
+            proxies = clash.generate_config(workspace, proxies, filename)
+
+            group_conf = process_config.groups.get(k, {})
+            selection = selector.Selection.parse(group_conf.get("select", {}))
+
+            # filer
+            skip = utils.trim(os.environ.get("SKIP_ALIVE_CHECK", "false")).lower() in ["true", "1"]
+            nochecks, starttime = proxies, time.time()
+
+            if not skip:
+                checks, nochecks = workflow.liveness_fillter(proxies=proxies)
+
+                # drop nodes whose endpoint does not even accept a connection before they reach the core
+                screen_conf, unreachables = process_config.prescreen, []
+                if checks and screen_conf.get("enable", True):
+                    checks, unreachables = prescreen.screen(
+                        proxies=checks,
+                        concurrency=screen_conf.get("concurrency", 4096),
+                        timeout=screen_conf.get("timeout", 3),
+                        tls=screen_conf.get("tls", False),
+                        cachefile=os.path.join(PATH, "data", location.DNS_CACHE_FILE),
+                    )
+
+                    # only reachable nodes are loaded into the core
+                    if unreachables and checks:
+                        checks = clash.generate_config(workspace, list(checks), filename)
+
+                if checks:
+                    expected = set(p.get("name", "") for p in checks if isinstance(p, dict))
+                    if core.start() and core.reload(filepath=os.path.join(workspace, filename), expected=expected):
+                        logger.info(f"clash reload success, begin check proxies, group: {k}\tcount: {len(checks)}")
+
+                        def run(items: list[dict]) -> list[bool]:
+                            params = [
+                                [p, core.api_url, args.timeout, args.url, process_config.delay, False, ranker.samples]
+                                for p in items
+                            ]
+
+                            return utils.multi_thread_run(
+                                func=clash.check,
+                                tasks=params,
+                                num_threads=args.num,
+                                show_progress=display,
+                            )
+
+                        # check one node per endpoint first, siblings of endpoints that refuse connections fail directly
+                        def probe(items: list[dict]) -> list[bool]:
+                            return prescreen.reachable(
+                                proxies=items,
+                                concurrency=screen_conf.get("concurrency", 4096),
+                                timeout=screen_conf.get("timeout", 3),
+                                cachefile=os.path.join(PATH, "data", location.DNS_CACHE_FILE),
+                            )
+
+                        masks = workflow.check_by_endpoint(proxies=checks, run=run, reachable=probe)
+                    else:
+                        logger.error(f"cannot load proxies into clash, group: {k}")
+                        masks = [False] * len(checks)
+
+                    availables = [checks[i] for i in range(len(checks)) if masks[i]]
+                    nochecks.extend(availables)
+                    ranker.observe(proxies=checks, alpha=selection.alpha)
+
+                    dead = len(checks) - len(availables)
+                    logger.info(f"proxies check finished, total: {len(checks)}, alive: {len(availables)}, dead: {dead}")
+
+                if unreachables:
+                    ranker.observe(proxies=unreachables, alpha=selection.alpha)
+
+            for item in nochecks:
+                item.pop("sub", "")
+
+            if len(nochecks) <= 0:
+                logger.error(f"cannot fetch any proxy, group=[{k}], cost: {time.time()-starttime:.2f}s")
+                continue
 
-        for item in nochecks:
-            item.pop("sub", "")
+            emoji = group_conf.get("emoji", True)
+            list_only = group_conf.get("list", True)
 
-        if len(nochecks) <= 0:
-            logger.error(f"cannot fetch any proxy, group=[{k}], cost: {time.time()-starttime:.2f}s")
-            continue
+            # keep the best nodes of every region, after renaming when regularize is enabled
+            select = (lambda nodes: ranker.pick(proxies=nodes, selection=selection)) if selection.top > 0 else None
 
-        group_conf = process_config.groups.get(k, {})
-        emoji = group_conf.get("emoji", True)
-        list_only = group_conf.get("list", True)
-
-        regularize = group_conf.get("regularize", {})
-        if regularize and isinstance(regularize, dict) and regularize.get("enable", False):
-            locate = regularize.get("locate", False)
-            try:
-                bits = max(1, int(regularize.get("bits", 2)))
-            except:
-                bits = 2
-
-            nochecks = location.regularize(
-                proxies=nochecks,
-                num_threads=args.num,
-                show_progress=display,
-                locate=locate,
-                digits=bits,
-            )
+            regularize = group_conf.get("regularize", {})
+            if regularize and isinstance(regularize, dict) and regularize.get("enable", False):
+                locate = regularize.get("locate", False)
+                try:
+                    bits = max(1, int(regularize.get("bits", 2)))
+                except:
+                    bits = 2
 
-        source_file, data = "config.yaml", {"proxies": nochecks}
-        filepath = os.path.join(PATH, "subconverter", source_file)
-        with open(filepath, "w+", encoding="utf8") as f:
-            yaml.dump(data, f, allow_unicode=True)
-
-        targets = group_conf.get("targets", {})
-        for target, storage_name in targets.items():
-            persisted, content = False, " "
-
-            # convert
-            artifact = f"convert_{target}"
-            dest_file = subconverter.get_filename(target=target)
-
-            if os.path.exists(generate_conf) and os.path.isfile(generate_conf):
-                os.remove(generate_conf)
-
-            success = subconverter.generate_conf(
-                filepath=generate_conf,
-                name=artifact,
-                source=source_file,
-                dest=dest_file,
-                target=target,
-                emoji=emoji,
-                list_only=list_only,
-            )
-            if not success:
-                logger.error(f"cannot generate subconverter config file, group: {k}, target: {target}")
-                continue
+                nochecks = location.regularize(
+                    proxies=nochecks,
+                    num_threads=args.num,
+                    show_progress=display,
+                    locate=locate,
+                    digits=bits,
+                    select=select,
+                )
+            elif select:
+                nochecks = select(nochecks)
+
+            source_file, data = "config.yaml", {"proxies": nochecks}
+            targets = group_conf.get("targets", {})
+
+            # clash, v2ray, mixed and singbox are rendered in process, only exotic targets go through subconverter.
+            # artifacts are keyed by the normalized target, aliases maps it back to the key used in the config
+            artifacts, exotics, aliases = {}, [], {}
+            for name in targets:
+                target = utils.trim(name).lower()
+                aliases[target] = name
+                if not emitter.supported(target=target, list_only=list_only):
+                    exotics.append(target)
+                    continue
 
-            if subconverter.convert(binname=subconverter_bin, artifact=artifact):
-                filepath = os.path.join(PATH, "subconverter", dest_file)
+                try:
+                    artifacts[target] = emitter.emit(proxies=nochecks, target=target, emoji=emoji, list_only=list_only)
+                except Exception as e:
+                    logger.error(f"cannot render proxies, group: {k}, target: {target}, message: {str(e)}")
+
+            if exotics:
+                filepath = os.path.join(PATH, "subconverter", source_file)
+                with open(filepath, "w+", encoding="utf8") as f:
+                    yaml.dump(data, f, allow_unicode=True)
+
+                # one subconverter launch converts all exotic targets of the group
+                outputs = subconverter.batch_convert(
+                    binname=subconverter_bin,
+                    source=source_file,
+                    targets=[{"target": x, "emoji": emoji, "list_only": list_only} for x in exotics],
+                    filepath=generate_conf,
+                )
+                for (target, _), filepath in outputs.items():
+                    with open(filepath, "r", encoding="utf8") as f:
+                        artifacts[target] = f.read()
 
-                if not os.path.exists(filepath) or not os.path.isfile(filepath):
-                    logger.error(f"converted file {filepath} not found, group: {k}, target: {target}")
-                    continue
+                # clean workspace
+                filenames = [os.path.basename(x) for x in outputs.values()]
+                workflow.cleanup(os.path.join(PATH, "subconverter"), filenames + ["generate.ini"])
 
-                with open(filepath, "r", encoding="utf8") as f:
-                    content = f.read()
+            # artifacts of a group are committed together when the engine supports it, e.g. one gist revision
+            items, entries = [], []
+            for target, content in artifacts.items():
+                storage_name = targets.get(aliases.get(target, target))
+                dest_file = subconverter.get_filename(target=target)
 
                 mixed = target == "v2ray" or target == "mixed" or "ss" in target
                 if mixed and not utils.isb64encode(content=content):
@@ -689,21 +755,34 @@ def aggregate(args: argparse.Namespace) -> None:
 
                 # save to remote server
                 push_conf = process_config.storage.get("items", {}).get(storage_name, {})
-                persisted = pushtool.push_to(content=content, push_conf=push_conf, group=f"{k}::{target}")
-
-            # clean workspace
-            workflow.cleanup(os.path.join(PATH, "subconverter"), [dest_file, "generate.ini"])
-
-            if content and not persisted:
-                filename = os.path.join(PATH, "data", f"{k}-{dest_file}")
-
-                logger.error(f"storage config to remote failed, group: {k}, target: {target}, save it to {filename}")
+                items.append((content, push_conf, f"{k}::{target}"))
+                entries.append((target, dest_file, content))
+
+            if items:
+                uploads.append((k, entries, scheduler.submit_batch(items=items)))
+
+            workflow.cleanup(os.path.join(PATH, "subconverter"), [source_file])
+            cost = "{:.2f}s".format(time.time() - starttime)
+            logger.info(f"group [{k}] process finished, count: {len(nochecks)}, cost: {cost}")
+    finally:
+        # close clash client
+        core.stop()
+        ranker.save()
+
+        # wait for queued uploads and persist their state
+        scheduler.join()
+        scheduler.shutdown()
+
+    for group, entries, future in uploads:
+        results = future.result() if not future.exception() else []
+        for i, (target, dest_file, content) in enumerate(entries):
+            result = results[i] if i < len(results) else None
+            if content and (result is None or not result.success):
+                filename = os.path.join(PATH, "data", f"{group}-{dest_file}")
+
+                logger.error(f"storage config to remote failed, group: {group}, target: {target}, save it to {filename}")
                 utils.write_file(filename=filename, lines=content)
 
-        workflow.cleanup(os.path.join(PATH, "subconverter"), [source_file])
-        cost = "{:.2f}s".format(time.time() - starttime)
-        logger.info(f"group [{k}] process finished, count: {len(nochecks)}, cost: {cost}")
-
     config = {
         "domains": sites,
         "crawl": process_config.crawl,
@@ -3,12 +3,18 @@
 # @Author  : wzdnzd
 # @Time    : 2022-07-15
 
+import hashlib
 import json
 import os
+import threading
+import time
 import traceback
 import urllib
+import urllib.error
 import urllib.parse
 import urllib.request
+from concurrent import futures
+from dataclasses import dataclass
 from http.client import HTTPResponse
 
 import utils
@@ -69,7 +75,7 @@ class PushTo(object):
 
         try:
             request = urllib.request.Request(url=url, data=data, headers=headers, method=self.method)
-            response = urllib.request.urlopen(request, timeout=60, context=utils.CTX)
+            response = utils.urlopen(request, timeout=60)
             if self._is_success(response):
                 logger.info(f"[PushSuccess] push subscribes information to {self.name} successed, group=[{group}]")
                 return True
@@ -90,6 +96,10 @@ class PushTo(object):
 
             return False
 
+    def push_batch(self, items: list[tuple[str, dict, str]], retry: int = 5) -> list[bool]:
+        """push several (content, push_conf, group) items, engines able to commit many files at once override it"""
+        return [self.push_to(content=c, push_conf=p, group=g, retry=retry) for c, p, g in items]
+
     def _is_success(self, response: HTTPResponse) -> bool:
         return response and response.getcode() == 200
 
@@ -108,6 +118,13 @@ class PushTo(object):
     def raw_url(self, push_conf: dict) -> str:
         raise NotImplementedError
 
+    def identity(self, push_conf: dict) -> str:
+        """the file push_conf uploads to, settings that do not change the destination are ignored"""
+        try:
+            return self.raw_url(push_conf=push_conf)
+        except Exception:
+            return ""
+
 
 class PushToPasteGG(PushTo):
     """https://paste.gg"""
@@ -385,6 +402,9 @@ class PushToLocal(PushTo):
 
 
 class PushToGist(PushTo):
+    # max bytes of file contents carried by one commit, larger batches are split into several commits
+    MAX_COMMIT_SIZE = 8 * 1024 * 1024
+
     def __init__(self, token: str) -> None:
         super().__init__(token=token)
 
@@ -392,6 +412,93 @@ class PushToGist(PushTo):
         self.api_address = "https://api.github.com/gists"
         self.method = "PATCH"
 
+    def push_batch(self, items: list[tuple[str, dict, str]], retry: int = 5) -> list[bool]:
+        """
+        commit all files of the same gist in one request, so a group creates a single revision instead of one
+        per target. Batches are split by size and fall back to per-file pushes when the API answers 422
+        """
+        results, batches = [False] * len(items), {}
+        for i, (_, push_conf, group) in enumerate(items):
+            if not self.validate(push_conf=push_conf):
+                logger.error(f"[PushError] push config is invalidate, domain: {self.name}, group=[{group}]")
+                continue
+
+            batches.setdefault(utils.trim(push_conf.get("gistid", "")), []).append(i)
+
+        for indexes in batches.values():
+            for chunk in self._split(items=items, indexes=indexes):
+                for i, success in zip(chunk, self._commit(items=[items[x] for x in chunk], retry=retry)):
+                    results[i] = success
+
+        return results
+
+    def _split(self, items: list[tuple[str, dict, str]], indexes: list[int]) -> list[list[int]]:
+        chunks, chunk, size, names = [], [], 0, set()
+        for i in indexes:
+            content, push_conf, _ = items[i]
+            length, filename = len((content or "").encode("utf8")), utils.trim(push_conf.get("filename", ""))
+
+            # a file name appears once per commit, an oversized file is committed alone
+            if chunk and (size + length > self.MAX_COMMIT_SIZE or filename in names):
+                chunks.append(chunk)
+                chunk, size, names = [], 0, set()
+
+            chunk.append(i)
+            size += length
+            names.add(filename)
+
+        if chunk:
+            chunks.append(chunk)
+
+        return chunks
+
+    def _commit(self, items: list[tuple[str, dict, str]], retry: int = 5) -> list[bool]:
+        if len(items) == 1:
+            content, push_conf, group = items[0]
+            return [self.push_to(content=content, push_conf=push_conf, group=group, retry=retry)]
+
+        # labels look like group::target and targets of one group share the commit, name every group once
+        files, groups = {}, ",".join(dict.fromkeys([x[2].split("::", 1)[0] for x in items]))
+        for content, push_conf, _ in items:
+            if push_conf.get("local", ""):
+                self._storage(content=content, filename=push_conf.get("local"))
+
+            filename = utils.trim(push_conf.get("filename", ""))
+            files[filename] = {"content": content, "filename": filename}
+
+        url, _, headers = self._generate_payload(content="", push_conf=items[0][1])
+        data = json.dumps({"files": files}).encode("UTF8")
+
+        status = 0
+        for attempt in range(1, max(1, retry) + 1):
+            try:
+                request = urllib.request.Request(url=url, data=data, headers=headers, method=self.method)
+                response = utils.urlopen(request, timeout=60)
+                if self._is_success(response):
+                    logger.info(f"[PushSuccess] push {len(files)} files to {self.name} in one commit, group=[{groups}]")
+                    return [True] * len(items)
+
+                status = response.getcode()
+            except urllib.error.HTTPError as e:
+                status = e.code
+            except Exception:
+                status = 0
+                self._error_handler(group=groups)
+
+            # client errors do not change on retry
+            if 400 <= status < 500 and status != 429:
+                break
+
+            if attempt < retry:
+                utils.RETRY_POLICY.sleep(attempt)
+
+        if status == 422:
+            logger.warning(f"[PushWarn] gist rejected the batched commit, fallback to push files one by one, group=[{groups}]")
+            return [self.push_to(content=c, push_conf=p, group=g, retry=retry) for c, p, g in items]
+
+        logger.error(f"[PushError] batched commit to {self.name} failed, status: {status}, group=[{groups}]")
+        return [False] * len(items)
+
     def validate(self, push_conf: dict) -> bool:
         if not isinstance(push_conf, dict):
             return False
@@ -448,6 +555,253 @@ class PushToGist(PushTo):
 
         return f"{prefix}/raw/{filename}"
 
+    def identity(self, push_conf: dict) -> str:
+        if not push_conf or type(push_conf) != dict:
+            return ""
+
+        gistid = utils.trim(push_conf.get("gistid", ""))
+        filename = utils.trim(push_conf.get("filename", ""))
+        return f"{gistid}/{filename}" if gistid and filename else ""
+
+
+@dataclass
+class PushResult(object):
+    group: str
+
+    # uploaded or identical to the remote copy
+    success: bool = False
+
+    # upload skipped because the content did not change since the last successful push
+    skipped: bool = False
+
+    # bytes sent and seconds spent, zero when skipped
+    size: int = 0
+    cost: float = 0
+
+
+class PushScheduler(object):
+    """
+    Upload artifacts concurrently through one engine. Each push target remembers a hash of the last content pushed
+    successfully in a local state file (or compares with its raw_url when no record exists), unchanged uploads are
+    skipped. Requests to the engine are spaced by rate (uploads per second, 0 means unlimited)
+    """
+
+    def __init__(
+        self,
+        pushtool: PushTo,
+        parallelism: int = 4,
+        rate: float = 0,
+        statefile: str = "",
+        remote: bool = False,
+        retry: int = 5,
+    ) -> None:
+        self.pushtool = pushtool
+        self.parallelism = max(1, parallelism)
+        self.interval = 1.0 / rate if rate and rate > 0 else 0
+        self.statefile = statefile
+        self.remote = remote
+        self.retry = max(1, retry)
+
+        self.lock = threading.Lock()
+        self.executor = futures.ThreadPoolExecutor(max_workers=self.parallelism)
+        self.tasks = []
+        self.schedule = 0
+        self.states = {}
+
+        if self.statefile and os.path.isfile(self.statefile):
+            try:
+                with open(self.statefile, "r", encoding="utf8") as f:
+                    self.states = json.load(f) or {}
+            except Exception:
+                logger.warning(f"[PushScheduler] ignore broken push state file: {self.statefile}")
+
+    def _key(self, push_conf: dict) -> str:
+        # records follow the destination, so editing unrelated settings such as the local copy keeps them valid
+        identity = self.pushtool.identity(push_conf=push_conf)
+        if not identity:
+            text = json.dumps(push_conf, sort_keys=True, ensure_ascii=False, default=str)
+            identity = hashlib.md5(text.encode("utf8")).hexdigest()
+
+        return f"{self.pushtool.name}::{identity}"
+
+    @staticmethod
+    def _digest(content: str) -> str:
+        return hashlib.blake2b((content or "").encode("utf8"), digest_size=16).hexdigest()
+
+    def _unchanged(self, key: str, digest: str, push_conf: dict) -> bool:
+        # writing a local file is cheaper than checking it
+        if isinstance(self.pushtool, PushToLocal):
+            return False
+
+        with self.lock:
+            previous = self.states.get(key, "")
+        if previous:
+            return previous == digest
+
+        if not self.remote:
+            return False
+
+        # no local record, fetch the current remote copy which is usually much cheaper than an upload
+        try:
+            url = self.pushtool.raw_url(push_conf=push_conf)
+        except Exception:
+            url = ""
+
+        if not url or url.startswith(utils.FILEPATH_PROTOCAL):
+            return False
+
+        content = utils.http_get(url=url, retry=1, timeout=10)
+        return bool(content) and self._digest(content) == digest
+
+    def _skip(self, content: str, push_conf: dict, group: str, result: PushResult) -> None:
+        logger.info(f"[PushInfo] skip push because content not changed, engine: {self.pushtool.name}, group=[{group}]")
+        result.success, result.skipped = True, True
+
+        # the local copy is written by the upload itself, keep it in step when the upload is skipped
+        if push_conf.get("local", ""):
+            self.pushtool._storage(content=content, filename=push_conf.get("local"))
+
+    def _pace(self) -> None:
+        if self.interval <= 0:
+            return
+
+        with self.lock:
+            now = time.time()
+            start = max(now, self.schedule)
+            self.schedule = start + self.interval
+
+        if start > now:
+            time.sleep(start - now)
+
+    def _push(self, content: str, push_conf: dict, group: str) -> PushResult:
+        result = PushResult(group=group)
+        key, digest = self._key(push_conf), self._digest(content)
+
+        if self._unchanged(key=key, digest=digest, push_conf=push_conf):
+            self._skip(content=content, push_conf=push_conf, group=group, result=result)
+            with self.lock:
+                self.states[key] = digest
+            return result
+
+        self._pace()
+        starttime = time.time()
+        result.success = self.pushtool.push_to(content=content, push_conf=push_conf, group=group, retry=self.retry)
+        result.cost = time.time() - starttime
+
+        if result.success:
+            result.size = len(content.encode("utf8"))
+            with self.lock:
+                self.states[key] = digest
+
+        return result
+
+    def _push_batch(self, items: list[tuple[str, dict, str]]) -> list[PushResult]:
+        results, pending = [PushResult(group=g) for _, _, g in items], []
+        for i, (content, push_conf, group) in enumerate(items):
+            key, digest = self._key(push_conf), self._digest(content)
+            if self._unchanged(key=key, digest=digest, push_conf=push_conf):
+                self._skip(content=content, push_conf=push_conf, group=group, result=results[i])
+                with self.lock:
+                    self.states[key] = digest
+            else:
+                pending.append(i)
+
+        if not pending:
+            return results
+
+        self._pace()
+        starttime = time.time()
+        outcomes = self.pushtool.push_batch(items=[items[i] for i in pending], retry=self.retry)
+        cost = time.time() - starttime
+
+        # the batch is one upload, its cost is recorded once on the first item
+        for i, success in zip(pending, outcomes):
+            content, push_conf, _ = items[i]
+            results[i].success, results[i].cost = success, cost if i == pending[0] else 0
+            if success:
+                results[i].size = len(content.encode("utf8"))
+                with self.lock:
+                    self.states[self._key(push_conf)] = self._digest(content)
+
+        return results
+
+    def submit(self, content: str, push_conf: dict, group: str = "") -> futures.Future:
+        """queue an upload, it starts as soon as a worker is free"""
+        future = self.executor.submit(self._push, content, push_conf, group)
+        self.tasks.append(future)
+        return future
+
+    def submit_batch(self, items: list[tuple[str, dict, str]]) -> futures.Future:
+        """queue (content, push_conf, group) uploads that the engine may commit together, resolves to a list of results"""
+        if type(self.pushtool).push_batch is not PushTo.push_batch:
+            future = self.executor.submit(self._push_batch, items)
+            self.tasks.append(future)
+            return future
+
+        # the engine pushes files one by one anyway, run them as separate jobs so they upload in parallel
+        parts = [self.submit(content=c, push_conf=p, group=g) for c, p, g in items]
+        future, remain, lock = futures.Future(), [len(parts)], threading.Lock()
+
+        def collect(_: futures.Future) -> None:
+            with lock:
+                remain[0] -= 1
+                if remain[0] > 0:
+                    return
+
+            results = []
+            for part, (_, _, group) in zip(parts, items):
+                results.append(part.result() if not part.exception() else PushResult(group=group))
+            future.set_result(results)
+
+        if not parts:
+            future.set_result([])
+        for part in parts:
+            part.add_done_callback(collect)
+
+        return future
+
+    def join(self) -> list[PushResult]:
+        """wait for all queued uploads, persist hashes of successful pushes and log per engine stats"""
+        results = []
+        for future in self.tasks:
+            try:
+                result = future.result()
+                results.extend(result if isinstance(result, list) else [result])
+            except Exception:
+                logger.error(f"[PushScheduler] push task error, message: \n{traceback.format_exc()}")
+
+        self.tasks = []
+        self.save()
+
+        uploaded = [r for r in results if r.success and not r.skipped]
+        skipped = [r for r in results if r.skipped]
+        failed = [r for r in results if not r.success]
+        logger.info(
+            f"[PushScheduler] engine: {self.pushtool.name}, uploaded: {len(uploaded)}, skipped: {len(skipped)}, failed: {len(failed)}, "
+            f"bytes: {sum(r.size for r in uploaded)}, cost: {sum(r.cost for r in results):.2f}s"
+        )
+
+        return results
+
+    def save(self) -> None:
+        if not self.statefile:
+            return
+
+        with self.lock:
+            states = dict(self.states)
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.statefile)), exist_ok=True)
+            tmpfile = f"{self.statefile}.tmp"
+            with open(tmpfile, "w+", encoding="utf8") as f:
+                json.dump(states, f, indent=2, sort_keys=True)
+            os.replace(tmpfile, self.statefile)
+        except Exception:
+            logger.error(f"[PushScheduler] cannot save push state to {self.statefile}")
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
+
 
 ENGINE_MAPPING = {
     "imperialb.in": "imperialb",
@@ -106,7 +106,7 @@ def login(url: str, params: dict, headers: dict, retry: int = 3) -> tuple[str, s
         data = urllib.parse.urlencode(params).encode(encoding="UTF8")
         request = urllib.request.Request(url, data=data, headers=headers, method="POST")
 
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         cookies, authorization = "", ""
         if response.getcode() == 200:
             cookies = response.getheader("Set-Cookie")
@@ -136,7 +136,7 @@ def order(url: str, params: dict, headers: dict, retry: int = 3) -> str:
         data = urllib.parse.urlencode(params).encode(encoding="UTF8")
         request = urllib.request.Request(url, data=data, headers=headers, method="POST")
 
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         trade_no = None
         if response.getcode() == 200:
             result = json.loads(response.read().decode("UTF8"))
@@ -159,7 +159,7 @@ def order(url: str, params: dict, headers: dict, retry: int = 3) -> str:
 def fetch(url: str, headers: dict, retry: int = 3) -> str:
     try:
         request = urllib.request.Request(url, headers=headers, method="GET")
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         if response.getcode() != 200:
             logger.info(response.read().decode("UTF8"))
             return None
@@ -187,7 +187,7 @@ def payment(url: str, params: dict, headers: dict, retry: int = 3) -> bool:
         data = urllib.parse.urlencode(params).encode(encoding="UTF8")
         request = urllib.request.Request(url, data=data, headers=headers, method="POST")
 
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         success = False
         if response.getcode() == 200:
             result = json.loads(response.read().decode("UTF8"))
@@ -229,7 +229,7 @@ def checkout(
         payload = urllib.parse.urlencode(params).encode(encoding="UTF8")
         request = urllib.request.Request(url, data=payload, headers=headers, method="POST")
 
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         data = {}
         if response.getcode() == 200:
             result = json.loads(response.read().decode("UTF8"))
@@ -310,7 +310,7 @@ def close_ticket(domain: str, tid: int, headers: dict, retry: int = 3) -> bool:
     try:
         data = urllib.parse.urlencode(params).encode(encoding="UTF8")
         request = urllib.request.Request(url, data=data, headers=headers, method="POST")
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         if response.getcode() == 200:
             content = response.read().decode("UTF8")
             try:
@@ -382,7 +382,7 @@ def submit_ticket(
     try:
         data = urllib.parse.urlencode(params).encode(encoding="UTF8")
         request = urllib.request.Request(url, data=data, headers=headers, method="POST")
-        response = urllib.request.urlopen(request, timeout=10, context=utils.CTX)
+        response = utils.urlopen(request, timeout=10)
         if response.getcode() == 200:
             content = response.read().decode("UTF8")
             try:
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+import asyncio
+import ipaddress
+import json
+import os
+import socket
+import threading
+import time
+from concurrent import futures
+
+from logger import logger
+
+
+class Resolver(object):
+    """
+    Bulk DNS resolver: hostnames are deduplicated, resolved concurrently with asyncio and cached with a TTL
+    in memory and optionally in a json file across runs. Failed lookups are cached with a shorter TTL
+    """
+
+    def __init__(
+        self,
+        ttl: float = 1800,
+        negative_ttl: float = 300,
+        concurrency: int = 64,
+        timeout: float = 5,
+        cachefile: str = "",
+    ) -> None:
+        self.ttl = max(0, ttl)
+        self.negative_ttl = max(0, negative_ttl)
+        self.concurrency = max(1, concurrency)
+        self.timeout = max(1, timeout)
+        self.cachefile = cachefile
+        self.lock = threading.Lock()
+
+        # host -> (ip, expire time), empty ip means the lookup failed
+        self.cache = {}
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+        if self.cachefile:
+            self.load()
+
+    def load(self) -> None:
+        if not self.cachefile or not os.path.isfile(self.cachefile):
+            return
+
+        try:
+            with open(self.cachefile, "r", encoding="utf8") as f:
+                records = json.load(f)
+
+            now = time.time()
+            with self.lock:
+                for host, item in records.items():
+                    if isinstance(item, list) and len(item) == 2 and item[1] > now:
+                        self.cache[host] = (item[0], item[1])
+        except Exception:
+            logger.warning(f"[Resolver] ignore broken dns cache file: {self.cachefile}")
+
+    def save(self) -> None:
+        if not self.cachefile:
+            return
+
+        now = time.time()
+        with self.lock:
+            records = {k: [v[0], v[1]] for k, v in self.cache.items() if v[1] > now}
+
+        try:
+            directory = os.path.dirname(os.path.abspath(self.cachefile))
+            os.makedirs(directory, exist_ok=True)
+
+            tmpfile = f"{self.cachefile}.tmp"
+            with open(tmpfile, "w+", encoding="utf8") as f:
+                json.dump(records, f)
+            os.replace(tmpfile, self.cachefile)
+        except Exception:
+            logger.error(f"[Resolver] cannot save dns cache to {self.cachefile}")
+
+    def get(self, host: str) -> str:
+        """cached address of host, resolves synchronously on a cache miss"""
+        return self.resolve([host]).get(host, "")
+
+    def _lookup_cache(self, host: str, now: float) -> tuple[bool, str]:
+        item = self.cache.get(host, None)
+        if item is None or item[1] <= now:
+            return False, ""
+
+        return True, item[0]
+
+    async def _query(self, loop: asyncio.AbstractEventLoop, semaphore: asyncio.Semaphore, host: str) -> str:
+        async with semaphore:
+            try:
+                infos = await asyncio.wait_for(
+                    loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM),
+                    timeout=self.timeout,
+                )
+                return infos[0][4][0] if infos else ""
+            except Exception:
+                return ""
+
+    async def _resolve_all(self, hosts: list[str]) -> dict[str, str]:
+        loop = asyncio.get_running_loop()
+
+        # getaddrinfo is blocking, run lookups in an executor as wide as the wanted concurrency
+        executor = futures.ThreadPoolExecutor(max_workers=min(self.concurrency, len(hosts)))
+        loop.set_default_executor(executor)
+        try:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            answers = await asyncio.gather(*[self._query(loop, semaphore, host) for host in hosts])
+        finally:
+            executor.shutdown(wait=False)
+
+        return dict(zip(hosts, answers))
+
+    def resolve(self, hosts: list[str]) -> dict[str, str]:
+        """resolve hostnames to ipv4 addresses, returns a mapping for every input host (empty string on failure)"""
+        results, pending, now = {}, set(), time.time()
+
+        with self.lock:
+            for host in hosts:
+                host = (host or "").strip().lower().rstrip(".")
+                if not host or host in results or host in pending:
+                    continue
+
+                try:
+                    results[host] = str(ipaddress.ip_address(host.strip("[]")))
+                    continue
+                except ValueError:
+                    pass
+
+                found, address = self._lookup_cache(host, now)
+                if found:
+                    self.hits += 1
+                    results[host] = address
+                else:
+                    self.misses += 1
+                    pending.add(host)
+
+        if pending:
+            answers = asyncio.run(self._resolve_all(list(pending)))
+
+            now = time.time()
+            with self.lock:
+                for host, address in answers.items():
+                    if not address:
+                        self.failures += 1
+
+                    expire = now + (self.ttl if address else self.negative_ttl)
+                    self.cache[host] = (address, expire)
+                    results[host] = address
+
+        # keep the original spelling of every input as a key
+        mapping = {}
+        for host in hosts:
+            key = (host or "").strip().lower().rstrip(".")
+            if key in results:
+                mapping[host] = results[key]
+
+        return mapping
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self.cache),
+                "hits": self.hits,
+                "misses": self.misses,
+                "failures": self.failures,
+                "ratio": round(self.hits / total, 4) if total else 0.0,
+            }
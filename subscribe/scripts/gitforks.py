@@ -10,6 +10,7 @@ import time
 from copy import deepcopy
 
 import crawl
+import extractor
 import push
 import utils
 from logger import logger
@@ -156,7 +157,7 @@ def collect_subs(params: dict) -> list[dict]:
 
     # load old subscriptions
     content = utils.http_get(url=pushtool.raw_url(persist), timeout=30)
-    urls = re.findall(r"^https?:\/\/[^\s]+", content, flags=re.M)
+    urls = extractor.URL_LINE.findall(content)
     for url in urls:
         url = github_warp(ghproxy=ghproxy, url=url)
         materials[url] = update_conf(config=config, sub=url)
@@ -15,6 +15,7 @@ from copy import deepcopy
 from datetime import datetime, timedelta, timezone
 from xml.etree import ElementTree
 
+import extractor
 import push
 import utils
 import workflow
@@ -166,8 +167,10 @@ def fetchone(
     ignore: str = "",
     repeat: int = 1,
     noproxies: bool = False,
+    maxsize: int = 524288,
 ) -> tuple[list, list]:
-    content = utils.http_get(url=url)
+    # listed sizes may be stale, the download itself is capped as well
+    content = utils.http_get(url=url, max_size=maxsize)
     if not content:
         return [], []
 
@@ -175,8 +178,7 @@ def fetchone(
     proxies, subscriptions = [], []
 
     if not utils.isb64encode(content=content):
-        regex = r"(?:https?://)?(?:[a-zA-Z0-9\u4e00-\u9fa5\-]+\.)+[a-zA-Z0-9\u4e00-\u9fa5\-]+(?:(?:(?:/index.php)?/api/v1/client/subscribe\?token=[a-zA-Z0-9]{16,32})|(?:/link/[a-zA-Z0-9]+\?(?:sub|mu|clash)=\d))"
-        groups = re.findall(regex, content, flags=re.I)
+        groups = extractor.SUBSCRIBE_LOOSE.findall(content)
         if groups:
             subscriptions = list(set([utils.url_complete(x) for x in groups if x]))
 
@@ -255,7 +257,7 @@ def fetch(params: dict) -> list:
 
     links = utils.multi_thread_run(func=list_files, tasks=partitions)
     files = list(set(itertools.chain.from_iterable(links)))
-    array = [[x, nopublic, exclude, ignore, repeat, noproxies] for x in files if x]
+    array = [[x, nopublic, exclude, ignore, repeat, noproxies, maxsize] for x in files if x]
 
     if not array:
         logger.error(f"[V2RaySE] cannot found any valid shared file, dates: {dates}")
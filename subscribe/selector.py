@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import json
+import os
+import re
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+
+import utils
+from logger import logger
+
+# history records not refreshed for this many seconds are dropped
+HISTORY_TTL = 30 * 86400
+
+
+def endpoint(proxy: dict) -> str:
+    """stable identity of a node, names change when proxies are renamed but the endpoint does not"""
+    if not proxy or not isinstance(proxy, dict):
+        return ""
+
+    return f"{proxy.get('type', '')}://{utils.trim(str(proxy.get('server', ''))).lower()}:{proxy.get('port', '')}"
+
+
+def region(name: str) -> str:
+    """name without its numbering suffix, e.g. '美国 03' -> '美国'"""
+    return re.sub(r"(\d+|(\d+)?(-\d+)?[A-Z])$", "", name or "", flags=re.I).strip()
+
+
+@dataclass
+class Selection(object):
+    # nodes per bucket, 0 or less keeps everything
+    top: int = 0
+
+    # bucket patterns matched against node names in order, nodes are bucketed by region when empty
+    patterns: list[str] = None
+
+    # how much the delay deviation across test targets weighs against the mean delay
+    jitter: float = 1.0
+
+    # smoothing factor of the historical stability, a higher value forgets the past faster
+    alpha: float = 0.3
+
+    @classmethod
+    def parse(cls, config: dict) -> "Selection":
+        config = config if isinstance(config, dict) else {}
+
+        try:
+            top = int(config.get("top", 0))
+        except (TypeError, ValueError):
+            top = 0
+
+        patterns = [x for x in config.get("patterns", []) or [] if isinstance(x, str) and x.strip()]
+        try:
+            jitter = max(0.0, float(config.get("jitter", 1.0)))
+            alpha = min(1.0, max(0.01, float(config.get("alpha", 0.3))))
+        except (TypeError, ValueError):
+            jitter, alpha = 1.0, 0.3
+
+        return cls(top=top, patterns=patterns, jitter=jitter, alpha=alpha)
+
+
+class Selector(object):
+    """
+    Ranks alive nodes by the delays measured during the liveness check, their deviation across test targets
+    and their historical stability, then keeps the best K nodes of every bucket with a bounded heap. Stability
+    is an exponentially weighted success ratio per endpoint persisted in statefile between runs
+    """
+
+    def __init__(self, statefile: str = "", limit: int = 5000) -> None:
+        self.statefile = statefile
+        self.lock = threading.Lock()
+
+        # delay assumed for nodes without measurement, e.g. when the check was skipped
+        self.limit = max(1, limit)
+
+        # endpoint -> delays measured in this run, filled by clash.check
+        self.samples: dict[str, list[int]] = {}
+
+        # endpoint -> {stability, updated}
+        self.history: dict[str, dict] = {}
+
+        self.load()
+
+    def load(self) -> None:
+        if not self.statefile or not os.path.isfile(self.statefile):
+            return
+
+        try:
+            with open(self.statefile, "r", encoding="utf8") as f:
+                records = json.load(f)
+
+            expire = time.time() - HISTORY_TTL
+            self.history = {k: v for k, v in records.items() if isinstance(v, dict) and v.get("updated", 0) > expire}
+        except Exception:
+            logger.warning(f"[Selector] ignore broken node history file: {self.statefile}")
+
+    def save(self) -> None:
+        if not self.statefile:
+            return
+
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.statefile)), exist_ok=True)
+            tmpfile = f"{self.statefile}.tmp"
+            with self.lock, open(tmpfile, "w+", encoding="utf8") as f:
+                json.dump(self.history, f)
+            os.replace(tmpfile, self.statefile)
+        except Exception:
+            logger.error(f"[Selector] cannot save node history to {self.statefile}")
+
+    def observe(self, proxies: list[dict], alpha: float = 0.3) -> None:
+        """fold the check outcome of proxies into the historical stability, alive nodes are the ones with samples"""
+        now, seen = time.time(), set()
+        with self.lock:
+            for proxy in proxies or []:
+                # siblings share the endpoint record, fold every endpoint in only once per run
+                key = endpoint(proxy)
+                if not key or key in seen:
+                    continue
+
+                seen.add(key)
+
+                success = 1.0 if self.samples.get(key) else 0.0
+                record = self.history.get(key, None)
+                stability = success if record is None else alpha * success + (1 - alpha) * record.get("stability", 1.0)
+                self.history[key] = {"stability": round(stability, 4), "updated": now}
+
+    def score(self, proxy: dict, jitter: float = 1.0) -> float:
+        """lower is better: mean delay plus weighted deviation, divided by the historical stability"""
+        key = endpoint(proxy)
+        delays = self.samples.get(key, None)
+        if delays:
+            mean = statistics.fmean(delays)
+            deviation = statistics.pstdev(delays) if len(delays) > 1 else 0
+        else:
+            mean, deviation = self.limit, 0
+
+        stability = self.history.get(key, {}).get("stability", 1.0)
+        return (mean + jitter * deviation) / max(stability, 0.05)
+
+    def bucket(self, proxy: dict, patterns: list[re.Pattern]) -> str:
+        name = proxy.get("name", "")
+        for pattern in patterns:
+            if pattern.search(name):
+                return pattern.pattern
+
+        return region(name)
+
+    def pick(self, proxies: list[dict], selection: Selection) -> list[dict]:
+        """keep the top K nodes of every bucket, buckets keep their first-seen order and nodes are sorted by score"""
+        if not proxies or not selection or selection.top <= 0:
+            return proxies
+
+        patterns = []
+        for text in selection.patterns or []:
+            try:
+                patterns.append(re.compile(text, flags=re.I))
+            except re.error:
+                logger.error(f"[Selector] ignore invalid bucket pattern: {text}")
+
+        buckets: dict[str, list] = {}
+        for index, proxy in enumerate(proxies):
+            if not proxy or not isinstance(proxy, dict):
+                continue
+
+            heap = buckets.setdefault(self.bucket(proxy, patterns), [])
+
+            # max-heap on score through negation, the worst kept node is evicted first
+            item = (-self.score(proxy, selection.jitter), -index, proxy)
+            if len(heap) < selection.top:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+
+        results = []
+        for heap in buckets.values():
+            results.extend([x[2] for x in sorted(heap, reverse=True)])
+
+        logger.info(
+            f"[Selector] kept {len(results)} of {len(proxies)} nodes in {len(buckets)} buckets, top: {selection.top}"
+        )
+        return results
@@ -135,3 +135,76 @@ def convert(binname: str, artifact: str = "") -> bool:
 
 def getpath() -> str:
     return os.path.join(PATH, "subconverter")
+
+
+def batch_convert(binname: str, source: str, targets: list[dict], filepath: str = "") -> dict[tuple[str, bool], str]:
+    """
+    write one generate.ini section per target and run subconverter once for all of them,
+    each target is a dict with keys: target, emoji, list_only, ignore_exclude.
+    returns the paths of converted files keyed by (target, list_only), failed targets are absent
+    """
+    if not source or not targets:
+        return {}
+
+    filepath = filepath or os.path.join(PATH, "subconverter", "generate.ini")
+    if os.path.exists(filepath) and os.path.isfile(filepath):
+        os.remove(filepath)
+
+    sections, dests = {}, set()
+    for item in targets:
+        target = utils.trim(item.get("target", "")).lower()
+        list_only = item.get("list_only", True)
+        dest = get_filename(target=target)
+        if not dest:
+            logger.error(f"unsupported subconverter target: {target}")
+            continue
+
+        key = (target, list_only)
+        if key in sections:
+            continue
+
+        artifact = f'convert_{target.replace("&", "_").replace("=", "_")}'
+
+        # the same target may be asked for both as a proxy list and as a full config, give each its own file
+        if dest in dests:
+            variant = "list" if list_only else "full"
+            name, extension = os.path.splitext(dest)
+            dest, artifact = f"{name}-{variant}{extension}", f"{artifact}_{variant}"
+
+        success = generate_conf(
+            filepath=filepath,
+            name=artifact,
+            source=source,
+            dest=dest,
+            target=target,
+            emoji=item.get("emoji", True),
+            list_only=list_only,
+            ignore_exclude=item.get("ignore_exclude", False),
+        )
+        if not success:
+            logger.error(f"cannot generate subconverter config file for target: {target}")
+            continue
+
+        # stale outputs of a previous run must not be taken as results of this one
+        output = os.path.join(PATH, "subconverter", dest)
+        if os.path.exists(output) and os.path.isfile(output):
+            os.remove(output)
+
+        sections[key] = output
+        dests.add(dest)
+
+    if not sections:
+        return {}
+
+    # without --artifact subconverter processes every section of the generate file in one launch
+    convert(binname=binname, artifact="")
+
+    results = {}
+    for key, output in sections.items():
+        if os.path.exists(output) and os.path.isfile(output):
+            results[key] = output
+        else:
+            logger.error(f"subconverter convert failed, target: {key[0]}, list_only: {key[1]}")
+
+    logger.info(f"subconverter converted {len(results)}/{len(sections)} targets: {[x[0] for x in results]}")
+    return results
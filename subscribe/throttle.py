@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+
+import threading
+import time
+import urllib
+import urllib.parse
+from contextlib import contextmanager
+
+
+class Throttle(object):
+    """
+    Process-wide request budget: at most concurrency requests are in flight across all threads, and hosts
+    with a configured rate are spaced to at most that many requests per second, e.g. to keep the GitHub
+    API within its quota while several spiders share the same host
+    """
+
+    def __init__(self, concurrency: int = 0, rates: dict[str, float] = None) -> None:
+        self.lock = threading.Lock()
+        self.configure(concurrency=concurrency, rates=rates)
+
+    def configure(self, concurrency: int = 0, rates: dict[str, float] = None) -> None:
+        """concurrency <= 0 means unlimited, rates maps a hostname to requests per second"""
+        with self.lock:
+            self.concurrency = max(0, concurrency)
+            self.semaphore = threading.BoundedSemaphore(self.concurrency) if self.concurrency > 0 else None
+            self.rates = {k.strip().lower(): float(v) for k, v in (rates or {}).items() if k and v and v > 0}
+
+            # host -> earliest time the next request may start
+            self.schedules = {}
+            self.waited = {}
+
+    def reset(self) -> None:
+        self.configure(concurrency=0, rates=None)
+
+    def _reserve(self, url: str) -> float:
+        """book the next start time of the host and return how long the caller must wait"""
+        try:
+            host = (urllib.parse.urlsplit(url).hostname or "").lower()
+        except ValueError:
+            return 0
+
+        with self.lock:
+            rate = self.rates.get(host, 0)
+            if rate <= 0:
+                return 0
+
+            now = time.time()
+            start = max(now, self.schedules.get(host, 0))
+            self.schedules[host] = start + 1.0 / rate
+
+            delay = start - now
+            if delay > 0:
+                self.waited[host] = self.waited.get(host, 0) + delay
+            return delay
+
+    @contextmanager
+    def slot(self, url: str):
+        """hold one unit of the global budget while the request to url is running"""
+        # wait for the host first so that a rate limited request does not hold the budget while sleeping
+        delay = self._reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+
+        semaphore = self.semaphore
+        if semaphore is not None:
+            semaphore.acquire()
+
+        try:
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "concurrency": self.concurrency,
+                "rates": dict(self.rates),
+                "waited": {k: round(v, 2) for k, v in self.waited.items()},
+            }
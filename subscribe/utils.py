@@ -3,7 +3,6 @@
 # @Author  : wzdnzd
 # @Time    : 2022-07-15
 
-import gzip
 import json
 import multiprocessing
 import os
@@ -26,6 +25,9 @@ import uuid
 from concurrent import futures
 from http.client import HTTPMessage, HTTPResponse
 
+import breaker
+import httpclient
+import throttle
 from logger import logger
 from tqdm import tqdm
 from urlvalidator import isurl
@@ -34,6 +36,18 @@ CTX = ssl.create_default_context()
 CTX.check_hostname = False
 CTX.verify_mode = ssl.CERT_NONE
 
+# keep-alive connections shared by http_get and http_post, one pool per process
+POOL = httpclient.ConnectionPool(maxsize=128, per_host=8, idle_timeout=60, context=CTX)
+
+# default backoff between two attempts of the same request
+RETRY_POLICY = breaker.RetryPolicy(attempts=3, backoff=0.5, factor=2, max_delay=10)
+
+# hosts failing repeatedly are short-circuited for every task in the process
+BREAKER = breaker.CircuitBreaker(threshold=5, cooldown=30, max_cooldown=600)
+
+# global request budget and per-host rate limits, unlimited until a caller configures it
+THROTTLE = throttle.Throttle()
+
 USER_AGENT = (
     "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
 )
@@ -72,6 +86,8 @@ def http_get(
     interval: float = 0,
     timeout: float = 10,
     trace: bool = False,
+    policy: breaker.RetryPolicy = None,
+    max_size: int = httpclient.MAX_BODY_SIZE,
 ) -> str:
     if not isurl(url=url):
         logger.error(f"invalid url: {url}")
@@ -82,78 +98,145 @@ def http_get(
         return ""
 
     headers = DEFAULT_HTTP_HEADERS if not headers else headers
-
-    interval = max(0, interval)
     timeout = max(1, timeout)
-    try:
-        url = encoding_url(url=url)
-        if params and isinstance(params, dict):
-            data = urllib.parse.urlencode(params)
-            if "?" in url:
-                url += f"&{data}"
-            else:
-                url += f"?{data}"
 
-        request = urllib.request.Request(url=url, headers=headers)
-        if proxy and (proxy.startswith("https://") or proxy.startswith("http://")):
-            host, protocal = "", ""
-            if proxy.startswith("https://"):
-                host, protocal = proxy[8:], "https"
-            else:
-                host, protocal = proxy[7:], "http"
-            request.set_proxy(host=host, type=protocal)
+    # interval keeps its meaning as the first delay, grows exponentially with jitter afterwards
+    policy = policy or breaker.RetryPolicy(attempts=retry, backoff=max(interval, RETRY_POLICY.backoff))
 
-        response = urllib.request.urlopen(request, timeout=timeout, context=CTX)
-        content = response.read()
-        status_code = response.getcode()
-        try:
-            content = str(content, encoding="utf8")
-        except:
-            content = gzip.decompress(content).decode("utf8")
-        if status_code != 200:
-            if trace:
-                logger.error(f"request failed, url: {hide(url)}, code: {status_code}, message: {content}")
+    url = encoding_url(url=url)
+    if params and isinstance(params, dict):
+        data = urllib.parse.urlencode(params)
+        if "?" in url:
+            url += f"&{data}"
+        else:
+            url += f"?{data}"
 
+    for attempt in range(1, max(1, policy.attempts) + 1):
+        if not BREAKER.allow(url):
+            logger.debug(f"skip request because circuit is open, url: {hide(url)}")
             return ""
 
-        return content
-    except urllib.error.URLError as e:
-        if isinstance(e.reason, (socket.timeout, ssl.SSLError)):
-            time.sleep(interval)
-            return http_get(
-                url=url,
-                headers=headers,
-                params=params,
-                retry=retry - 1,
-                proxy=proxy,
-                interval=interval,
-                timeout=timeout,
-            )
-        else:
+        try:
+            with THROTTLE.slot(url):
+                if proxy and (proxy.startswith("https://") or proxy.startswith("http://")):
+                    request = urllib.request.Request(url=url, headers=headers)
+                    host, protocal = "", ""
+                    if proxy.startswith("https://"):
+                        host, protocal = proxy[8:], "https"
+                    else:
+                        host, protocal = proxy[7:], "http"
+                    request.set_proxy(host=host, type=protocal)
+
+                    response = urllib.request.urlopen(request, timeout=timeout, context=CTX)
+                else:
+                    response = POOL.request(method="GET", url=url, headers=headers, timeout=timeout)
+
+                status_code = response.getcode()
+                BREAKER.record(url=url, status=status_code)
+
+                content = httpclient.decode_body(httpclient.read_body(response, max_size=max_size), response.headers)
+                if status_code != 200:
+                    if trace:
+                        logger.error(f"request failed, url: {hide(url)}, code: {status_code}, message: {content}")
+
+                    return ""
+
+                return content
+        except httpclient.BodyTooLargeError as e:
+            logger.warning(f"abort download, body exceeds {e.limit} bytes, size: {e.size}, url: {hide(url)}")
             return ""
-    except Exception as e:
-        if trace:
-            logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
+        except urllib.error.HTTPError as e:
+            BREAKER.record(url=url, error=e)
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
 
-        if isinstance(e, urllib.error.HTTPError):
             try:
                 message = str(e.read(), encoding="utf8")
             except:
                 message = "unknown error"
 
+            # only service unavailable is worth another try, the rest is a definite answer
             if e.code != 503 or "token" in message:
                 return ""
+        except urllib.error.URLError as e:
+            BREAKER.record(url=url, error=e)
+            if not isinstance(e.reason, (socket.timeout, ssl.SSLError)):
+                return ""
+        except Exception as e:
+            BREAKER.record(url=url, error=e)
+            if trace:
+                logger.error(f"request failed, url: {hide(url)}, message: \n{traceback.format_exc()}")
+
+        if attempt < policy.attempts:
+            policy.sleep(attempt)
+
+    logger.debug(f"achieves max retry, url={hide(url=url)}")
+    return ""
 
-        time.sleep(interval)
-        return http_get(
-            url=url,
-            headers=headers,
-            params=params,
-            retry=retry - 1,
-            proxy=proxy,
-            interval=interval,
-            timeout=timeout,
-        )
+
+def http_revalidate(
+    url: str,
+    headers: dict = None,
+    etag: str = "",
+    modified: str = "",
+    retry: int = 3,
+    timeout: float = 10,
+    max_size: int = httpclient.MAX_BODY_SIZE,
+) -> tuple[int, str, dict]:
+    """
+    conditional GET carrying the validators of a cached copy, returns (status, content, validators).
+    status 304 means the cached copy is still fresh, 0 means the request failed
+    """
+    if not isurl(url=url):
+        logger.error(f"invalid url: {url}")
+        return 0, "", {}
+
+    headers = dict(DEFAULT_HTTP_HEADERS if not headers else headers)
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+
+    url, timeout = encoding_url(url=url), max(1, timeout)
+    for attempt in range(1, max(1, retry) + 1):
+        if not BREAKER.allow(url):
+            logger.debug(f"skip request because circuit is open, url: {hide(url)}")
+            return 0, "", {}
+
+        try:
+            with THROTTLE.slot(url):
+                response = POOL.request(method="GET", url=url, headers=headers, timeout=timeout)
+                status_code = response.getcode()
+                BREAKER.record(url=url, status=status_code)
+
+                validators = {
+                    "etag": response.getheader("ETag", "") or "",
+                    "modified": response.getheader("Last-Modified", "") or "",
+                }
+
+                content = httpclient.decode_body(httpclient.read_body(response, max_size=max_size), response.headers)
+                if status_code == 304:
+                    return status_code, "", validators
+
+                return (status_code, content, validators) if status_code == 200 else (status_code, "", {})
+        except httpclient.BodyTooLargeError as e:
+            logger.warning(f"abort download, body exceeds {e.limit} bytes, size: {e.size}, url: {hide(url)}")
+            return 0, "", {}
+        except urllib.error.HTTPError as e:
+            BREAKER.record(url=url, error=e)
+            if e.code != 503:
+                return e.code, "", {}
+        except urllib.error.URLError as e:
+            BREAKER.record(url=url, error=e)
+            if not isinstance(e.reason, (socket.timeout, ssl.SSLError)):
+                return 0, "", {}
+        except Exception as e:
+            BREAKER.record(url=url, error=e)
+
+        if attempt < retry:
+            RETRY_POLICY.sleep(attempt)
+
+    return 0, "", {}
 
 
 def extract_domain(url: str, include_protocal: bool = False) -> str:
@@ -370,33 +453,74 @@ def http_post(
     retry: int = 3,
     timeout: float = 6,
     allow_redirects: bool = True,
-) -> HTTPResponse:
+) -> httpclient.Response:
     if params is None or type(params) != dict or retry <= 0:
         return None
 
-    timeout, retry = max(timeout, 1), retry - 1
+    timeout = max(timeout, 1)
     if not headers:
         headers = {
             "User-Agent": USER_AGENT,
             "Content-Type": "application/json",
         }
+
+    data = json.dumps(params).encode(encoding="UTF8")
+    for attempt in range(1, retry + 1):
+        if not BREAKER.allow(url):
+            logger.debug(f"skip request because circuit is open, url: {hide(url)}")
+            return None
+
+        try:
+            with THROTTLE.slot(url):
+                response = POOL.request(
+                    method="POST",
+                    url=url,
+                    body=data,
+                    headers=headers,
+                    timeout=timeout,
+                    allow_redirects=allow_redirects,
+                )
+            BREAKER.record(url=url, status=response.getcode())
+            return response
+        except Exception as e:
+            BREAKER.record(url=url, error=e)
+
+            # client errors will not change on retry
+            if isinstance(e, urllib.error.HTTPError) and e.code < 500 and e.code != 429:
+                return None
+
+        if attempt < retry:
+            RETRY_POLICY.sleep(attempt)
+
+    return None
+
+
+def urlopen(request: urllib.request.Request, timeout: float = 10) -> HTTPResponse:
+    """
+    urllib.request.urlopen guarded by the shared circuit breaker, raises breaker.CircuitOpenError
+    without touching the network when the target host keeps failing
+    """
+    url = request.full_url
+    BREAKER.check(url)
+
     try:
-        data = json.dumps(params).encode(encoding="UTF8")
-        request = urllib.request.Request(url=url, data=data, headers=headers, method="POST")
-        if allow_redirects:
-            return urllib.request.urlopen(request, timeout=timeout, context=CTX)
-
-        opener = urllib.request.build_opener(NoRedirect)
-        return opener.open(request, timeout=timeout)
-    except Exception:
-        time.sleep(random.random())
-        return http_post(
-            url=url,
-            headers=headers,
-            params=params,
-            retry=retry,
-            allow_redirects=allow_redirects,
-        )
+        with THROTTLE.slot(url):
+            response = urllib.request.urlopen(request, timeout=timeout, context=CTX)
+        BREAKER.record(url=url, status=response.getcode())
+        return response
+    except Exception as e:
+        BREAKER.record(url=url, error=e)
+        raise
+
+
+def http_stats() -> dict[str, dict]:
+    """per-host connection reuse stats of http_get and http_post in the current process"""
+    return POOL.stats()
+
+
+def breaker_stats() -> dict[str, dict]:
+    """per-host circuit state of the current process"""
+    return BREAKER.stats()
 
 
 def verify_uuid(text: str) -> bool:
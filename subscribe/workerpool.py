@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+import atexit
+import multiprocessing
+import threading
+import time
+import typing
+from collections import deque
+from dataclasses import dataclass
+from multiprocessing.connection import Connection, wait
+
+from logger import logger
+
+
+@dataclass
+class JobRecord(object):
+    # job name, e.g. the script path
+    name: str
+
+    # wall-clock seconds spent in the worker
+    cost: float = 0
+
+    # number of items returned when the result is a list or dict
+    count: int = 0
+
+    # failure reason, empty when the job succeeded
+    error: str = ""
+
+
+@dataclass
+class Worker(object):
+    process: multiprocessing.Process
+    conn: Connection
+
+    # name of the running job and the moment it must be finished, None when idle
+    job: str = None
+    deadline: float = 0
+    start: float = 0
+
+
+def serve(conn: Connection, func: typing.Callable) -> None:
+    """worker loop: receive (name, args) over the pipe, run func and send back (name, result, error)"""
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+
+        if job is None:
+            break
+
+        name, args = job
+        try:
+            result, error = func(*args), ""
+        except Exception as e:
+            result, error = None, f"{type(e).__name__}: {e}"
+
+        try:
+            conn.send((name, result, error))
+        except Exception as e:
+            conn.send((name, None, f"cannot send result: {type(e).__name__}: {e}"))
+
+
+class WorkerPool(object):
+    """
+    Persistent pool of worker processes that run func(*args) jobs. Each worker talks to the parent through its
+    own pipe, results are streamed back as soon as a job finishes, and a job exceeding its wall-clock timeout
+    is cancelled by terminating its worker, which is replaced on demand. Workers are not daemonic so jobs may
+    start processes of their own, func must be importable by module name since workers are spawned
+    """
+
+    def __init__(self, func: typing.Callable, size: int = 8, timeout: float = 1800) -> None:
+        self.func = func
+        self.size = max(1, size)
+        self.timeout = max(1, timeout)
+        self.workers: list[Worker] = []
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # workers are started lazily while other threads may hold locks (throttle, breaker, connection pool),
+        # a forked child could inherit them held forever, so start clean interpreters instead
+        self.context = multiprocessing.get_context("spawn")
+
+        atexit.register(self.shutdown)
+
+    def _spawn(self) -> Worker:
+        parent, child = self.context.Pipe(duplex=True)
+        process = self.context.Process(target=serve, args=(child, self.func), daemon=False)
+        process.start()
+        child.close()
+
+        worker = Worker(process=process, conn=parent)
+        self.workers.append(worker)
+        return worker
+
+    def _retire(self, worker: Worker, terminate: bool = False) -> None:
+        if terminate and worker.process.is_alive():
+            worker.process.terminate()
+
+        worker.process.join(timeout=5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+
+        worker.conn.close()
+        self.workers.remove(worker)
+
+    def run(self, jobs: list[tuple[str, tuple, float]]) -> typing.Iterator[tuple[typing.Any, JobRecord]]:
+        """
+        execute jobs given as (name, args, timeout) and yield (result, record) in completion order,
+        result is None when the job failed, timed out or its worker died
+        """
+        with self.lock:
+            if self.closed:
+                raise RuntimeError("worker pool has been shut down")
+
+            pending = deque(jobs or [])
+            try:
+                while pending or any(w.job is not None for w in self.workers):
+                    # idle workers may have died since their last job, they would hold slots of the pool forever
+                    for worker in [w for w in self.workers if w.job is None and not w.process.is_alive()]:
+                        self._retire(worker)
+
+                    # hand out pending jobs to idle workers, spawn new ones up to the pool size
+                    while pending:
+                        idles = [w for w in self.workers if w.job is None]
+                        if not idles and len(self.workers) >= self.size:
+                            break
+
+                        try:
+                            worker = idles[0] if idles else self._spawn()
+                        except Exception as e:
+                            if any(w.job is not None for w in self.workers):
+                                # retry once running jobs free their slots
+                                break
+
+                            # nothing can run the remaining jobs
+                            while pending:
+                                yield None, JobRecord(name=pending.popleft()[0], error=f"cannot start worker: {e}")
+                            break
+
+                        name, args, timeout = pending.popleft()
+                        timeout = timeout if timeout and timeout > 0 else self.timeout
+
+                        try:
+                            worker.conn.send((name, args))
+                        except Exception as e:
+                            self._retire(worker, terminate=True)
+                            yield None, JobRecord(name=name, error=f"cannot dispatch job: {e}")
+                            continue
+
+                        worker.job, worker.start, worker.deadline = name, time.time(), time.time() + timeout
+
+                    busy = [w for w in self.workers if w.job is not None]
+                    if not busy:
+                        continue
+
+                    remain = max(0, min(w.deadline for w in busy) - time.time())
+                    waitables = [w.conn for w in busy] + [w.process.sentinel for w in busy]
+                    ready = set(wait(waitables, timeout=remain))
+
+                    now = time.time()
+                    for worker in busy:
+                        record = JobRecord(name=worker.job, cost=round(now - worker.start, 2))
+
+                        if worker.conn in ready or worker.conn.poll():
+                            try:
+                                _, result, error = worker.conn.recv()
+                            except (EOFError, OSError) as e:
+                                result, error = None, f"worker exited unexpectedly: {e}"
+                                self._retire(worker, terminate=True)
+                            else:
+                                worker.job = None
+
+                            record.error = error
+                            if isinstance(result, (list, dict)):
+                                record.count = len(result)
+
+                            yield result, record
+                        elif worker.process.sentinel in ready:
+                            self._retire(worker)
+                            record.error = f"worker exited unexpectedly, exitcode: {worker.process.exitcode}"
+                            yield None, record
+                        elif now >= worker.deadline:
+                            record.error = f"timeout after {record.cost:.1f}s, cancelled"
+                            self._retire(worker, terminate=True)
+                            yield None, record
+            finally:
+                # the caller stopped consuming results, cancel jobs still running
+                for worker in [w for w in self.workers if w.job is not None]:
+                    logger.warning(f"[WorkerPool] cancel unfinished job: {worker.job}")
+                    self._retire(worker, terminate=True)
+
+    def shutdown(self) -> None:
+        with self.lock:
+            if self.closed:
+                return
+
+            self.closed = True
+            for worker in list(self.workers):
+                try:
+                    worker.conn.send(None)
+                except Exception:
+                    pass
+
+            for worker in list(self.workers):
+                try:
+                    self._retire(worker)
+                except Exception:
+                    logger.error(f"[WorkerPool] cannot stop worker process: {worker.process.pid}")
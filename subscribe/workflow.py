@@ -6,9 +6,11 @@
 import json
 import os
 import re
+import typing
 from dataclasses import dataclass
 
 import renewal
+import selector
 import utils
 from airport import AirPort
 from logger import logger
@@ -163,6 +165,52 @@ def liveness_fillter(proxies: list) -> tuple[list, list]:
     return checks, nochecks
 
 
+def check_by_endpoint(
+    proxies: list[dict],
+    run: typing.Callable[[list[dict]], list[bool]],
+    reachable: typing.Callable[[list[dict]], list[bool]] = None,
+) -> list[bool]:
+    """
+    probe one representative per endpoint first with run, then check the remaining siblings of every endpoint
+    together in a single run. A failed representative only fails its siblings when reachable reports the
+    endpoint itself down, otherwise the failure may be per-credential and all siblings are still checked.
+    Returns a mask aligned to proxies
+    """
+    if not proxies:
+        return []
+
+    queues = {}
+    for i, proxy in enumerate(proxies):
+        queues.setdefault(selector.endpoint(proxy), []).append(i)
+
+    total, masks, rest, skipped = len(queues), [False] * len(proxies), [], 0
+    representatives = {k: v.pop(0) for k, v in queues.items()}
+    for i, alive in zip(representatives.values(), run([proxies[x] for x in representatives.values()]) or []):
+        masks[i] = bool(alive)
+
+    # endpoints whose representative failed and still have untested siblings
+    failed = [k for k, i in representatives.items() if not masks[i] and queues[k]]
+    down = set()
+    if failed and reachable:
+        flags = reachable([proxies[representatives[k]] for k in failed])
+        down = set([k for k, flag in zip(failed, flags) if not flag])
+
+    for k, siblings in queues.items():
+        if k in down:
+            skipped += len(siblings)
+        else:
+            rest.extend(siblings)
+
+    if rest:
+        for i, alive in zip(rest, run([proxies[x] for x in rest]) or []):
+            masks[i] = bool(alive)
+
+    logger.info(
+        f"[CheckInfo] endpoints: {total}, nodes: {len(proxies)}, siblings checked: {len(rest)}, skipped: {skipped}"
+    )
+    return masks
+
+
 def cleanup(filepath: str = "", filenames: list = []) -> None:
     if not filepath or not filenames:
         return
@@ -276,6 +324,9 @@ def refresh(config: dict, push: PushTo, alives: dict, filepath: str = "", skip_r
         logger.error("[UpdateError] cannot update remote config because content is empty")
         return
 
+    # remark and update files usually live in the same gist, they are committed together at the end
+    items = []
+
     # mark invalid crawled subscription
     invalidsubs = None if (skip_remark or not alives) else [k for k, v in alives.items() if not v]
     if invalidsubs:
@@ -300,19 +351,30 @@ def refresh(config: dict, push: PushTo, alives: dict, filepath: str = "", skip_r
 
                 if count > 0:
                     content = json.dumps(data)
-                    push.push_to(content=content, push_conf=pushconf, group="crawled-remark")
+                    items.append((content, pushconf, "crawled-remark"))
                     logger.info(f"[UpdateInfo] found {count} invalid crawled subscriptions")
             except:
                 logger.error(f"[UpdateError] remark invalid crawled subscriptions failed")
 
+    update_conf = config.get("update", {})
+    content = generate_update(config=config, push=push, alives=alives, filepath=filepath)
+    if content:
+        items.append((content, update_conf, "update"))
+
+    if items:
+        push.push_batch(items=items)
+
+
+def generate_update(config: dict, push: PushTo, alives: dict, filepath: str = "") -> str:
+    """build the refreshed remote config, empty when the update is disabled or has nothing to keep"""
     update_conf = config.get("update", {})
     if not update_conf.get("enable", False):
         logger.debug("[UpdateError] skip update remote config because enable=[False]")
-        return
+        return ""
 
     if not push.validate(push_conf=update_conf):
         logger.error(f"[UpdateError] update config is invalidate")
-        return
+        return ""
 
     domains = merge_config(configs=config.get("domains", []))
     if alives:
@@ -339,7 +401,7 @@ def refresh(config: dict, push: PushTo, alives: dict, filepath: str = "", skip_r
 
     if not domains:
         logger.error("[UpdateError] skip update remote config because domians is empty")
-        return
+        return ""
 
     content = json.dumps(config)
     if filepath:
@@ -349,7 +411,7 @@ def refresh(config: dict, push: PushTo, alives: dict, filepath: str = "", skip_r
             f.write(content)
             f.flush()
 
-    push.push_to(content=content, push_conf=update_conf, group="update")
+    return content
 
 
 def standard_sub(url: str) -> bool:
@@ -1,89 +1,211 @@
 #!/usr/bin/env python3
 
-import requests
+import argparse
+import asyncio
 import json
+import logging
 import sys
+import time
+import urllib.parse
+
+import aiohttp
 import yaml
-import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 logging.basicConfig(filename="data/test_clash_api.log", level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
 CLASH_CONTROLLER_URL = "http://127.0.0.1:9090"
 
-def get_proxies():
-    for attempt in range(3):
+# 控制器自身不可达等瞬时错误才重试，节点超时 / 不通属于确定结果
+RETRYABLE_ERRORS = {"client_timeout", "connection_error", "controller_error"}
+
+# 基于 UDP 的协议无法通过 TCP 连接探测端点
+UDP_TYPES = {"hysteria", "hysteria2", "tuic", "wireguard", "mieru"}
+
+def parse_timeouts(text):
+    """解析按协议覆盖的超时配置，格式: hysteria2=8000,vmess=5000"""
+    timeouts = {}
+    for item in (text or "").split(","):
+        if "=" not in item:
+            continue
+        key, value = item.split("=", 1)
+        try:
+            timeouts[key.strip().lower()] = max(int(value), 100)
+        except ValueError:
+            logging.warning(f"忽略无效的超时配置: {item}")
+    return timeouts
+
+def proxy_timeout(proxy, default, overrides):
+    """单个节点的超时时间(ms)，优先使用节点自带的 test-timeout，其次按协议覆盖"""
+    value = proxy.get("test-timeout")
+    if isinstance(value, int) and value > 0:
+        return value
+    return overrides.get(str(proxy.get("type", "")).lower(), default)
+
+async def get_proxies(session, retry=3):
+    for attempt in range(retry):
         try:
-            response = requests.get(f"{CLASH_CONTROLLER_URL}/proxies", timeout=10)
-            response.raise_for_status()
-            return response.json().get("proxies", {})
+            async with session.get(f"{CLASH_CONTROLLER_URL}/proxies", timeout=aiohttp.ClientTimeout(total=10)) as response:
+                response.raise_for_status()
+                return (await response.json()).get("proxies", {})
         except Exception as e:
-            logging.error(f"获取 Clash 代理失败 (尝试 {attempt + 1}/3): {e}")
-            if attempt < 2:
-                time.sleep(5)
+            logging.error(f"获取 Clash 代理失败 (尝试 {attempt + 1}/{retry}): {e}")
+            if attempt < retry - 1:
+                await asyncio.sleep(2 ** attempt)
     logging.error("所有尝试获取 Clash 代理均失败")
     return {}
 
-def test_proxy(name, is_tls_protocol=False):
+async def test_proxy(session, semaphore, name, timeout, is_tls_protocol=False, attempts=2):
     test_url = "https://www.google.com/generate_204" if is_tls_protocol else "http://www.google.com/generate_204"
-    for attempt in range(2):
-        try:
-            response = requests.get(
-                f"{CLASH_CONTROLLER_URL}/proxies/{name}/delay?url={test_url}&timeout=15000",
-                timeout=18
-            )
-            response.raise_for_status()
-            delay = response.json().get("delay", "timeout")
-            logging.info(f"测试 {name}: {delay}ms")
-            return delay
-        except Exception as e:
-            logging.warning(f"测试 {name} 失败 (尝试 {attempt + 1}/2): {e}")
-            if attempt < 1:
-                time.sleep(2)
-    logging.error(f"测试 {name} 失败")
-    return "error"
-
-def parallel_test_proxies(proxies, proxies_config, max_workers=5):
-    results = []
-    with ThreadPoolExecutor(max_workers=max_workers) as executor:
-        future_to_proxy = {
-            executor.submit(test_proxy, name, proxies_config.get(name, {}).get("type") in ["trojan", "vless"]): name
-            for name in proxies
-        }
-        for future in as_completed(future_to_proxy):
-            name = future_to_proxy[future]
+    url = f"{CLASH_CONTROLLER_URL}/proxies/{urllib.parse.quote(name, safe='')}/delay"
+    params = {"url": test_url, "timeout": str(timeout)}
+
+    # 客户端超时需略大于控制器侧超时，确保拿到控制器的判定
+    client_timeout = aiohttp.ClientTimeout(total=timeout / 1000 + 3)
+    row = {"name": name, "delay": None, "error": None, "attempts": 0}
+    async with semaphore:
+        for attempt in range(1, attempts + 1):
+            row["attempts"] = attempt
+            starttime = time.time()
             try:
-                delay = future.result()
-                results.append((name, delay))
+                async with session.get(url, params=params, timeout=client_timeout) as response:
+                    try:
+                        data = await response.json(content_type=None)
+                    except Exception:
+                        data = {}
+                    if response.status == 200 and isinstance(data.get("delay"), int) and data["delay"] > 0:
+                        row["delay"], row["error"] = data["delay"], None
+                    elif response.status == 504:
+                        row["error"] = "timeout"
+                    elif response.status == 503:
+                        row["error"] = "unreachable"
+                    elif response.status == 404:
+                        row["error"] = "not_found"
+                    elif response.status >= 500:
+                        row["error"] = "controller_error"
+                    else:
+                        row["error"] = f"http_{response.status}"
+            except asyncio.TimeoutError:
+                row["error"] = "client_timeout"
+            except aiohttp.ClientError:
+                row["error"] = "connection_error"
             except Exception as e:
-                logging.error(f"并行测试 {name} 异常: {e}")
-                results.append((name, "error"))
-    return results
+                logging.error(f"测试 {name} 异常: {e}")
+                row["error"] = "exception"
+
+            row["cost"] = round(time.time() - starttime, 3)
+            if row["error"] not in RETRYABLE_ERRORS or attempt >= attempts:
+                break
+            logging.warning(f"测试 {name} 失败 (尝试 {attempt}/{attempts}): {row['error']}")
+            await asyncio.sleep(0.5 * attempt)
+
+    if row["delay"] is not None:
+        logging.info(f"测试 {name}: {row['delay']}ms")
+    else:
+        logging.info(f"测试 {name} 失败: {row['error']}")
+    return row
+
+def endpoint_key(proxy):
+    """同一 server:port 的节点共享端点，仅凭据或传输路径不同"""
+    return f"{proxy.get('type', '')}://{str(proxy.get('server', '')).strip().lower()}:{proxy.get('port', '')}"
+
+async def endpoint_reachable(proxy, timeout):
+    """直接 TCP 连接节点端点，区分端点不可达与单个节点的凭据 / 协议错误；UDP 协议无法探测，视为可达"""
+    if str(proxy.get("type", "")).lower() in UDP_TYPES:
+        return True
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(str(proxy.get("server", "")), int(proxy.get("port", 0))), timeout=timeout)
+    except Exception:
+        return False
+    writer.close()
+    return True
+
+async def run(args):
+    with open(args.config, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f) or {}
+    proxies_config = {proxy["name"]: proxy for proxy in config.get("proxies", []) or [] if isinstance(proxy, dict)}
+    overrides = parse_timeouts(args.timeouts)
+
+    # 单个 keep-alive 连接池复用到控制器的连接，连接数与并发一致
+    connector = aiohttp.TCPConnector(limit=args.concurrency, limit_per_host=args.concurrency, keepalive_timeout=30)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        proxies = await get_proxies(session)
+        testable_proxies = [name for name in proxies if name not in ["auto-test", "GLOBAL"] and name in proxies_config]
+        if not testable_proxies:
+            sys.stdout.write("  无可测试节点。")
+            open(args.output, "w", encoding="utf-8").close()
+            return 0, 0
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        def create(name):
+            return asyncio.create_task(
+                test_proxy(
+                    session,
+                    semaphore,
+                    name,
+                    proxy_timeout(proxies_config[name], args.timeout, overrides),
+                    proxies_config[name].get("type") in ["trojan", "vless"],
+                    args.attempts,
+                )
+            )
+
+        # 按端点分组：每个端点先测一个代表节点，代表通过后并发测其余兄弟节点；
+        # 代表失败时仅当端点本身 TCP 不可达才判定兄弟节点失败，否则可能只是该节点凭据问题，其余兄弟节点同样一次并发测完
+        siblings = {}
+        for name in testable_proxies:
+            siblings.setdefault(endpoint_key(proxies_config[name]), []).append(name)
+
+        passed_count, tested_count, followers, skipped = 0, 0, 0, 0
+        with open(args.output, "w", encoding="utf-8") as f_out:
+
+            def write(row):
+                nonlocal passed_count, tested_count
+                f_out.write(json.dumps(row, ensure_ascii=False) + "\n")
+                f_out.flush()
+                tested_count += 1
+                if row["delay"] is not None:
+                    passed_count += 1
+
+            async def check_group(names):
+                nonlocal followers, skipped
+                row = await create(names[0])
+                write(row)
+
+                remain = names[1:]
+                if not remain:
+                    return
+                if row["delay"] is None and not await endpoint_reachable(proxies_config[names[0]], args.probe_timeout):
+                    for x in remain:
+                        write({"name": x, "delay": None, "error": "endpoint_unreachable", "attempts": 0})
+                    skipped += len(remain)
+                    return
+
+                followers += len(remain)
+                for future in asyncio.as_completed([create(x) for x in remain]):
+                    write(await future)
+
+            # 结果按完成顺序逐行写出 (JSON Lines)，中途中断也能保留已完成的结果
+            await asyncio.gather(*[check_group(names) for names in siblings.values()])
+
+        logging.info(f"端点数 {len(siblings)}，兄弟节点复测 {followers}，端点不可达跳过 {skipped}")
+        return tested_count, passed_count
 
 if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        sys.stderr.write("用法: python test_clash_api.py <output_results_file>\n")
-        sys.exit(1)
-    results_file = sys.argv[1]
-    proxies = get_proxies()
-    testable_proxies = [name for name in proxies if name not in ["auto-test", "GLOBAL"]]
-    if not testable_proxies:
-        sys.stdout.write("  无可测试节点。")
-        sys.exit(0)
-    # 从 clash_config.yaml 获取节点类型
-    with open("data/clash_config_batch.yaml", "r", encoding="utf-8") as f:
-        config = yaml.safe_load(f)
-    proxies_config = {proxy["name"]: proxy for proxy in config.get("proxies", [])}
-    tested_count = 0
-    passed_count = 0
-    failed_count = 0
-    with open(results_file, "w", encoding="utf-8") as f_out:
-        for name, delay in parallel_test_proxies(testable_proxies, proxies_config):
-            result_line = f"{name}: {delay}ms"
-            f_out.write(result_line + "\n")
-            tested_count += 1
-            if delay != "timeout" and delay != "error":
-                passed_count += 1
-            else:
-                failed_count += 1
-    sys.stdout.write(f"  测试完成: 总计 {tested_count}，通过 {passed_count}，失败 {failed_count}。")
-    logging.info(f"测试总结: 总计 {tested_count}，通过 {passed_count}，失败 {failed_count}")
+    parser = argparse.ArgumentParser(description="通过 Clash 控制器并发测试节点延迟，结果以 JSON Lines 输出")
+    parser.add_argument("output", help="结果文件，每行一个 JSON: name, delay, error, attempts")
+    parser.add_argument("-c", "--config", default="data/clash_config_batch.yaml", help="当前加载的 Clash 配置文件")
+    parser.add_argument("-n", "--concurrency", type=int, default=200, help="最大并发测试数")
+    parser.add_argument("-t", "--timeout", type=int, default=15000, help="默认单节点超时时间 (ms)")
+    parser.add_argument("-T", "--timeouts", default="", help="按协议覆盖超时，如 hysteria2=8000,vmess=5000")
+    parser.add_argument("-p", "--probe-timeout", type=float, default=3, help="代表节点失败后 TCP 探测端点的超时时间 (s)")
+    parser.add_argument("-a", "--attempts", type=int, default=2, help="控制器瞬时错误时的最大尝试次数")
+    args = parser.parse_args()
+    args.concurrency = max(args.concurrency, 1)
+    args.attempts = max(args.attempts, 1)
+
+    starttime = time.time()
+    tested_count, passed_count = asyncio.run(run(args))
+    if tested_count:
+        failed_count = tested_count - passed_count
+        cost = time.time() - starttime
+        sys.stdout.write(f"  测试完成: 总计 {tested_count}，通过 {passed_count}，失败 {failed_count}，耗时 {cost:.2f}s。")
+        logging.info(f"测试总结: 总计 {tested_count}，通过 {passed_count}，失败 {failed_count}，耗时 {cost:.2f}s")
@@ -5,7 +5,11 @@
 
 
 import argparse
+import asyncio
+import bisect
 import gzip
+import hashlib
+import ipaddress
 import json
 import math
 import os
@@ -14,6 +18,7 @@ import re
 import socket
 import ssl
 import string
+import time
 import typing
 import urllib
 import urllib.request
@@ -29,6 +34,12 @@ CTX = ssl.create_default_context()
 CTX.check_hostname = False
 CTX.verify_mode = ssl.CERT_NONE
 
+# filename of the dns cache persisted in workspace, same format as subscribe/resolver.py
+DNS_CACHE_FILE = "dns-cache.json"
+
+# seconds a resolved address stays valid in the dns cache
+DNS_CACHE_TTL = 1800
+
 
 def trim(text: str) -> str:
     if not text or type(text) != str:
@@ -136,6 +147,137 @@ def load_mmdb(
     return database.Reader(filepath)
 
 
+def build_index(filepath: str) -> dict:
+    """
+    walk the mmdb once into sorted (start, end, country) ranges per ip version, same layout as
+    subscribe/geoindex.py. The result is cached next to the database and keyed by its content hash
+    """
+    if not filepath or not os.path.isfile(filepath):
+        return {}
+
+    digest = hashlib.blake2b(digest_size=16)
+    with open(filepath, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+
+    cachefile = f"{filepath}.country.{digest.hexdigest()}.json"
+    if os.path.isfile(cachefile):
+        try:
+            with open(cachefile, "r", encoding="utf8") as f:
+                data = json.load(f)
+            return {"labels": data["labels"], "ranges": {int(k): v for k, v in data["ranges"].items()}}
+        except Exception:
+            print(f"ignore broken index cache: {cachefile}")
+
+    try:
+        import maxminddb
+
+        labels, positions, ranges = [], {}, {4: [[], [], []], 6: [[], [], []]}
+        with maxminddb.open_database(filepath) as reader:
+            for network, record in reader:
+                country = (((record or {}).get("country") or {}).get("names") or {}).get("zh-CN", "")
+                if not country:
+                    continue
+
+                if country not in positions:
+                    positions[country] = len(labels)
+                    labels.append(country)
+
+                code = positions[country]
+                starts, ends, codes = ranges[network.version]
+                start, end = int(network.network_address), int(network.broadcast_address)
+                if codes and codes[-1] == code and ends[-1] + 1 == start:
+                    ends[-1] = end
+                else:
+                    starts.append(start)
+                    ends.append(end)
+                    codes.append(code)
+    except Exception as e:
+        print(f"cannot build range index for {filepath}, message: {str(e)}")
+        return {}
+
+    index = {"labels": labels, "ranges": ranges}
+    try:
+        with open(cachefile, "w+", encoding="utf8") as f:
+            json.dump(index, f, ensure_ascii=False)
+    except Exception:
+        print(f"cannot save index cache to {cachefile}")
+
+    return index
+
+
+def lookup(index: dict, ips: list[str]) -> dict[str, str]:
+    """country of every ip in one pass over the sorted ranges"""
+    results = {}
+    for ip in set(ips):
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            continue
+
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+
+        starts, ends, codes = index.get("ranges", {}).get(address.version, [[], [], []])
+        key = int(address)
+        i = bisect.bisect_right(starts, key) - 1
+        if i >= 0 and key <= ends[i]:
+            results[ip] = index["labels"][codes[i]]
+
+    return results
+
+
+def resolve(hosts: list[str], cachefile: str = "", ttl: float = DNS_CACHE_TTL, concurrency: int = 64) -> dict[str, str]:
+    """deduplicate hostnames and resolve them concurrently, answers are cached in cachefile across runs"""
+    records, now = {}, time.time()
+    if cachefile and os.path.isfile(cachefile):
+        try:
+            with open(cachefile, "r", encoding="utf8") as f:
+                records = {k: v for k, v in json.load(f).items() if isinstance(v, list) and v[1] > now}
+        except:
+            records = {}
+
+    results, pending = {}, set()
+    for host in set(trim(x) for x in hosts if trim(x)):
+        if host in records:
+            results[host] = records[host][0]
+        else:
+            pending.add(host)
+
+    async def query(semaphore: asyncio.Semaphore, host: str) -> str:
+        async with semaphore:
+            try:
+                loop = asyncio.get_running_loop()
+                infos = await asyncio.wait_for(
+                    loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM), timeout=5
+                )
+                return infos[0][4][0] if infos else ""
+            except:
+                return ""
+
+    async def run(hosts: list[str]) -> list[str]:
+        semaphore = asyncio.Semaphore(concurrency)
+        return await asyncio.gather(*[query(semaphore, x) for x in hosts])
+
+    if pending:
+        pending = list(pending)
+        for host, address in zip(pending, asyncio.run(run(pending))):
+            results[host] = address
+            if address:
+                records[host] = [address, now + ttl]
+
+    print(f"resolved {len(results)} hostnames, cache hits: {len(results) - len(pending)}, lookups: {len(pending)}")
+
+    if cachefile:
+        try:
+            with open(cachefile, "w+", encoding="utf8") as f:
+                json.dump(records, f)
+        except:
+            print(f"cannot save dns cache to {cachefile}")
+
+    return results
+
+
 def read_response(response: HTTPResponse, expected: int = 200, deserialize: bool = False, key: str = "") -> typing.Any:
     if not response or not isinstance(response, HTTPResponse):
         return None
@@ -185,9 +327,18 @@ def main(args: argparse.Namespace) -> None:
         except:
             nodes = []
 
+        addresses, countries = {}, None
         if nodes and args.location:
             workspace = os.path.abspath(trim(args.workspace) or PATH)
             reader = load_mmdb(directory=workspace, update=args.update)
+            if reader:
+                servers = [x.get("server", "") for x in nodes if x and isinstance(x, dict)]
+                addresses = resolve(hosts=servers, cachefile=os.path.join(workspace, DNS_CACHE_FILE))
+
+                # batch lookup through the range index, fall back to per-ip queries when it cannot be built
+                index = build_index(filepath=os.path.join(workspace, "Country.mmdb"))
+                if index:
+                    countries = lookup(index=index, ips=[x for x in addresses.values() if x])
         else:
             reader = None
 
@@ -209,13 +360,18 @@ def main(args: argparse.Namespace) -> None:
                         continue
 
                     try:
-                        ip = socket.gethostbyname(address)
+                        ip = addresses.get(address, "")
+                        if not ip:
+                            raise ValueError(f"cannot resolve {address}")
 
                         # fake ip
                         if not ip.startswith("198.18.0."):
                             name = item.get("name", "")
-                            response = reader.country(ip)
-                            country = response.country.names.get("zh-CN", "")
+                            if countries is not None:
+                                country = countries.get(ip, "")
+                            else:
+                                response = reader.country(ip)
+                                country = response.country.names.get("zh-CN", "")
 
                             if country == "中国":
                                 # TODO: may be a transit node, need to further confirm landing ip address
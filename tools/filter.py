@@ -8,6 +8,7 @@ import gzip
 import json
 import multiprocessing
 import os
+import socket
 import ssl
 import sys
 import time
@@ -15,7 +16,8 @@ import typing
 import urllib
 import urllib.parse
 import urllib.request
-from dataclasses import dataclass
+from concurrent import futures
+from dataclasses import dataclass, field
 
 import psutil
 import yaml
@@ -34,6 +36,9 @@ DEFAULT_HTTP_HEADERS = {
 
 PATH = os.path.abspath(os.path.dirname(__file__))
 
+# url the controller measures pruned nodes against when they are re-probed
+TEST_URL = "https://www.gstatic.com/generate_204"
+
 
 @dataclass
 class APIConfig(object):
@@ -50,6 +55,43 @@ class APIConfig(object):
     providers: list[tuple[str, str]]
 
 
+@dataclass
+class NodeScore(object):
+    # exponentially weighted delay of successful samples
+    delay: float = 0
+
+    # exponentially weighted failure ratio, 0 means always alive and 1 always dead
+    failure: float = 0
+
+    # time of the latest history entry already folded in
+    last: str = ""
+
+    # times pruned since the last measured success, a pruned node is re-probed half as often per strike
+    strikes: int = 0
+
+
+@dataclass
+class Monitor(object):
+    """long-running state of one provider, scores survive between sampling rounds"""
+
+    prefix: str
+    secret: str
+    provider: str
+    filepath: str
+
+    # all nodes of the provider file when the daemon started, pruned nodes are taken from it
+    nodes: list[dict] = field(default_factory=list)
+
+    # node name -> score
+    scores: dict[str, NodeScore] = field(default_factory=dict)
+
+    # names currently removed from the provider file
+    pruned: set[str] = field(default_factory=set)
+
+    # sampling rounds done so far
+    rounds: int = 0
+
+
 def parse(base: str, filename: str, provider: str = "", all: bool = False) -> APIConfig:
     filepath = os.path.abspath(os.path.join(base, filename))
     if not os.path.exists(filepath) or not os.path.isfile(filepath):
@@ -288,28 +330,206 @@ def process(
     if len(names) == 0:
         return False
 
-    with open(filepath, "r", encoding="utf8") as f:
-        try:
-            nodes = yaml.load(f, Loader=yaml.SafeLoader).get("proxies", [])
-        except yaml.constructor.ConstructorError:
-            yaml.add_multi_constructor("str", lambda loader, suffix, node: str(node.value), Loader=yaml.SafeLoader)
-            nodes = yaml.load(f, Loader=yaml.FullLoader).get("proxies", [])
-
+    nodes = load_nodes(filepath)
     proxies = [x for x in nodes if x.get("name", "") not in names]
     if not proxies:
         return False
 
     print(f"completed filtering, total: {len(nodes)}, filtered: {len(names)}, remain: {len(proxies)}")
+    save_nodes(filepath, proxies, backup)
 
+    return True
+
+
+def load_nodes(filepath: str) -> list[dict]:
+    with open(filepath, "r", encoding="utf8") as f:
+        try:
+            return yaml.load(f, Loader=yaml.SafeLoader).get("proxies", [])
+        except yaml.constructor.ConstructorError:
+            yaml.add_multi_constructor("str", lambda loader, suffix, node: str(node.value), Loader=yaml.SafeLoader)
+            return yaml.load(f, Loader=yaml.FullLoader).get("proxies", [])
+
+
+def save_nodes(filepath: str, proxies: list[dict], backup: bool = False) -> None:
     data = {"proxies": proxies}
     if backup:
         copy(filepath)
     with open(filepath, "w+", encoding="utf8") as f:
         yaml.dump(data, f, allow_unicode=True)
 
+
+def sample(monitor: Monitor, alpha: float) -> int:
+    """trigger a health check of the provider and fold new history entries into the scores"""
+    headers = get_headers(monitor.secret)
+    healthcheck(monitor.prefix, monitor.provider, headers, 3)
+
+    count = 0
+    for p in fetch_proxies(monitor.prefix, monitor.provider, headers, 3):
+        name, history = p.get("name", ""), p.get("history", [])
+        if not name or not history:
+            continue
+
+        latest = history[-1]
+        score = monitor.scores.get(name, None)
+        if score is not None and latest.get("time", "") == score.last:
+            continue
+
+        score = fold(monitor, name, latest.get("delay", 0), alpha)
+        score.last = latest.get("time", "")
+        count += 1
+
+    return count
+
+
+def fold(monitor: Monitor, name: str, delay: int, alpha: float, measured: bool = True) -> NodeScore:
+    """fold one sample into the score of name, delay <= 0 means failed, measured is false when it carries no delay"""
+    failed = 1.0 if delay <= 0 else 0.0
+    score = monitor.scores.get(name, None)
+    if score is None:
+        score = monitor.scores[name] = NodeScore(delay=max(delay, 0) if measured else 0, failure=failed)
+    else:
+        score.failure = alpha * failed + (1 - alpha) * score.failure
+        if measured and delay > 0:
+            score.delay = alpha * delay + (1 - alpha) * score.delay if score.delay > 0 else delay
+
+    if measured and delay > 0:
+        score.strikes = 0
+
+    return score
+
+
+def delay_test(prefix: str, name: str, headers: dict, timeout: int = 5000) -> int:
+    """
+    delay of a node measured by the controller, 0 when the test failed and -1 when the controller does not know
+    the node, e.g. because it has been removed from the provider file
+    """
+    query = urllib.parse.urlencode({"url": TEST_URL, "timeout": timeout})
+    url = f"{prefix}/proxies/{urllib.parse.quote(name, safe='')}/delay?{query}"
+    try:
+        request = urllib.request.Request(url=url, headers=headers)
+        response = urllib.request.urlopen(request, timeout=timeout / 1000 + 5, context=CTX)
+        return max(0, int(json.loads(response.read()).get("delay", 0)))
+    except urllib.error.HTTPError as e:
+        return -1 if e.code == 404 else 0
+    except:
+        return 0
+
+
+def connectable(proxy: dict, timeout: float = 5) -> bool:
+    try:
+        sock = socket.create_connection((str(proxy.get("server", "")), int(proxy.get("port", 0))), timeout=timeout)
+        sock.close()
+        return True
+    except:
+        return False
+
+
+def reprobe(monitor: Monitor, alpha: float, rounds: int) -> int:
+    """
+    pruned nodes are out of the provider and never show up in health checks again, test them on their own and
+    fold the outcome into their scores so they only come back after passing. The controller delay test is used
+    while the core still knows the node, otherwise a tcp connect to its endpoint only counts as liveness. A node
+    is re-probed every rounds sampling rounds, doubled each time it had to be pruned again
+    """
+    headers = get_headers(monitor.secret)
+    nodes = {x.get("name", ""): x for x in monitor.nodes}
+
+    def probe(name: str) -> tuple[int, bool]:
+        d = delay_test(monitor.prefix, name, headers)
+        if d >= 0:
+            return d, True
+        if name in nodes:
+            return (1 if connectable(nodes[name]) else 0), False
+
+        return -1, False
+
+    names = []
+    for name in monitor.pruned:
+        score = monitor.scores.get(name, None)
+        strikes = min(score.strikes if score else 0, 6)
+        if monitor.rounds % (rounds * (1 << strikes)) == 0:
+            names.append(name)
+
+    if not names:
+        return 0
+
+    with futures.ThreadPoolExecutor(max_workers=min(32, max(1, len(names)))) as executor:
+        outcomes = list(executor.map(probe, names))
+
+    count = 0
+    for name, (d, measured) in zip(names, outcomes):
+        if d >= 0:
+            fold(monitor, name, d, alpha, measured=measured)
+            count += 1
+
+    return count
+
+
+def prune(monitor: Monitor, delay: int, failure: float, threshold: float, backup: bool) -> bool:
+    """rewrite the provider file when the pruned set moved by at least threshold of all nodes"""
+    pruned = set()
+    for name, score in monitor.scores.items():
+        # nodes without a successful sample have a failure score of 1 and are caught by the first condition
+        if score.failure > failure or score.delay > delay:
+            pruned.add(name)
+
+    changes = len(pruned ^ monitor.pruned)
+    if changes == 0 or changes < threshold * max(1, len(monitor.nodes)):
+        return False
+
+    proxies = [x for x in monitor.nodes if x.get("name", "") not in pruned]
+    if not proxies:
+        print(f"skip pruning because no node would remain, provider: {monitor.provider}")
+        return False
+
+    for name in pruned - monitor.pruned:
+        monitor.scores[name].strikes += 1
+
+    save_nodes(monitor.filepath, proxies, backup and not monitor.pruned)
+    print(
+        f"provider {monitor.provider} updated, total: {len(monitor.nodes)}, pruned: {len(pruned)}, changes: {changes}"
+    )
+
+    monitor.pruned = pruned
     return True
 
 
+def daemon(config: APIConfig, args: argparse.Namespace) -> None:
+    """sample provider health periodically and only rewrite providers and reload when the pruned set changes"""
+    monitors = [
+        Monitor(prefix=config.controller, secret=config.secret, provider=x[0], filepath=x[1], nodes=load_nodes(x[1]))
+        for x in config.providers
+    ]
+
+    delay, interval = max(1, args.delay), max(10, args.interval)
+    alpha, failure = min(1.0, max(0.01, args.alpha)), min(1.0, max(0.0, args.failure))
+    threshold, reprobe_rounds = min(1.0, max(0.0, args.threshold)), max(1, args.reprobe)
+
+    def step(monitor: Monitor) -> bool:
+        sample(monitor, alpha)
+
+        monitor.rounds += 1
+        if monitor.pruned:
+            reprobe(monitor, alpha, reprobe_rounds)
+
+        return prune(monitor, delay, failure, threshold, args.backup)
+
+    with futures.ThreadPoolExecutor(max_workers=len(monitors)) as executor:
+        try:
+            while True:
+                if running("clash.exe"):
+                    changes = list(executor.map(step, monitors))
+                    if any(changes):
+                        message = "success" if reload(config.controller, config.secret) else "failed"
+                        print(f"reload clash.exe with config {config.path} {message}")
+                else:
+                    print("skip sampling because clash.exe is not running")
+
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("daemon stopped")
+
+
 def main(args: argparse.Namespace) -> None:
     if not running("clash.exe"):
         print(f"cannot check and filter proxies due to clash.exe is not running")
@@ -321,6 +541,10 @@ def main(args: argparse.Namespace) -> None:
         print(f"skip filter because config is invalid or proxy provider not exists")
         sys.exit(-1)
 
+    if args.daemon:
+        daemon(config, args)
+        return
+
     delay, providers = max(1, args.delay), config.providers
     tasks = [
         [
@@ -374,6 +598,33 @@ if __name__ == "__main__":
         help="Clash configuration filename",
     )
 
+    parser.add_argument(
+        "-D",
+        "--daemon",
+        dest="daemon",
+        action="store_true",
+        default=False,
+        help="Keep running and prune providers incrementally",
+    )
+
+    parser.add_argument(
+        "-e",
+        "--alpha",
+        type=float,
+        default=0.3,
+        required=False,
+        help="EWMA smoothing factor of delay and failure scores in daemon mode",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--failure",
+        type=float,
+        default=0.5,
+        required=False,
+        help="Maximum acceptable EWMA failure score in daemon mode",
+    )
+
     parser.add_argument(
         "-d",
         "--delay",
@@ -393,6 +644,24 @@ if __name__ == "__main__":
         help="Health check iteration",
     )
 
+    parser.add_argument(
+        "-k",
+        "--reprobe",
+        type=int,
+        default=6,
+        required=False,
+        help="Sampling rounds between two re-probes of pruned nodes in daemon mode, doubled each time a node is pruned again",
+    )
+
+    parser.add_argument(
+        "-n",
+        "--interval",
+        type=int,
+        default=300,
+        required=False,
+        help="Seconds between two sampling rounds in daemon mode",
+    )
+
     parser.add_argument(
         "-p",
         "--provider",
@@ -402,6 +671,15 @@ if __name__ == "__main__":
         help="Proxy provider name to be check and filtered",
     )
 
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.05,
+        required=False,
+        help="Minimum fraction of nodes whose state changed before a provider is rewritten in daemon mode",
+    )
+
     parser.add_argument(
         "-w",
         "--workspace",
@@ -4,6 +4,7 @@
 # @Time    : 2023-12-14
 
 import argparse
+import csv
 import os
 import re
 import shutil
@@ -15,6 +16,11 @@ from geoip2 import database
 
 DATA_DIR = os.path.abspath(os.path.dirname(__file__))
 
+COLUMNS = ["IP", "国家", "州/区", "城市", "注册地", "ASN", "ORG"]
+
+# number of ips looked up and written per batch in streaming modes
+BATCH_SIZE = 10000
+
 
 def trim(text: str) -> str:
     if not text or type(text) != str:
@@ -167,6 +173,46 @@ def load_mmdb(directory: str, filename: str, update: bool = False) -> None:
     return database.Reader(filepath)
 
 
+def locate(ips: list[str], city_reader: database.Reader, asn_reader: database.Reader) -> dict[str, list]:
+    """query city and asn of a batch of ips and return them as columns, ips without city record are dropped"""
+    columns = {k: [] for k in COLUMNS}
+    for ip in ips:
+        try:
+            response = city_reader.city(ip)
+        except Exception:
+            continue
+
+        columns["IP"].append(ip)
+        columns["国家"].append(response.country.names.get("zh-CN", ""))
+        columns["州/区"].append(response.subdivisions.most_specific.names.get("zh-CN", ""))
+        columns["城市"].append(response.city.names.get("zh-CN", ""))
+        columns["注册地"].append(response.registered_country.names.get("zh-CN", ""))
+
+        try:
+            response = asn_reader.asn(ip)
+            asn, org = response.autonomous_system_number, response.autonomous_system_organization
+        except Exception:
+            asn, org = None, None
+
+        columns["ASN"].append(asn)
+        columns["ORG"].append(org)
+
+    return columns
+
+
+def output_format(filename: str, fmt: str = "") -> str:
+    fmt = trim(fmt).lower()
+    if not fmt:
+        fmt = os.path.splitext(filename)[1].removeprefix(".").lower()
+
+    if fmt in ["xls", "xlsx", "excel"]:
+        return "xlsx"
+    if fmt in ["csv", "parquet"]:
+        return fmt
+
+    raise ValueError(f"unsupported output format: {fmt}")
+
+
 def main(args: argparse.Namespace) -> None:
     base = trim(args.directory)
     if not base:
@@ -176,6 +222,8 @@ def main(args: argparse.Namespace) -> None:
     if not filename:
         raise ValueError("please specify a valid output filename")
 
+    fmt = output_format(filename, args.format)
+
     # get reverse ip data first
     ips = extract_reverse_ips(base, args.update)
     print(f"got {len(ips)} reverse ip for cloudflare")
@@ -183,47 +231,48 @@ def main(args: argparse.Namespace) -> None:
     if not ips:
         return
 
-    df = pd.DataFrame(columns=["IP", "国家", "州/区", "城市", "注册地", "ASN", "ORG"])
-    try:
-        # load city mmdb and query ip location
-        reader = load_mmdb(base, "GeoLite2-City.mmdb", args.update)
-        for ip in ips:
-            try:
-                response = reader.city(ip)
-            except Exception:
-                continue
-
-            country = response.country.names.get("zh-CN", "")
-            subdivision = response.subdivisions.most_specific.names.get("zh-CN", "")
-            city = response.city.names.get("zh-CN", "")
-            register = response.registered_country.names.get("zh-CN", "")
-
-            # append to dataframe
-            df.loc[len(df)] = [ip, country, subdivision, city, register, "", ""]
-    except Exception as e:
-        raise e
-    finally:
-        reader.close()
+    # load city and asn mmdb once, ips are looked up batch by batch
+    city_reader = load_mmdb(base, "GeoLite2-City.mmdb", args.update)
+    asn_reader = load_mmdb(base, "GeoLite2-ASN.mmdb", args.update)
+
+    filepath = os.path.join(base, filename)
+    batches = (ips[i : i + BATCH_SIZE] for i in range(0, len(ips), BATCH_SIZE))
 
     try:
-        # load ans mmdb and query ip organization
-        reader = load_mmdb(base, "GeoLite2-ASN.mmdb", args.update)
-        for index, row in df.iterrows():
-            try:
-                response = reader.asn(row["IP"])
-            except Exception:
-                continue
-
-            df.loc[index, "ASN"] = response.autonomous_system_number
-            df.loc[index, "ORG"] = response.autonomous_system_organization
-    except Exception as e:
-        raise e
+        if fmt == "csv":
+            # stream rows to disk, memory stays bounded by the batch size
+            with open(filepath, "w", newline="", encoding="utf-8-sig") as f:
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS)
+                for batch in batches:
+                    columns = locate(batch, city_reader, asn_reader)
+                    writer.writerows(zip(*columns.values()))
+        elif fmt == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            schema = pa.schema(
+                [(k, pa.int64() if k == "ASN" else pa.string()) for k in COLUMNS],
+            )
+            with pq.ParquetWriter(filepath, schema) as writer:
+                for batch in batches:
+                    columns = locate(batch, city_reader, asn_reader)
+                    writer.write_table(pa.table(columns, schema=schema))
+        else:
+            # excel workbook is written at once, build the dataframe from the collected columns in one go
+            columns = {k: [] for k in COLUMNS}
+            for batch in batches:
+                for k, v in locate(batch, city_reader, asn_reader).items():
+                    columns[k].extend(v)
+
+            df = pd.DataFrame(columns, columns=COLUMNS)
+            df["ASN"] = df["ASN"].astype("Int64")
+            df.to_excel(filepath, index=False)
     finally:
-        reader.close()
+        city_reader.close()
+        asn_reader.close()
 
-    # save to excel file
-    filepath = os.path.join(base, filename)
-    df.to_excel(filepath, index=False)
+    print(f"ip location has been saved to {filepath}")
 
 
 if __name__ == "__main__":
@@ -249,6 +298,17 @@ if __name__ == "__main__":
         help="ip with location filename",
     )
 
+    parser.add_argument(
+        "-t",
+        "--format",
+        type=str,
+        required=False,
+        default="",
+        choices=["", "xlsx", "csv", "parquet"],
+        metavar="",
+        help="output format, xlsx, csv or parquet, guessed from the filename by default",
+    )
+
     parser.add_argument(
         "-u",
         "--update",